@@ -16,8 +16,8 @@ if [[ -f "$INPUT_FILE" ]]; then
 fi
 
 cool --type "./$1.cl"
-python3 ./src/main.py "./$1.cl-type"
-gcc -no-pie -static ./$1.s -o out/my_executable
+python3 ./src/main.py "./$1.cl-type" -extern-runtime
+gcc -no-pie -static ./$1.s $(python3 ./src/main.py -print-runtime) -o out/my_executable
 
 if $HAS_INPUT; then
 cat "$INPUT_FILE" | ./out/my_executable> ./out/my_output.txt
@@ -2,32 +2,49 @@ from ast_nodes import *
 import sys
 
 class AnnotatedAstReader:
-    def __init__(self,filename):
+    # lazy_bodies: method bodies are skipped over and left as a Deferred_Body (where they start
+    # in the file), read_body parses them again when they are needed, so they dont all have to
+    # be in memory at once.
+    def __init__(self,filename,lazy_bodies=False):
         self.filename = filename
-        self.lines = []
+        self.lazy_bodies = lazy_bodies
 
         self.class_map = {}
         self.imp_map = {}
         self.parent_map = {}
+        # every string literal in the order they show up, so labels can be given out before codegen.
+        self.strings = {}
+        # function label -> (kind, class, method, loops it is in) of every dispatch and new in it,
+        # the call graph for the function layout (asm_layout.py). only while parsing, not read_body.
+        self.call_sites = {}
+        self.caller = None # (class, label) of the function being read
+        self.loops = 0
 
-        self.read_lines()
+        self.open_file()
 
     def parse(self):
         self.read_class_map()
         self.read_imp_map()
         self.read_parent_map()
+        if not self.lazy_bodies:
+            self.close()
 
         return self.class_map, self.imp_map, self.parent_map 
     
-    def read_lines(self):
+    def open_file(self):
         sys.setrecursionlimit(20000)
-        with open(self.filename) as file:
-            self.lines = [line.rstrip("\r\n") for line in file] 
+        # one line at a time instead of a list of every line, binary so tell/seek work.
+        self.file = open(self.filename, "rb")
+
+    def close(self):
+        self.file.close()
 
     def read(self): 
-        this_line = self.lines[0] 
-        self.lines = self.lines[1:]
-        return this_line 
+        return self.file.readline().rstrip(b"\r\n").decode()
+
+    def read_body(self, body):
+        self.file.seek(body.Offset)
+        return self.read_exp()
 
     def read_list(self, worker):
         k = int(self.read()) 
@@ -48,6 +65,14 @@ class AnnotatedAstReader:
         body = self.read_exp()
         return Case_element(var, type, body, None)
 
+    def call_site(self, kind, cls, method=None):
+        if self.caller is None:
+            return
+        caller_class, caller = self.caller
+        if cls == "SELF_TYPE":
+            cls = caller_class
+        self.call_sites.setdefault(caller, []).append((kind, cls, method, self.loops))
+
     def read_exp(self):
         eloc = self.read()
         ekind = self.read_ekind(0)
@@ -65,6 +90,7 @@ class AnnotatedAstReader:
             return Identifier(id, static_type)
         elif ekind == "string":
             val = self.read()
+            self.strings[val] = None
             return String(val, static_type)
         elif ekind == "plus": 
             left = self.read_exp()
@@ -105,6 +131,7 @@ class AnnotatedAstReader:
             return IsVoid(exp, static_type)
         elif ekind == "new": 
             type = self.read_id()
+            self.call_site("new", type.str)
             return New(type, static_type)
         elif ekind == "true": 
             return true(True, static_type)
@@ -114,8 +141,10 @@ class AnnotatedAstReader:
             body = self.read_list(self.read_exp)
             return Block(body, static_type)
         elif ekind == "while":
+            self.loops += 1
             predicate = self.read_exp()
             body = self.read_exp()
+            self.loops -= 1
             return While(predicate, body, static_type) 
         elif ekind == "if":
             predicate = self.read_exp()
@@ -125,16 +154,20 @@ class AnnotatedAstReader:
         elif ekind == "dynamic_dispatch":
             exp = self.read_exp()
             method = self.read_id()
+            self.call_site("dispatch", exp[1].StaticType, method.str)
             args = self.read_list(self.read_exp)
             return Dynamic_Dispatch(exp, method, args, static_type)
         elif ekind == "static_dispatch":
             exp = self.read_exp()
             type = self.read_id()
             method = self.read_id()
+            self.call_site("static", type.str, method.str)
             args = self.read_list(self.read_exp)
             return Static_Dispatch(exp, type, method, args, static_type)
         elif ekind == "self_dispatch":
             method = self.read_id()
+            # self is the class whose copy of the method this is
+            self.call_site("static", "SELF_TYPE", method.str)
             args = self.read_list(self.read_exp)
             return Self_Dispatch(method, args, static_type)
         elif ekind == "assign":
@@ -182,7 +215,10 @@ class AnnotatedAstReader:
         attr_name = self.read()
         type_name = self.read()
         if init == "initializer": 
+            # initializers run in the constructor
+            self.caller = (class_name, f"{class_name}..new")
             init_exp = self.read_exp()
+            self.caller = None
         else: 
             init_exp = None
         self.class_map[class_name].append(Attribute(attr_name, type_name, init_exp))
@@ -206,7 +242,12 @@ class AnnotatedAstReader:
         for i in range(int(num_formals)):
             self.imp_map[(class_name, method_name)].append(self.read())
         self.read()
+        offset = self.file.tell()
+        self.caller = (class_name, f"{class_name}.{method_name}")
         body = self.read_exp()
+        self.caller = None
+        if self.lazy_bodies and not isinstance(body[1], Internal):
+            body = (body[0], Deferred_Body(offset, body[1].StaticType))
         self.imp_map[(class_name, method_name)].append(body)
 
 
@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 from collections import namedtuple
 from annotated_ast_reader import AnnotatedAstReader
@@ -13,21 +14,83 @@ from asm_method_index import *
 from asm_string_to_label import *
 from asm_tags import *
 from asm_temporary_stack import *
+from asm_layout import Layout
+from pass_timer import PassTimer
 from pprint import pprint
 
+# the generator the emit_functions_parallel workers fork from.
+parallel_gen = None
+
+def parallel_worker_init():
+    # workers share the parent's .cl-type file handle (and its position), each opens its own.
+    parallel_gen.parser.open_file()
+
+def parallel_worker_shard(methods):
+    return parallel_gen.emit_methods_shard(methods)
+
 class CoolAsmGen:
-    def __init__(self, file, x86=False,opt=True):
+    def __init__(self, file, x86=False,opt=True,tco=True,regcall=True,compact=True,tagged=True,profile=False,timer=None,sink=None,include_comments=False,jobs=1,renderer=None,cache=None,layout=True,layout_profile=None):
         self.opt = opt
         self.x86=x86
-        parser = AnnotatedAstReader(file)
-        self.class_map, self.imp_map, self.parent_map = parser.parse()
+        # tail calls reuse the caller's argument slots, only done for x86.
+        self.tco = tco and x86
+        # receiver in acc and first arguments in registers, only done for x86.
+        # regcall=False keeps the old everything-on-the-stack convention around.
+        self.regcall = regcall and x86
+        # objects are just a vtable pointer + attributes, only done for x86.
+        self.compact = compact and x86
+        if self.compact:
+            self.vtable_index = compact_vtable_index
+            self.attributes_start_index = compact_attributes_start_index
+        else:
+            self.vtable_index = vtable_index
+            self.attributes_start_index = attributes_start_index
+        self.string_len_index = self.attributes_start_index + string_len_offset
+        # Int and Bool values are tagged words instead of objects, only done for x86.
+        self.tagged = tagged and x86
+        self.string_out_index = self.attributes_start_index + string_out_offset
+        # count calls per method, objects/bytes per class and allocation sites, only done for x86.
+        self.profile = profile and x86
+        self.profile_counters = {"calls": {}, "classes": {}, "sites": {}} # name -> counter label
+        # -time-passes, does nothing unless enabled.
+        self.timer = timer or PassTimer()
+        # sink gets each vtable, constructor and method (then the error and string constants)
+        # as soon as it is generated, filtered like get_asm, and it is dropped right after.
+        # method bodies are parsed only when they are generated too, so memory stays about
+        # the same however big the program is. without a sink everything is kept for get_asm.
+        self.sink = sink
+        self.include_comments = include_comments
+        # jobs > 1: methods are generated by that many processes (emit_functions_parallel),
+        # renderer.render(instructions) turns them into text there (x86) and
+        # renderer.write_rendered(text) writes it out here.
+        self.jobs = jobs
+        self.renderer = renderer
+        # -cache: methods are looked up in (and added to) a MethodCache, needs the renderer too.
+        self.cache = cache if renderer is not None else None
+        self.cache_deps = None # what the method being generated looked up, for its cache entry.
+        with self.timer.phase("parse"):
+            self.parser = AnnotatedAstReader(file, lazy_bodies=sink is not None)
+            self.class_map, self.imp_map, self.parent_map = self.parser.parse()
+        # order of the constructors and methods (x86), layout_profile: counts of a -profile run (asm_layout.Profile).
+        with self.timer.phase("layout"):
+            self.layout = Layout(self.class_map, self.imp_map, self.parent_map, self.parser.call_sites,
+                                 profile=layout_profile, enabled=layout and x86)
+        self.current_hot = False # function being generated is aligned, its loops too.
+        self.cold_section = False # in .text.unlikely
 
         self.asm_instructions = [] # cool assembly emitted here.
+        self.instructions_streamed = 0 # already handed to the sink.
 
         self.temporary_stack = TemporaryStack()
         self.symbol_stack = SymbolStack()
         self.method_index = MethodIndex()
         self.string_to_label = StringToLabel(self.class_map)
+        # labels for class names and string literals are given out up front, so they are
+        # the same whatever order (or process, jobs) the methods are generated in.
+        for cls in self.class_map:
+            self.string_to_label.insert(cls)
+        for string in self.parser.strings:
+            self.string_to_label.insert(string)
         self.class_to_tag = Tags()
         internal_classes = ["Bool","Int","String","IO","Main","Object"]
         for cls in self.class_map:
@@ -39,42 +102,62 @@ class CoolAsmGen:
         self.temporaries_needed = 0 # numbre of temporaries needed
 
         self.current_class = None
+        self.current_method = None
+        self.current_num_args = 0
+        self.current_leaf = False
+        self.current_saves_self = False
 
         self.branch_counter = 0 # unique labels
+        self.label_namespace = "" # current method/constructor, labels are numbered per method.
         # lines used to emit strings.
-        self.dispatch_lines = []
-        self.case_lines_and_exps=[]
-        self.traversed_case_lines=[]
-        self.div_zero_lines=[]
+        self.dispatch_lines = set()
+        self.case_lines_and_exps=set()
+        self.div_zero_lines=set()
 
         # Internal attributes
         # we dont specify initializer as we handle them ourselves.
         self.class_map["Int"].append(Attribute(Name="val",Type="Unboxed_Int", Initializer=None))
         self.class_map["Bool"].append(Attribute(Name="val",Type="Unboxed_Int", Initializer=None))
         self.class_map["String"].append(Attribute(Name="val",Type="Unboxed_String", Initializer=None))
+        if self.x86:
+            # byte length of val, so length/concat/substr dont have to scan for it.
+            self.class_map["String"].append(Attribute(Name="len",Type="Unboxed_Int", Initializer=None))
+            # decoded form of a string constant ready to be printed (0 for strings made at runtime)
+            self.class_map["String"].append(Attribute(Name="out",Type="Unboxed_Pointer", Initializer=None))
+
+        count = self.instruction_count
+        with self.timer.phase("emit_vtables", count=count):
+            self.emit_vtables()
+        with self.timer.phase("emit_functions", count=count):
+            self.emit_functions()
+
+        # sorted so the output does not depend on the order they were found in (jobs).
+        with self.timer.phase("emit_errors", count=count):
+            if self.x86:
+                self.emit_error_stubs()
+            else:
+                self.emit_error_strings()
+            self.stream_asm()
 
-        self.emit_vtables()
-        self.emit_constructors()
-        self.emit_methods()
-
-        for line in set(self.dispatch_lines):
-            emit_dispatch_on_void(self.asm_instructions,line)
-        for line,exp in set(self.case_lines_and_exps):
-            emit_case_on_void(self.asm_instructions,line)
-            emit_case_without_branch(self.asm_instructions,line,exp)
-        for line in set(self.div_zero_lines):
-            emit_divide_by_zero(self.asm_instructions,line)
-
-        emit_string_constants(self.asm_instructions,x86,self.string_to_label.get_dict_sorted())
+        with self.timer.phase("emit_string_constants", count=count):
+            emit_string_constants(self.asm_instructions,x86,self.string_to_label.get_dict_sorted())
+            self.stream_asm()
 
         if not self.x86:
             # do not need, we are directly emitting these from the reference compiler for x86
             emit_comparison_handlers(self.asm_instructions,x86)
             self.emit_start()
+            self.stream_asm()
+
+        self.parser.close()
 
 
     def emit_vtables(self) -> None:
         for cls in self.class_map:
+            if self.x86:
+                # type tag and size right before the vtable (the runtime always reads them from here)
+                self.append_asm(ASM_Constant_integer(self.class_to_tag.get(cls)))
+                self.append_asm(ASM_Constant_integer(len(self.class_map[cls]) + self.attributes_start_index))
             self.append_asm(ASM_Label(label = f"{cls}..vtable"))
 
             self.string_to_label.insert(cls)
@@ -101,154 +184,456 @@ class CoolAsmGen:
                         self.method_index.insert(class_name,method_name)
             
             self.method_index.reset_index()
+            self.stream_asm()
+
+    # resulting object will be in accumulator.
+    def emit_constructor(self, cls) -> None:
+        attrs = self.class_map[cls]
+        self.current_hot = self.layout.is_hot(f"{cls}..new")
+        self.current_class = cls 
+        self.label_namespace = f"{cls}..new.."
+        self.branch_counter = 0
+        self.symbol_stack.push_scope()
+        # fp[0] is the saved fp (x86) or ra (cool-asm), temporaries of the initializers go under it.
+        self.temporary_stack.push_scope(start=-1)
 
-    def emit_constructors(self) -> None:
-        self.comment("resulting object will be in accumulator.",not_tabbed=True)
-        for cls,attrs in self.class_map.items():
-            self.current_class = cls 
-            self.symbol_stack.push_scope()
-            self.temporary_stack.push_scope()
 
+        self.gen_function_align()
+        self.append_asm(ASM_Label(label=f"{cls}..new"))
+        if self.x86:
+            self.append_asm(ASM_Push("fp")) # we will set stack pointer to this later
+        self.append_asm(ASM_Mov("fp","sp"))
 
-            self.append_asm(ASM_Label(label=f"{cls}..new"))
-            if self.x86:
-                self.append_asm(ASM_Push("fp")) # we will set stack pointer to this later
-            self.append_asm(ASM_Mov("fp","sp"))
+        if not self.x86:
+            self.append_asm(ASM_Push("ra"))
+
+        # room for them, or the calls in one initializer push over the temporaries of another.
+        temporaries = max([self.compute_max_stack_depth(attr.Initializer[1]) for attr in attrs if attr.Initializer], default=0)
+        if temporaries:
+            self.append_asm(ASM_Li(temp_reg,ASM_Word(temporaries)))
+            self.append_asm(ASM_Sub(temp_reg,"sp"))
 
-            if not self.x86:
-                self.append_asm(ASM_Push("ra"))
-
-            # adding 1 for type tag.
-            # adding 1 for size.
-            # adding 1 for v table ptr.
-            # indexes are in asm_constants.py
-            size = len(attrs) + 3
-
-            self.append_asm(ASM_Li(reg = self_reg, imm = ASM_Value(size)))
-            self.append_asm(ASM_Alloc(dest = self_reg, src = self_reg))
-
-            match(cls):
-                case "Bool":
-                    tag=Bool_tag
-                case "Int":
-                    tag=Int_tag
-                case "String":
-                    tag=String_tag
-                case "IO":
-                    tag=IO_tag
-                case "Main":
-                    tag=Main_tag
-                case "Object":
-                    tag=Object_tag
-                case _:
-                    # non built in class
-                    tag = self.class_to_tag.get(cls)
+        # adding 1 for type tag.
+        # adding 1 for size.
+        # adding 1 for v table ptr.
+        # (compact header is just the v table ptr)
+        # indexes are in asm_constants.py
+        size = len(attrs) + self.attributes_start_index
+
+        self.gen_count("classes", cls)
+        self.gen_count("classes", cls, offset=profile_bytes_offset, amount=size * 8)
+
+        self.append_asm(ASM_Li(reg = self_reg, imm = ASM_Value(size)))
+        self.append_asm(ASM_Alloc(dest = self_reg, src = self_reg))
+
+        match(cls):
+            case "Bool":
+                tag=Bool_tag
+            case "Int":
+                tag=Int_tag
+            case "String":
+                tag=String_tag
+            case "IO":
+                tag=IO_tag
+            case "Main":
+                tag=Main_tag
+            case "Object":
+                tag=Object_tag
+            case _:
+                # non built in class
+                tag = self.class_to_tag.get(cls)
 
+        if not self.compact:
             self.comment(f"Store type tag ({tag} for {cls}) at index {type_tag_index}")
             self.append_asm(ASM_Li(temp_reg,ASM_Value(tag)))
             self.append_asm(ASM_St(self_reg, temp_reg, type_tag_index))
 
             self.comment(f"Store object size at index {object_size_index}")
-            self.append_asm(ASM_Li(temp_reg,ASM_Value(3 + len(attrs))))
+            self.append_asm(ASM_Li(temp_reg,ASM_Value(size)))
             self.append_asm(ASM_St(self_reg, temp_reg, object_size_index))
 
-            self.comment(f"Store vtable pointer at index {vtable_index}")
-            self.append_asm(ASM_La(temp_reg, f"{cls}..vtable"))
-            self.append_asm(ASM_St(self_reg, temp_reg, vtable_index))
+        self.comment(f"Store vtable pointer at index {self.vtable_index}")
+        self.append_asm(ASM_La(temp_reg, f"{cls}..vtable"))
+        self.append_asm(ASM_St(self_reg, temp_reg, self.vtable_index))
 
 
-            # Attributes
-            for actual_attr_index,attr in enumerate(attrs, start=attributes_start_index):
-                # print(f"({actual_attr_index}) {cls}: {attr}")
-                if attr.Type == "Unboxed_Int":
-                    self.comment(f"Store raw int {0} for attribute in {cls}.")
-                    self.append_asm(ASM_Li(acc_reg,ASM_Value(0)))
-                elif attr.Type == "Unboxed_String":
-                    self.comment(f"Store raw string for attribute in String.")
-                    self.append_asm(ASM_La(acc_reg,"the.empty.string"))
+        # Attributes
+        for actual_attr_index,attr in enumerate(attrs, start=self.attributes_start_index):
+            # print(f"({actual_attr_index}) {cls}: {attr}")
+            if attr.Type == "Unboxed_Int" or attr.Type == "Unboxed_Pointer":
+                self.comment(f"Store raw int {0} for attribute in {cls}.")
+                self.append_asm(ASM_Li(acc_reg,ASM_Value(0)))
+            elif attr.Type == "Unboxed_String":
+                self.comment(f"Store raw string for attribute in String.")
+                self.append_asm(ASM_La(acc_reg,"the.empty.string"))
+            else:
+                if attr.Type == "Int" or attr.Type == "String" or attr.Type == "Bool":
+                    self.cgen(New(Type=attr.Type, StaticType=attr.Type))
                 else:
-                    if attr.Type == "Int" or attr.Type == "String" or attr.Type == "Bool":
-                        self.cgen(New(Type=attr.Type, StaticType=attr.Type))
-                    else:
-                        # "void"
-                        self.append_asm(ASM_Li(acc_reg,ASM_Value(0)))
+                    # "void"
+                    self.append_asm(ASM_Li(acc_reg,ASM_Value(0)))
+
+            self.append_asm(ASM_St(dest = self_reg,src = acc_reg,offset = actual_attr_index))
+            self.symbol_stack.insert_symbol(attr.Name,Offset(self_reg,actual_attr_index))
+
+        # initialize attributes
+        for actual_attr_index,attr in enumerate(attrs, start=self.attributes_start_index):
+            if attr.Initializer:   
 
+                exp = attr.Initializer[1]
+                self.cgen(exp)
                 self.append_asm(ASM_St(dest = self_reg,src = acc_reg,offset = actual_attr_index))
                 self.symbol_stack.insert_symbol(attr.Name,Offset(self_reg,actual_attr_index))
 
-            # initialize attributes
-            for actual_attr_index,attr in enumerate(attrs, start=attributes_start_index):
-                if attr.Initializer:   
+            # Attribute in acc
 
-                    exp = attr.Initializer[1]
-                    self.cgen(exp)
-                    self.append_asm(ASM_St(dest = self_reg,src = acc_reg,offset = actual_attr_index))
-                    self.symbol_stack.insert_symbol(attr.Name,Offset(self_reg,actual_attr_index))
+        self.append_asm(ASM_Mov(acc_reg,self_reg))
 
-                # Attribute in acc
-
-            self.append_asm(ASM_Mov(acc_reg,self_reg))
 
+        if self.x86:
+            self.append_asm(ASM_Mov("sp","fp"))
+            self.append_asm(ASM_Pop("fp"))
+        if not self.x86:
+            if temporaries:
+                self.append_asm(ASM_Li(temp_reg,ASM_Word(temporaries)))
+                self.append_asm(ASM_Add(temp_reg,"sp"))
+            self.append_asm(ASM_Pop("ra"))
+        self.append_asm(ASM_Return())
+        
+        self.check_temporaries(temporaries)
+        self.symbol_stack.pop_scope()
+        self.temporary_stack.pop_scope()
+        self.stream_asm()
 
-            if self.x86:
-                self.append_asm(ASM_Mov("sp","fp"))
-                self.append_asm(ASM_Pop("fp"))
-            if not self.x86:
-                self.append_asm(ASM_Pop("ra"))
-            self.append_asm(ASM_Return())
-            
-            self.symbol_stack.pop_scope()
-            self.temporary_stack.pop_scope()
 
+    # cool-asm: case on void and case without a matching branch print the error for that line and exit,
+    # each error has its own string.
+    def emit_error_strings(self) -> None:
+        for line_number,exp_type in sorted(self.case_lines_and_exps):
+            self.append_asm(ASM_Label(f"case_without_branch_{line_number}_{exp_type}"))
+            self.gen_out_string_constant(f"case_without_branch_string_{line_number}_{exp_type}")
+            self.append_asm(ASM_Syscall("exit"))
+        for line_number in sorted({line for line,_ in self.case_lines_and_exps}):
+            self.append_asm(ASM_Label(f"case_void_branch_{line_number}"))
+            self.gen_out_string_constant(f"case_void_string_{line_number}")
+            self.append_asm(ASM_Syscall("exit"))
+        for line in sorted(self.dispatch_lines):
+            emit_dispatch_on_void(self.asm_instructions,line)
+        for line in sorted({line for line,_ in self.case_lines_and_exps}):
+            emit_case_on_void(self.asm_instructions,line)
+        for line,exp in sorted(self.case_lines_and_exps):
+            emit_case_without_branch(self.asm_instructions,line,exp)
+        for line in sorted(self.div_zero_lines):
+            emit_divide_by_zero(self.asm_instructions,line)
 
-    def emit_methods(self)->None:
+    # x86: every line with a check gets a stub in .text.unlikely that puts the line number in edi
+    # and jumps to the runtime's stub for that error (coolerror_*, x86_built_in.txt), which prints
+    # ERROR: <line>: Exception: <message> from one template. the checks in the methods are just
+    # a compare and a branch that is not taken, the printing code is out of their way.
+    def emit_error_stubs(self) -> None:
+        self.append_asm(ASM_Section(".text.unlikely"))
+        for line_number in sorted(self.dispatch_lines):
+            self.append_asm(ASM_Label(f"dispatch_void_{line_number}"))
+            self.append_asm(ASM_Error("dispatch_void", line_number))
+        for line_number in sorted({line for line,_ in self.case_lines_and_exps}):
+            self.append_asm(ASM_Label(f"case_void_branch_{line_number}"))
+            self.append_asm(ASM_Error("case_void", line_number))
+        for line_number,exp_type in sorted(self.case_lines_and_exps):
+            self.append_asm(ASM_Label(f"case_without_branch_{line_number}_{exp_type}"))
+            self.append_asm(ASM_Error("case_without_branch", line_number))
+        for line_number in sorted(self.div_zero_lines):
+            self.append_asm(ASM_Label(f"divide_by_zero_{line_number}"))
+            self.append_asm(ASM_Error("divide_by_zero", line_number))
+        self.append_asm(ASM_Section(".text"))
+
+    # constructors and methods in the order of the layout (asm_layout.py), the cold ones in .text.unlikely.
+    def emit_functions(self)->None:
+        self.comment("resulting object will be in accumulator.",not_tabbed=True)
+        if self.jobs > 1 and self.renderer is not None:
+            self.emit_functions_parallel()
+            return
         # for (cname,mname), imp in self.direct_methods.items():
-        for (cname,mname), imp in self.imp_map.items():
-            self.current_class = cname
-            num_args = len(imp)-1
-            exp = imp[-1][1]
-            self.append_asm(ASM_Label(f"{cname}.{mname}"))
+        for function in self.layout.order:
+            self.gen_section(function)
+            if function.method is None:
+                self.emit_constructor(function.cls)
+                continue
+            cname, mname = function.cls, function.method
+            imp = self.imp_map[(cname,mname)]
+            with self.timer.phase(f"{cname}.{mname}", "method", count=self.instruction_count):
+                if self.cache is not None:
+                    text, count, found = self.emit_method_cached(cname, mname, imp)
+                    self.renderer.write_rendered(text)
+                    self.instructions_streamed += count
+                    self.add_found(found)
+                    continue
+                self.emit_method(cname, mname, imp)
+                self.stream_asm()
+        self.gen_section(None)
+
+    # switch to .text.unlikely for the cold functions (and back to .text after them, function None).
+    def gen_section(self, function) -> None:
+        cold = function is not None and self.layout.is_cold(function.label)
+        if cold != self.cold_section:
+            self.append_asm(ASM_Section(".text.unlikely" if cold else ".text"))
+            self.cold_section = cold
+            self.stream_asm()
+
+    # hot functions start on a 16 byte boundary.
+    def gen_function_align(self) -> None:
+        if self.current_hot:
+            self.append_asm(ASM_Align(4, None))
 
-            self.emit_function_prologue(exp)
+    """
+    jobs > 1: methods only depend on tables that are done before them (vtable slots, type tags,
+    attribute offsets, string labels) and their own labels (label_namespace), so they are split
+    into shards for a pool of workers forked from this generator. each worker generates and
+    renders (x86) its methods, and hands back their text plus what the error sections and
+    -profile tables need. constructors are generated here in between, the text is written in
+    layout order, so the output is the same as generating them one after another.
+    """
+    def emit_functions_parallel(self) -> None:
+        global parallel_gen
+        methods = [(function.cls, function.method) for function in self.layout.order if function.method is not None]
+        shard_size = max(1, len(methods) // (self.jobs * 8))
+        shards = [methods[i:i + shard_size] for i in range(0, len(methods), shard_size)]
+
+        parallel_gen = self
+        try:
+            with multiprocessing.get_context("fork").Pool(self.jobs, initializer=parallel_worker_init) as pool:
+                results = pool.imap(parallel_worker_shard, shards)
+                texts = iter(())
+                for function in self.layout.order:
+                    self.gen_section(function)
+                    if function.method is None:
+                        self.emit_constructor(function.cls)
+                        continue
+                    text = next(texts, None)
+                    if text is None:
+                        shard_texts, count, found, events, cache_stats = next(results)
+                        texts = iter(shard_texts)
+                        text = next(texts)
+                        self.instructions_streamed += count
+                        self.add_found(found)
+                        self.timer.events.extend(events)
+                        if self.cache is not None:
+                            self.cache.add_stats(cache_stats)
+                    self.renderer.write_rendered(text)
+                self.gen_section(None)
+        finally:
+            parallel_gen = None
+
+    # runs in a worker, only what the shard's methods add is sent back.
+    def emit_methods_shard(self, methods) -> tuple:
+        self.dispatch_lines = set()
+        self.case_lines_and_exps = set()
+        self.div_zero_lines = set()
+        self.profile_counters = {kind: {} for kind in self.profile_counters}
+        self.timer.events = []
+        if self.cache is not None:
+            self.cache.hits = self.cache.misses = self.cache.stale = 0
+
+        text = []
+        count = 0
+        for cname,mname in methods:
+            with self.timer.phase(f"{cname}.{mname}", "method") as args:
+                method_text, method_count, found = self.emit_method_cached(cname, mname, self.imp_map[(cname,mname)])
+                text.append(method_text)
+                count += method_count
+                self.add_found(found)
+                if args is not None:
+                    args["instructions"] = method_count
+
+        found = {
+            "dispatch_lines": self.dispatch_lines,
+            "case_lines_and_exps": self.case_lines_and_exps,
+            "div_zero_lines": self.div_zero_lines,
+            "profile_counters": self.profile_counters,
+        }
+        cache_stats = self.cache.stats() if self.cache is not None else None
+        return text, count, found, self.timer.events, cache_stats
+
+    # one method generated and rendered on its own, with what the error sections and -profile need.
+    def emit_method_rendered(self, cname, mname, imp) -> tuple:
+        found = self.dispatch_lines, self.case_lines_and_exps, self.div_zero_lines, self.profile_counters
+        self.dispatch_lines = set()
+        self.case_lines_and_exps = set()
+        self.div_zero_lines = set()
+        self.profile_counters = {kind: {} for kind in self.profile_counters}
+        try:
+            self.emit_method(cname, mname, imp)
+            count = len(self.asm_instructions)
+            asm_instructions = self.filter_asm(self.include_comments)
+            self.asm_instructions = []
+            with self.timer.phase("cool_asm_to_x86", "lowering"):
+                text = self.renderer.render(asm_instructions)
+            return text, count, {
+                "dispatch_lines": self.dispatch_lines,
+                "case_lines_and_exps": self.case_lines_and_exps,
+                "div_zero_lines": self.div_zero_lines,
+                "profile_counters": self.profile_counters,
+            }
+        finally:
+            self.dispatch_lines, self.case_lines_and_exps, self.div_zero_lines, self.profile_counters = found
+
+    def add_found(self, found) -> None:
+        self.dispatch_lines |= found["dispatch_lines"]
+        self.case_lines_and_exps |= found["case_lines_and_exps"]
+        self.div_zero_lines |= found["div_zero_lines"]
+        for kind, counters in found["profile_counters"].items():
+            self.profile_counters[kind].update(counters)
 
+    """
+    -cache: the rendered text of a method only depends on its key (body, formals, attribute
+    offsets of its class, options) and what it looked up (depend), labels in it are either its
+    own (label_namespace), by line number (errors) or by content (strings), so a cached method
+    can be written out as is. misses are generated, rendered and stored.
+    """
+    def emit_method_cached(self, cname, mname, imp) -> tuple:
+        if self.cache is None:
+            return self.emit_method_rendered(cname, mname, imp)
+        if isinstance(imp[-1][1], Deferred_Body):
+            imp = [*imp[:-1], self.parser.read_body(imp[-1][1])]
+
+        key = self.cache.key(self.cache_options(), cname, mname, imp,
+                             [(attr.Name, attr.Type) for attr in self.class_map[cname]], self.layout.is_hot(f"{cname}.{mname}"))
+        entry = self.cache.get(key)
+        if entry is not None:
+            if all(self.dependency_current(dep, value) for dep, value in entry["deps"].items()):
+                self.cache.hits += 1
+                return entry["text"], entry["count"], entry["found"]
+            self.cache.stale += 1
+        self.cache.misses += 1
+
+        self.cache_deps = {}
+        try:
+            text, count, found = self.emit_method_rendered(cname, mname, imp)
+            self.cache.put(key, {"deps": self.cache_deps, "text": text, "count": count, "found": found})
+        finally:
+            self.cache_deps = None
+        return text, count, found
+
+    def cache_options(self) -> tuple:
+        return (self.x86, self.opt, self.tco, self.regcall, self.compact, self.tagged, self.profile, self.include_comments)
+
+    # tables outside the method that its code depends on, recorded for its cache entry.
+    def dependency(self, dep):
+        match dep:
+            case ("slot", class_name, method_name):
+                return self.method_index.lookup(class_name, method_name)
+            case ("overridden", class_name):
+                return class_name in self.parent_map.values()
+            case ("tags",):
+                return (tuple(self.class_map), tuple(self.class_to_tag.get_dict().items()),
+                        tuple(sorted(self.parent_map.items())))
+        raise Exception(f"unknown dependency {dep}")
+
+    def depend(self, dep):
+        value = self.dependency(dep)
+        if self.cache_deps is not None:
+            self.cache_deps[dep] = value
+        return value
+
+    def dependency_current(self, dep, value) -> bool:
+        try:
+            return self.dependency(dep) == value
+        except KeyError:
+            return False
+
+    def emit_method(self, cname, mname, imp) -> None:
+        self.current_class = cname
+        self.current_method = mname
+        self.label_namespace = f"{cname}.{mname}.."
+        self.branch_counter = 0
+        self.current_hot = self.layout.is_hot(f"{cname}.{mname}")
+        num_args = len(imp)-1
+        self.current_num_args = num_args
+        exp = imp[-1][1]
+        if isinstance(exp, Deferred_Body):
+            exp = self.parser.read_body(exp)[1]
+        self.gen_function_align()
+        self.append_asm(ASM_Label(f"{cname}.{mname}"))
+        self.gen_count("calls", f"{cname}.{mname}")
+
+        # register calling convention:
+        #   leaf methods dont call anything, so they dont need a frame.
+        #   self is only saved (and loaded from acc) if the body uses it.
+        self.current_leaf = self.regcall and self.is_leaf(exp)
+        self.current_saves_self = self.regcall and self.uses_self(exp, set(imp[:-1]))
+
+        self.emit_function_prologue(exp, tail_label=f"{cname}.{mname}..tail")
+
+
+        # add fields and attributes in scope to symbol table.
+
+        # step 1 - fields / attr in scope
+        for index,attr in enumerate(self.class_map[cname],start=self.attributes_start_index):
+            self.comment(f"SYMBOL TABLE: setup attr {attr.Name}, lives in {self_reg}[{index}]")
+            self.symbol_stack.insert_symbol(attr.Name , Offset(self_reg, index))
+
+        # step 2 - formals in scope
+        for index,arg in enumerate(imp[:-1],start=1):
+            if self.regcall:
+                location = self.get_regcall_formal_location(index, num_args)
+                self.comment(f"SYMBOL TABLE: setup formal {arg}, it lives in {location}")
+                self.symbol_stack.insert_symbol(arg, location)
+                continue
 
-            # add fields and attributes in scope to symbol table.
+            if self.x86:
+                # + 1 because of return address
+                # + 1 because of self object
+                # + 1 to get the actual index
+                # leftmost arguments are closer to the frame pointer.
+                # the self object is right next to the frame pointer.
+                fp_offset=num_args-index + 1 + 1 + 1
+            else:
 
-            # step 1 - fields / attr in scope
-            for index,attr in enumerate(self.class_map[cname],start=attributes_start_index):
-                self.comment(f"SYMBOL TABLE: setup attr {attr.Name}, lives in {self_reg}[{index}]")
-                self.symbol_stack.insert_symbol(attr.Name , Offset(self_reg, index))
+                # +1 because of self object
+                # + 1 to get the actual index
+                fp_offset=num_args-index + 1 + 1
 
-            # step 2 - formals in scope
-            for index,arg in enumerate(imp[:-1],start=1):
-                if self.x86:
-                    # + 1 because of return address
-                    # + 1 because of self object
-                    # + 1 to get the actual index
-                    # leftmost arguments are closer to the frame pointer.
-                    # the self object is right next to the frame pointer.
-                    fp_offset=num_args-index + 1 + 1 + 1
-                else:
+            self.comment(f"SYMBOL TABLE: setup formal {arg}, it lives in fp[{fp_offset}]")
+            self.symbol_stack.insert_symbol(arg, Offset("fp", fp_offset))
 
-                    # +1 because of self object
-                    # + 1 to get the actual index
-                    fp_offset=num_args-index + 1 + 1
 
-                self.comment(f"SYMBOL TABLE: setup formal {arg}, it lives in fp[{fp_offset}]")
-                self.symbol_stack.insert_symbol(arg, Offset("fp", fp_offset))
+        # method body is always in tail position.
+        self.cgen(exp, tail=True)
 
+        # args  (this only matters for cool)
+        stack_cleanup_size=num_args
+        self.emit_function_epilogue(stack_cleanup_size)
 
-            self.cgen(exp)
+    """
+    register calling convention, where does formal number index (starting at 1) live?
 
-            # args  (this only matters for cool)
-            stack_cleanup_size=num_args
-            self.emit_function_epilogue(stack_cleanup_size)
+    first len(arg_regs) formals are passed in registers, a leaf keeps them there,
+    everything else spills them right under the frame pointer.
 
-    def emit_function_prologue(self,exp) -> None:
+    the rest are pushed by the caller (leftmost first) like the stack convention:
+        return address
+        saved self (only if we use self)
+        saved fp  (only if we are not a leaf)
+    """
+    def get_regcall_formal_location(self, index, num_args):
+        if index <= len(arg_regs):
+            if self.current_leaf:
+                return Register(arg_regs[index-1])
+            return Offset("fp", -index)
+
+        saved_self = 1 if self.current_saves_self else 0
+        if self.current_leaf:
+            # nothing is pushed in a leaf body, so sp does not move.
+            # +1 because of return address
+            return Offset("sp", saved_self + 1 + num_args - index)
+        # +1 because of saved fp
+        # +1 because of return address
+        return Offset("fp", saved_self + 1 + 1 + num_args - index)
+
+    def emit_function_prologue(self,exp,tail_label=None) -> None:
         self.symbol_stack.push_scope()
-        self.temporary_stack.push_scope()
         # the cool way
         if not self.x86:
+            self.temporary_stack.push_scope()
             self.append_asm(ASM_Mov("fp","sp"))
             self.append_asm(ASM_Pop(self_reg))
 
@@ -267,10 +652,45 @@ class CoolAsmGen:
 
             self.append_asm(ASM_Push("ra"))
 
+        elif self.regcall:
+            # receiver is in acc, first arguments are in arg_regs.
+            if self.current_leaf:
+                self.temporary_stack.push_scope()
+                self.temporaries_needed = 0
+                if self.current_saves_self:
+                    self.append_asm(ASM_Push(self_reg))
+                    self.append_asm(ASM_Mov(self_reg,acc_reg))
+                return
+
+            self.append_asm(ASM_Push("fp"))
+            if self.current_saves_self:
+                self.append_asm(ASM_Push(self_reg))
+            self.append_asm(ASM_Mov(dest="fp",src="sp"))
+            # self recursive tail calls jump here with the frame already set up.
+            if self.tco and tail_label:
+                self.append_asm(ASM_Label(tail_label))
+            if self.current_saves_self:
+                self.append_asm(ASM_Mov(self_reg,acc_reg))
+
+            # spill register arguments right under fp, temporaries start after them.
+            num_reg_args = min(self.current_num_args, len(arg_regs))
+            for reg in arg_regs[:num_reg_args]:
+                self.append_asm(ASM_Push(reg))
+            self.temporary_stack.push_scope(start=-(num_reg_args + 1))
+
+            self.temporaries_needed= self.compute_max_stack_depth(exp)
+            self.comment(f"need {self.temporaries_needed} temporaries")
+            self.append_asm(ASM_Li(temp_reg,ASM_Word(self.temporaries_needed)))
+            self.append_asm(ASM_Sub(temp_reg,"sp"))
+
         else:
             # the x86 way
+            self.temporary_stack.push_scope()
             self.append_asm(ASM_Push("fp"))
             self.append_asm(ASM_Mov(dest="fp",src="sp"))
+            # self recursive tail calls jump here with the frame already set up.
+            if self.tco and tail_label:
+                self.append_asm(ASM_Label(tail_label))
             # +1 for pushed rbp
             # +1 for return address ( exclusive to x86 :) )
             # +1 for the actual self object that we are getting
@@ -290,6 +710,15 @@ class CoolAsmGen:
             self.append_asm(ASM_Li(temp_reg,ASM_Word(num_args+self.temporaries_needed+1)))
             self.append_asm(ASM_Add(temp_reg,"sp"))
             self.append_asm(ASM_Return())
+        elif self.regcall:
+            # caller cleans up the stack arguments.
+            if not self.current_leaf:
+                self.append_asm(ASM_Mov(dest="sp", src="fp"))
+            if self.current_saves_self:
+                self.append_asm(ASM_Pop(self_reg))
+            if not self.current_leaf:
+                self.append_asm(ASM_Pop("fp"))
+            self.append_asm(ASM_Return())
         else:
             # stack layout-
             #   arg1 .. n
@@ -299,9 +728,17 @@ class CoolAsmGen:
             self.append_asm(ASM_Pop("fp"))
             self.append_asm(ASM_Return())
 
+        self.check_temporaries(self.temporaries_needed)
         self.symbol_stack.pop_scope()
         self.temporary_stack.pop_scope()
 
+    # compute_max_stack_depth has to agree with what cgen allocated, or temporaries end up
+    # where calls push (and the frame under them).
+    def check_temporaries(self, reserved) -> None:
+        used = self.temporary_stack.max_used()
+        if used > reserved:
+            raise Exception(f"{self.label_namespace.rstrip('.')}: used {used} temporaries, only made room for {reserved}")
+
 
     def emit_start(self)->None:
         self.comment("\n\n-=-=-=-=-=-=-=-=-  PROGRAM STARTS HERE  -=-=-=-=-=-=-=-=-",not_tabbed=True)
@@ -316,8 +753,11 @@ class CoolAsmGen:
     generate code for e, put on accumulator register.
     (append instuctions to our asm list)
     leave stack the way we found it
+
+    tail is True when the value of e is directly returned by the method,
+    dispatches in tail position jump instead of call.
     """
-    def cgen(self, exp)->None:
+    def cgen(self, exp, tail=False)->None:
         self.comment(f"cgen+: {exp}")
 
         match exp:
@@ -342,11 +782,11 @@ class CoolAsmGen:
                         # raise Exception(f"Unhandled symbol location: {location}" )
 
             case Dynamic_Dispatch(Exp,Method,Args):
-                self.gen_dispatch_helper(Exp=Exp, Type=None, Method=Method, Args=Args)
+                self.gen_dispatch_helper(Exp=Exp, Type=None, Method=Method, Args=Args, tail=tail)
             case Static_Dispatch(Exp,Type,Method,Args):
-                self.gen_dispatch_helper(Exp=Exp, Type=Type, Method=Method, Args=Args)
+                self.gen_dispatch_helper(Exp=Exp, Type=Type, Method=Method, Args=Args, tail=tail)
             case Self_Dispatch(Method,Args):
-                self.gen_dispatch_helper(Exp=None, Type=None, Method=Method, Args=Args)
+                self.gen_dispatch_helper(Exp=None, Type=None, Method=Method, Args=Args, tail=tail)
 
             case If(Predicate, Then, Else):
 
@@ -357,19 +797,19 @@ class CoolAsmGen:
 
                 # predicate
                 self.cgen(Predicate[1])
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
                 self.append_asm(ASM_Bnz(acc_reg, if_then_label))
 
                 # else
                 self.comment("ELSE (False branch)",not_tabbed=True)
                 self.append_asm(ASM_Label(if_else_label))
-                self.cgen(Else[1])
+                self.cgen(Else[1], tail=tail)
                 self.append_asm(ASM_Jmp(if_end_label))
 
                 # then
                 self.comment("THEN (True branch)",not_tabbed=True)
                 self.append_asm(ASM_Label(if_then_label))
-                self.cgen(Then[1])
+                self.cgen(Then[1], tail=tail)
 
                 # end
                 self.comment("END of if conditional",not_tabbed=True)
@@ -383,9 +823,12 @@ class CoolAsmGen:
                 while_end_label = "end_while_" + self.get_branch_label()
 
                 self.comment("WHILE (conditional)",not_tabbed=True)
+                if self.current_hot:
+                    # loop header of a hot function, padded to 16 bytes if it takes at most 10
+                    self.append_asm(ASM_Align(4, 10))
                 self.append_asm(ASM_Label(while_cond_label))
                 self.cgen(Predicate[1])
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
                 self.append_asm(ASM_Bz(acc_reg,while_end_label))
 
 
@@ -401,15 +844,29 @@ class CoolAsmGen:
                 self.append_asm(ASM_Label(while_end_label))
 
             case Block(Body):
-                for exp in Body:
+                for i, exp in enumerate(Body):
                     exp = exp[1]
-                    self.cgen(exp)
+                    # only the last expression of the block can be a tail call.
+                    self.cgen(exp, tail=tail and i == len(Body)-1)
             # acc will contain the last result of the entire block.
 
             case New(Type):
                 if isinstance(Type,ID):
                     Type = Type[1]
 
+                if self.tagged and Type == "Int":
+                    self.gen_int_constant(0)
+                    return
+                if self.tagged and Type == "Bool":
+                    self.gen_bool_constant(False)
+                    return
+
+                if isinstance(exp.Type,ID):
+                    site = f"line {exp.Type.loc}: new {Type}"
+                else:
+                    site = f"new {Type} (internal)"
+                self.gen_count("sites", f"{site} in {self.current_class}.{self.current_method or '.new'}")
+
                 self.append_asm(ASM_Push("fp"))
                 self.append_asm(ASM_Push(self_reg))
                 # going to put result in ra register.
@@ -429,13 +886,11 @@ class CoolAsmGen:
                 self.cgen(Exp[1])
                 self.append_asm(ASM_Bz(acc_reg, true_branch))
                 self.append_asm(ASM_Label(false_branch))
-                self.cgen(New(Type="Bool",StaticType="Bool"))
+                self.gen_bool_constant(False)
                 self.append_asm(ASM_Jmp(end_branch))
 
                 self.append_asm(ASM_Label(true_branch))
-                self.cgen(New(Type="Bool",StaticType="Bool"))
-                self.append_asm(ASM_Li(temp_reg,ASM_Value(1)))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.gen_bool_constant(True)
 
                 self.append_asm(ASM_Label(end_branch))
 
@@ -445,11 +900,7 @@ class CoolAsmGen:
                 if self.opt:
                     val = self.eval_constant_expr(exp)
                     if val is not None:
-                        self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                        self.append_asm(ASM_Push(temp_reg))
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        self.append_asm(ASM_Pop(temp_reg))
-                        self.append_asm(ASM_St(acc_reg, temp_reg, attributes_start_index))
+                        self.gen_int_constant(val)
                         return
 
                 # actually evaluate.
@@ -462,18 +913,14 @@ class CoolAsmGen:
                 self.append_asm(ASM_Ld(temp_reg,"fp",index))
                 self.temporary_stack.free_temp()
 
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
-                self.append_asm(ASM_Ld(temp_reg,temp_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
+                self.gen_unbox(temp_reg,temp_reg)
 
 
                 self.append_asm(ASM_Add(acc_reg,temp_reg))
 
                 # we will eventually use temporaries instead of this.
-                self.append_asm(ASM_Push(temp_reg))
-                self.cgen(New(Type="Int", StaticType="Int"))
-                self.append_asm(ASM_Pop(temp_reg))
-
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.gen_box_int(temp_reg)
 
                 # Addition result now in accumulator.
 
@@ -481,11 +928,7 @@ class CoolAsmGen:
                 if self.opt:
                     val = self.eval_constant_expr(exp)
                     if val is not None:
-                        self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                        self.append_asm(ASM_Push(temp_reg))
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        self.append_asm(ASM_Pop(temp_reg))
-                        self.append_asm(ASM_St(acc_reg, temp_reg, attributes_start_index))
+                        self.gen_int_constant(val)
                         return
 
                 self.cgen(Left[1])
@@ -498,15 +941,12 @@ class CoolAsmGen:
                 self.temporary_stack.free_temp()
 
                 
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
-                self.append_asm(ASM_Ld(temp_reg,temp_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
+                self.gen_unbox(temp_reg,temp_reg)
 
                 self.append_asm(ASM_Sub(acc_reg,temp_reg))
 
-                self.append_asm(ASM_Push(temp_reg))
-                self.cgen(New(Type="Int", StaticType="Int"))
-                self.append_asm(ASM_Pop(temp_reg))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.gen_box_int(temp_reg)
 
                 # Subtraction result now in accumulator.
 
@@ -514,11 +954,7 @@ class CoolAsmGen:
                 if self.opt:
                     val = self.eval_constant_expr(exp)
                     if val is not None:
-                        self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                        self.append_asm(ASM_Push(temp_reg))
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        self.append_asm(ASM_Pop(temp_reg))
-                        self.append_asm(ASM_St(acc_reg, temp_reg, attributes_start_index))
+                        self.gen_int_constant(val)
                         return
                 self.cgen(Left[1])
 
@@ -526,59 +962,75 @@ class CoolAsmGen:
                 self.cgen(Right[1])
                 self.append_asm(ASM_Pop(temp_reg))
 
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
-                self.append_asm(ASM_Ld(temp_reg,temp_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
+                self.gen_unbox(temp_reg,temp_reg)
 
                 self.append_asm(ASM_Mul(acc_reg,temp_reg))
 
-                self.append_asm(ASM_Push(temp_reg))
-                self.cgen(New(Type="Int", StaticType="Int"))
-                self.append_asm(ASM_Pop(temp_reg))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.gen_box_int(temp_reg)
                 # Multiplication result now in accumulator.
 
             case Divide(Left,Right):
                 if self.opt:
                     val = self.eval_constant_expr(exp)
                     if val is not None:
-                        self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                        self.append_asm(ASM_Push(temp_reg))
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        self.append_asm(ASM_Pop(temp_reg))
-                        self.append_asm(ASM_St(acc_reg, temp_reg, attributes_start_index))
+                        self.gen_int_constant(val)
                         return
                 denominator_line_number = Right[0]
 
                 self.cgen(Left[1])
                 
                 self.append_asm(ASM_Push(acc_reg))
-                self.div_zero_lines.append(denominator_line_number)
+                self.div_zero_lines.add(denominator_line_number)
                 self.cgen(Right[1])
                 self.append_asm(ASM_Pop(temp_reg))
 
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
-                self.append_asm(ASM_Ld(temp_reg,temp_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
+                self.gen_unbox(temp_reg,temp_reg)
 
-                # check for zero, if not , jump to true branch.
-                div_ok_label = "div_ok_" + self.get_branch_label()
-                self.append_asm(ASM_Bnz(acc_reg,div_ok_label))
-                # denominnator is zero
-                self.append_asm(ASM_La(acc_reg, "divide_by_zero_string_"+denominator_line_number))
-                self.append_asm(ASM_Syscall("IO.out_string"))
-                self.append_asm(ASM_Syscall("exit"))
+                if self.x86:
+                    # cold stub (emit_error_stubs)
+                    self.append_asm(ASM_Bz(acc_reg,"divide_by_zero_"+denominator_line_number))
+                else:
+                    # check for zero, if not , jump to true branch.
+                    div_ok_label = "div_ok_" + self.get_branch_label()
+                    self.append_asm(ASM_Bnz(acc_reg,div_ok_label))
+                    # denominnator is zero
+                    self.gen_out_string_constant("divide_by_zero_string_"+denominator_line_number)
+                    self.append_asm(ASM_Syscall("exit"))
 
-                self.append_asm(ASM_Label(div_ok_label))
+                    self.append_asm(ASM_Label(div_ok_label))
 
                 self.append_asm(ASM_Div(acc_reg,temp_reg))
 
-                self.append_asm(ASM_Push(temp_reg))
+                self.gen_box_int(temp_reg)
+                # Division result now in accumulator.
 
-                self.cgen(New(Type="Int", StaticType="Int"))
-                self.append_asm(ASM_Pop(temp_reg))
 
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
-                # Division result now in accumulator.
+            case Lt(Left,Right) | Le(Left,Right) | Eq(Left, Right) if self.tagged and Left[1].StaticType in ("Int","Bool"):
+                # tagged words compare like the values they hold (and Int = Int only if the words are equal)
+                true_label = "cmp_true_" + self.get_branch_label()
+                end_label = "cmp_end_" + self.get_branch_label()
+
+                self.cgen(Left[1])
+                index = self.temporary_stack.allocate_temp()
+                self.append_asm(ASM_St("fp",acc_reg,index))
+                self.cgen(Right[1])
+                self.append_asm(ASM_Ld(temp_reg,"fp",index))
+                self.temporary_stack.free_temp()
 
+                match type(exp).__name__:
+                    case "Lt":
+                        self.append_asm(ASM_Blt(temp_reg,acc_reg,true_label))
+                    case "Le":
+                        self.append_asm(ASM_Ble(temp_reg,acc_reg,true_label))
+                    case "Eq":
+                        self.append_asm(ASM_Beq(temp_reg,acc_reg,true_label))
+                self.gen_bool_constant(False)
+                self.append_asm(ASM_Jmp(end_label))
+                self.append_asm(ASM_Label(true_label))
+                self.gen_bool_constant(True)
+                self.append_asm(ASM_Label(end_label))
 
             case Lt(Left,Right) | Le(Left,Right) | Eq(Left, Right):
                 self.append_asm(ASM_Push(self_reg))
@@ -614,42 +1066,53 @@ class CoolAsmGen:
                 self.append_asm(ASM_Pop(self_reg))
 
 
+            case Not(Exp) if self.tagged:
+                self.cgen(Exp[1])
+                # true and false words add up to 10
+                self.append_asm(ASM_Li(temp_reg, ASM_Value(self.bool_word(True) + self.bool_word(False))))
+                self.append_asm(ASM_Sub(acc_reg, temp_reg))
+                self.append_asm(ASM_Mov(acc_reg, temp_reg))
+
             case Not(Exp):
                 self.cgen(Exp[1])
-                self.append_asm(ASM_Ld(temp_reg,acc_reg,attributes_start_index))
+                self.append_asm(ASM_Ld(temp_reg,acc_reg,self.attributes_start_index))
                 self.append_asm(ASM_Li(temp2_reg, ASM_Value(1)))
                 self.append_asm(ASM_Sub(temp_reg, temp2_reg))
                 self.cgen(New(Type="Bool", StaticType="Bool"))
-                self.append_asm(ASM_St(acc_reg, temp2_reg, attributes_start_index))
+                self.append_asm(ASM_St(acc_reg, temp2_reg, self.attributes_start_index))
 
 
             case Negate(Exp):
                 if self.opt:
                     val = self.eval_constant_expr(exp)
                     if val is not None:
-                        self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                        self.append_asm(ASM_Push(temp_reg))
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        self.append_asm(ASM_Pop(temp_reg))
-                        self.append_asm(ASM_St(acc_reg, temp_reg, attributes_start_index))
+                        self.gen_int_constant(val)
                         return
                 self.cgen(Exp[1])
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
+                self.gen_unbox(acc_reg,acc_reg)
                 self.append_asm(ASM_Li(temp_reg,ASM_Value(0)))
                 self.append_asm(ASM_Sub(acc_reg,temp_reg))
+                if self.tagged:
+                    self.gen_box_int(temp_reg)
+                    return
                 
                 # IMPORTANT:  THIS IS ASSUMING NEW INT  DOES NOT USE r3
+                if self.x86:
+                    self.append_asm(ASM_Wrap(temp_reg))
                 self.append_asm(ASM_Mov(temp2_reg,temp_reg))
 
                 self.cgen(New(Type="Int",StaticType="Int"))
                 self.append_asm(ASM_Mov(temp_reg,temp2_reg))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
 
 
             case Integer(Integer=val, StaticType=st):
+                if self.tagged:
+                    self.gen_int_constant(int(val))
+                    return
                 self.cgen(New(Type="Int",StaticType="Int"))
                 self.append_asm(ASM_Li(temp_reg,ASM_Value(val)))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
                 # Integer object now in accumulator register.
 
             case String(String=val):
@@ -662,7 +1125,12 @@ class CoolAsmGen:
                 # load that label into the string object we created.
                 self.comment(f"\"{val}\" points to label {self.string_to_label.get(val)}")
                 self.append_asm(ASM_La(temp_reg,self.string_to_label.get(val)))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
+                if self.x86:
+                    self.append_asm(ASM_Li(temp_reg,ASM_Value(len(val))))
+                    self.append_asm(ASM_St(acc_reg,temp_reg,self.string_len_index))
+                    self.append_asm(ASM_La(temp_reg,f"{self.string_to_label.get(val)}..out"))
+                    self.append_asm(ASM_St(acc_reg,temp_reg,self.string_out_index))
 
 
             # look up in symbol table, if found, store in accumulator.
@@ -695,13 +1163,11 @@ class CoolAsmGen:
                 # loaded in acc
 
             case true(Value):
-                self.cgen(New(Type="Bool", StaticType="Bool"))
-                self.append_asm(ASM_Li(temp_reg,ASM_Value(1)))
-                self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                self.gen_bool_constant(True)
 
             case false(Value):
                 # is there even a point in code genning this
-                self.cgen(New(Type="Bool", StaticType="Bool"))
+                self.gen_bool_constant(False)
 
 
             case Let(Bindings,Body):
@@ -717,9 +1183,11 @@ class CoolAsmGen:
                     self.cgen(binding)
 
                 self.comment("Let body")
-                self.cgen(Body[1])
+                self.cgen(Body[1], tail=tail)
 
                 self.symbol_stack.pop_scope()
+                for binding in Bindings:
+                    self.temporary_stack.free_temp()
 
 
 
@@ -760,7 +1228,7 @@ class CoolAsmGen:
                 # pprint(Elements)
 
                 # Generate the expression
-                self.case_lines_and_exps.append((line_number,exp_type))
+                self.case_lines_and_exps.add((line_number,exp_type))
                 self.cgen(Exp[1])
                 self.append_asm(ASM_Bz(acc_reg,void_branch))
 
@@ -768,8 +1236,10 @@ class CoolAsmGen:
                 index = self.temporary_stack.allocate_temp()
                 self.append_asm(ASM_St("fp",acc_reg,index))
                 # load type tag into acc for comparison.
-                self.append_asm(ASM_Ld(acc_reg,acc_reg,type_tag_index))
+                self.load_type_tag(acc_reg,acc_reg)
                 temp_class_name_to_label={}
+                # the tags of every class are compared against below.
+                self.depend(("tags",))
 
                 for element in Elements:
                     # print(element.Type.str)
@@ -806,20 +1276,7 @@ class CoolAsmGen:
                         self.append_asm(ASM_Beq(acc_reg,temp_reg,no_branch))
 
 
-                # FIXME include exp in traversed
-                if line_number not in self.traversed_case_lines:                
-                    self.append_asm(ASM_Label(no_branch))
-                    self.append_asm(ASM_La(acc_reg,f"case_without_branch_string_{line_number}_{exp_type}"))
-                    self.append_asm(ASM_Syscall("IO.out_string"))
-                    self.append_asm(ASM_Syscall("exit"))
-
-                    # void branch
-                    self.append_asm(ASM_Label(void_branch))
-                    self.append_asm(ASM_La(acc_reg,f"case_void_string_{line_number}"))
-                    self.append_asm(ASM_Syscall("IO.out_string"))
-                    self.append_asm(ASM_Syscall("exit"))
-
-                self.traversed_case_lines.append(line_number)
+                # the no_branch and void_branch code is emitted once per line with the other errors.
 
                 end_branch = "case_exp_end_" + self.get_branch_label()
 
@@ -832,79 +1289,94 @@ class CoolAsmGen:
                     # load in the branch variable or whatever its called
                     self.symbol_stack.insert_symbol(symbol=element.Var.str,loc=Offset("fp",index))
 
-                    self.cgen(element.Body[1])
+                    self.cgen(element.Body[1], tail=tail)
                     self.append_asm(ASM_Jmp(end_branch))
                 
                 self.append_asm(ASM_Label(end_branch))
                 self.symbol_stack.pop_scope()
+                self.temporary_stack.free_temp()
 
             case Internal(Body):
 
                 match Body:
                     case "Object.abort":
-                        self.append_asm(ASM_La(acc_reg,"cool_abort"))
-                        self.append_asm(ASM_Syscall("IO.out_string"))
+                        self.gen_out_string_constant("cool_abort")
                         self.append_asm(ASM_Syscall("exit"))
                     case "Object.type_name":
                         self.cgen(New(Type="String",StaticType="String"))
-                        self.append_asm(ASM_Ld(temp_reg,self_reg,vtable_index))
+                        self.gen_load_vtable(temp_reg,self_reg)
                         # load object name
                         self.append_asm(ASM_Ld(temp_reg,temp_reg,0))
-                        self.append_asm(ASM_St(acc_reg,temp_reg,attributes_start_index))
+                        self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
+                        if self.x86:
+                            # class names are string constants, length is stored right before them.
+                            self.append_asm(ASM_Ld(temp_reg,temp_reg,-1))
+                            self.append_asm(ASM_St(acc_reg,temp_reg,self.string_len_index))
                     case "Object.copy":
-                        
-                        loop_start_label = "object_copy_loop_start" + self.get_branch_label()
-                        loop_end_label = "object_copy_loop_end" + self.get_branch_label()
-
-                        self.append_asm(ASM_Ld(temp_reg,self_reg,object_size_index))
-                        # allocate object size number of elements
-                        self.append_asm(ASM_Alloc(acc_reg,temp_reg))
-                        # Push pointer to allocated memory onto stack.
-                        self.append_asm(ASM_Push(acc_reg))
-                        self.append_asm(ASM_Label(loop_start_label))
-                        # temp reg is the amount of iterations we have left
-                        self.append_asm(ASM_Bz(temp_reg,loop_end_label))
-                        # copy over name
-                        self.append_asm(ASM_Ld(temp2_reg, self_reg,0))
-                        self.append_asm(ASM_St(acc_reg, temp2_reg,0))
-
-                        # next object field (for both copy and copee)
-                        self.append_asm(ASM_Li(temp2_reg,ASM_Word(1)))
-                        self.append_asm(ASM_Add(temp2_reg,self_reg))
-                        self.append_asm(ASM_Add(temp2_reg,acc_reg))
-                        
-                        self.append_asm(ASM_Li(temp2_reg,ASM_Value(1))) # i dont think we need this
-                        self.append_asm(ASM_Sub(temp2_reg,temp_reg))                        
-                        self.append_asm(ASM_Jmp(loop_start_label))                       
-
-                        self.append_asm(ASM_Label(loop_end_label))
-                        self.append_asm(ASM_Pop(acc_reg))
-
-                        # acc register is the self object with different memory addresses.
+                        if self.x86:
+                            # one allocation plus a bulk copy of the object's words (coolcopy)
+                            self.append_asm(ASM_Syscall(Body))
+                        else:
+                            loop_start_label = "object_copy_loop_start" + self.get_branch_label()
+                            loop_end_label = "object_copy_loop_end" + self.get_branch_label()
+
+                            self.append_asm(ASM_Ld(temp_reg,self_reg,object_size_index))
+                            # allocate object size number of elements
+                            self.append_asm(ASM_Alloc(acc_reg,temp_reg))
+                            # Push pointer to allocated memory onto stack.
+                            self.append_asm(ASM_Push(acc_reg))
+                            self.append_asm(ASM_Label(loop_start_label))
+                            # temp reg is the amount of iterations we have left
+                            self.append_asm(ASM_Bz(temp_reg,loop_end_label))
+                            # copy over name
+                            self.append_asm(ASM_Ld(temp2_reg, self_reg,0))
+                            self.append_asm(ASM_St(acc_reg, temp2_reg,0))
+
+                            # next object field (for both copy and copee)
+                            self.append_asm(ASM_Li(temp2_reg,ASM_Word(1)))
+                            self.append_asm(ASM_Add(temp2_reg,self_reg))
+                            self.append_asm(ASM_Add(temp2_reg,acc_reg))
+
+                            self.append_asm(ASM_Li(temp2_reg,ASM_Value(1))) # i dont think we need this
+                            self.append_asm(ASM_Sub(temp2_reg,temp_reg))                        
+                            self.append_asm(ASM_Jmp(loop_start_label))                       
+
+                            self.append_asm(ASM_Label(loop_end_label))
+                            self.append_asm(ASM_Pop(acc_reg))
+
+                            # acc register is the self object with different memory addresses.
 
                     case "IO.out_int":
                         # in the case of out_int, x should be an integer.
                         self.cgen(Identifier(Var="x", StaticType=None))
 
-                        self.append_asm(ASM_Ld(acc_reg, acc_reg, attributes_start_index))
+                        self.gen_unbox(acc_reg, acc_reg)
 
                         self.append_asm(ASM_Syscall(Body))
                         self.append_asm(ASM_Mov(acc_reg,self_reg))
 
                     # creates an Int, gets input from user, stores that in the Int
+                    case "IO.in_int" if self.tagged:
+                        self.append_asm(ASM_Syscall(Body))
+                        self.append_asm(ASM_Tag(acc_reg,int_tag_bits))
                     case "IO.in_int":
                         self.cgen(New(Type="Int",StaticType="Int"))
                         self.append_asm(ASM_Mov(temp_reg,acc_reg))
                         self.append_asm(ASM_Syscall(Body))
                         # int input now in accumulator.
                         # store that val in our new int.
-                        self.append_asm(ASM_St(temp_reg,acc_reg,attributes_start_index))
+                        self.append_asm(ASM_St(temp_reg,acc_reg,self.attributes_start_index))
                         self.append_asm(ASM_Mov(acc_reg,temp_reg))
 
                     case "IO.out_string":
                         self.cgen(Identifier(Var="x", StaticType="String"))
 
-                        self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
+                        if self.x86:
+                            # string constants were decoded at compile time, no need to scan them.
+                            self.append_asm(ASM_Ld(temp_reg,acc_reg,self.string_out_index))
+                            # strings are not null terminated in x86
+                            self.append_asm(ASM_Ld(temp2_reg,acc_reg,self.string_len_index))
+                        self.append_asm(ASM_Ld(acc_reg,acc_reg,self.attributes_start_index))
                         self.append_asm(ASM_Syscall(Body))
 
                         self.comment("IO.out_string stores output into self register.")
@@ -917,24 +1389,35 @@ class CoolAsmGen:
 
                         # Store raw string in String object
                         # probasbly have to move rax to acc_reg in x86
-                        self.append_asm(ASM_St(temp_reg,acc_reg,attributes_start_index))
+                        self.append_asm(ASM_St(temp_reg,acc_reg,self.attributes_start_index))
+                        if self.x86:
+                            # x86: length in temp2
+                            self.append_asm(ASM_St(temp_reg,temp2_reg,self.string_len_index))
                         self.append_asm(ASM_Mov(acc_reg,temp_reg))
 
 
                     case "String.length":
-                        self.cgen(New(Type="Int",StaticType="Int"))
-                        # move Int object to temp
-                        self.append_asm(ASM_Mov(temp_reg,acc_reg))
-                        # move string literal
-                        self.append_asm(ASM_Ld(acc_reg,self_reg,attributes_start_index))
-                        self.append_asm(ASM_Syscall(Body))
-                        # for cool-asm: length in acc_reg
-                        # for x86: length in rax
+                        if self.tagged:
+                            self.append_asm(ASM_Ld(acc_reg,self_reg,self.string_len_index))
+                            self.append_asm(ASM_Tag(acc_reg,int_tag_bits))
+                        elif self.x86:
+                            self.cgen(New(Type="Int",StaticType="Int"))
+                            # length is kept in the String, no need to scan.
+                            self.append_asm(ASM_Ld(temp_reg,self_reg,self.string_len_index))
+                            self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
+                        else:
+                            self.cgen(New(Type="Int",StaticType="Int"))
+                            # move Int object to temp
+                            self.append_asm(ASM_Mov(temp_reg,acc_reg))
+                            # move string literal
+                            self.append_asm(ASM_Ld(acc_reg,self_reg,self.attributes_start_index))
+                            self.append_asm(ASM_Syscall(Body))
+                            # for cool-asm: length in acc_reg
 
 
-                        # store length in the Int object
-                        self.append_asm(ASM_St(temp_reg, acc_reg, attributes_start_index))
-                        self.append_asm(ASM_Mov(acc_reg, temp_reg))
+                            # store length in the Int object
+                            self.append_asm(ASM_St(temp_reg, acc_reg, self.attributes_start_index))
+                            self.append_asm(ASM_Mov(acc_reg, temp_reg))
 
                     case "String.concat":
                         # the final string
@@ -943,13 +1426,19 @@ class CoolAsmGen:
 
                         self.cgen(Identifier(Var="s",StaticType="String"))
                         self.append_asm(ASM_Mov(temp_reg,acc_reg))
-                        self.append_asm(ASM_Ld(temp_reg,acc_reg,attributes_start_index))
-                        self.append_asm(ASM_Ld(acc_reg,self_reg,attributes_start_index))
+                        if self.x86:
+                            # x86 takes the String objects, it needs their lengths too.
+                            self.append_asm(ASM_Mov(acc_reg,self_reg))
+                        else:
+                            self.append_asm(ASM_Ld(temp_reg,acc_reg,self.attributes_start_index))
+                            self.append_asm(ASM_Ld(acc_reg,self_reg,self.attributes_start_index))
 
                         self.append_asm(ASM_Syscall(Body))
                         # cool-asm: acc contains combined string
-                        # x86: rax contains combined string
-                        self.append_asm(ASM_St(temp2_reg,acc_reg,attributes_start_index))
+                        # x86: rax contains combined string, length in temp
+                        self.append_asm(ASM_St(temp2_reg,acc_reg,self.attributes_start_index))
+                        if self.x86:
+                            self.append_asm(ASM_St(temp2_reg,temp_reg,self.string_len_index))
                         self.append_asm(ASM_Mov(acc_reg,temp2_reg))
                     case "String.substr":
                         self.cgen(New(Type="String",StaticType="String"))
@@ -957,29 +1446,36 @@ class CoolAsmGen:
 
                         # starting int
                         self.cgen(Identifier(Var="l",StaticType="String"))
-                        self.append_asm(ASM_Mov(temp_reg,acc_reg))
-                        self.append_asm(ASM_Ld(temp_reg,temp_reg,attributes_start_index))
+                        self.gen_unbox(temp_reg,acc_reg)
 
                         # ending int 
                         self.cgen(Identifier(Var="i",StaticType="String"))
-                        self.append_asm(ASM_Ld(acc_reg,acc_reg,attributes_start_index))
+                        self.gen_unbox(acc_reg,acc_reg)
 
-                        self.append_asm(ASM_Ld(self_reg,self_reg,attributes_start_index))
+                        if not self.x86:
+                            # x86 takes the String object, it bounds checks against its length.
+                            self.append_asm(ASM_Ld(self_reg,self_reg,self.attributes_start_index))
 
                         self.append_asm(ASM_Syscall(Body))
 
-                        valid_substr_label = "substr_valid_" + self.get_branch_label()
-                        self.append_asm(ASM_Bnz(acc_reg,valid_substr_label))
+                        if self.x86:
+                            # the runtime's stub, its line number is always 0
+                            self.append_asm(ASM_Bz(acc_reg,"coolerror_substr"))
+                        else:
+                            valid_substr_label = "substr_valid_" + self.get_branch_label()
+                            self.append_asm(ASM_Bnz(acc_reg,valid_substr_label))
 
 
-                        # bad
-                        self.append_asm(ASM_La(acc_reg,"substr_bad"))
-                        self.append_asm(ASM_Syscall("IO.out_string"))
-                        self.append_asm(ASM_Syscall("exit"))
+                            # bad
+                            self.gen_out_string_constant("substr_bad")
+                            self.append_asm(ASM_Syscall("exit"))
 
-                        self.append_asm(ASM_Label(valid_substr_label))
+                            self.append_asm(ASM_Label(valid_substr_label))
                         # in x86 - need to move  rax to acc.
-                        self.append_asm(ASM_St(temp2_reg,acc_reg,attributes_start_index))
+                        self.append_asm(ASM_St(temp2_reg,acc_reg,self.attributes_start_index))
+                        if self.x86:
+                            # length of the substring is just l (still in temp)
+                            self.append_asm(ASM_St(temp2_reg,temp_reg,self.string_len_index))
                         self.append_asm(ASM_Mov(acc_reg,temp2_reg))
 
                     case _:
@@ -1041,14 +1537,105 @@ class CoolAsmGen:
                 return None  # Not a constant
     
 
-    def gen_dispatch_helper(self, Exp, Type, Method, Args):
+    # print a string constant (label), not a String object.
+    # x86 gets the decoded form in temp as well.
+    def gen_out_string_constant(self, label) -> None:
+        self.append_asm(ASM_La(acc_reg,label))
+        if self.x86:
+            self.append_asm(ASM_La(temp_reg,f"{label}..out"))
+        self.append_asm(ASM_Syscall("IO.out_string"))
+
+    # with the compact header the type tag is in front of the vtable.
+    def load_type_tag(self, dest, src) -> None:
+        if self.compact or self.tagged:
+            self.gen_load_vtable(dest,src)
+            self.append_asm(ASM_Ld(dest,dest,vtable_type_tag_index))
+        else:
+            self.append_asm(ASM_Ld(dest,src,type_tag_index))
+
+    # -profile counter, the tables are emitted by X86Gen.emit_profile_tables.
+    def gen_count(self, kind, name, offset=0, amount=1) -> None:
+        if not self.profile:
+            return
+        counters = self.profile_counters[kind]
+        if name not in counters:
+            counters[name] = f"cool_prof_{kind}_{self.get_branch_label()}"
+        self.append_asm(ASM_Count(counters[name], offset, amount))
+
+    # src might be a tagged Int/Bool, which has no object to read the vtable from.
+    def gen_load_vtable(self, dest, src) -> None:
+        if self.tagged:
+            self.append_asm(ASM_Vtable(dest,src,self.vtable_index))
+        else:
+            self.append_asm(ASM_Ld(dest,src,self.vtable_index))
+
+    # Ints are 32 bit
+    def int32(self, val) -> int:
+        return (val + 2**31) % 2**32 - 2**31
+
+    def int_word(self, val) -> int:
+        return self.int32(val) << 2 | int_tag_bits
+
+    def bool_word(self, val) -> int:
+        return int(val) << 2 | bool_tag_bits
+
+    # raw Int/Bool value of the object (or tagged word) in src.
+    def gen_unbox(self, dest, src) -> None:
+        if self.tagged:
+            if dest != src:
+                self.append_asm(ASM_Mov(dest,src))
+            self.append_asm(ASM_Untag(dest))
+        else:
+            self.append_asm(ASM_Ld(dest,src,self.attributes_start_index))
+
+    # raw value in reg (not acc) -> Int in acc.
+    # both ways it wraps to 32 bits (ASM_Tag does when it tags), so +, -, * and / overflow the same.
+    def gen_box_int(self, reg) -> None:
+        if self.tagged:
+            self.append_asm(ASM_Mov(acc_reg,reg))
+            self.append_asm(ASM_Tag(acc_reg,int_tag_bits))
+        else:
+            if self.x86:
+                self.append_asm(ASM_Wrap(reg))
+            self.append_asm(ASM_Push(reg))
+            self.cgen(New(Type="Int", StaticType="Int"))
+            self.append_asm(ASM_Pop(reg))
+            self.append_asm(ASM_St(acc_reg,reg,self.attributes_start_index))
+
+    def gen_int_constant(self, val) -> None:
+        if self.tagged:
+            self.append_asm(ASM_Li(acc_reg,ASM_Value(self.int_word(val))))
+        else:
+            self.append_asm(ASM_Li(temp_reg,ASM_Value(self.int32(val))))
+            self.gen_box_int(temp_reg)
+
+    def gen_bool_constant(self, val) -> None:
+        if self.tagged:
+            self.append_asm(ASM_Li(acc_reg,ASM_Value(self.bool_word(val))))
+        else:
+            self.cgen(New(Type="Bool", StaticType="Bool"))
+            if val:
+                self.append_asm(ASM_Li(temp_reg,ASM_Value(1)))
+                self.append_asm(ASM_St(acc_reg,temp_reg,self.attributes_start_index))
+
+    def gen_dispatch_helper(self, Exp, Type, Method, Args, tail=False):
         if Exp:
             exp_line_number = int(Exp[0])
 
+        # the callee can only reuse our argument slots if it needs at most as many.
+        # with regcall, the register arguments dont need a slot.
+        if self.regcall:
+            tail = tail and self.tco and len(Args) <= max(self.current_num_args, len(arg_regs))
+        else:
+            tail = tail and self.tco and len(Args) <= self.current_num_args
+
         self.debug("sp")
 
-        self.append_asm(ASM_Push("fp"))
-        self.append_asm(ASM_Push(self_reg))
+        # we never come back from a tail call, so nothing to restore.
+        # with regcall the callee saves fp and self itself (if it touches them).
+        if not tail and not self.regcall:
+            self.append_asm(ASM_Push("fp"))
+            self.append_asm(ASM_Push(self_reg))
 
         """
         Here how the stack frame look like:
@@ -1069,28 +1656,33 @@ class CoolAsmGen:
         if Exp:
             # dynamic / static dispatch
             self.cgen(Exp)
-            # check for void.
-            non_void_label = "non_void_"+self.get_branch_label()
-            self.append_asm(ASM_Bnz(acc_reg,non_void_label))
-            self.dispatch_lines.append(exp_line_number)
-
+            self.dispatch_lines.add(exp_line_number)
+            if self.x86:
+                # check for void, cold stub (emit_error_stubs)
+                self.append_asm(ASM_Bz(acc_reg,f"dispatch_void_{exp_line_number}"))
+            else:
+                # check for void.
+                non_void_label = "non_void_"+self.get_branch_label()
+                self.append_asm(ASM_Bnz(acc_reg,non_void_label))
 
-        # Calling dispatch on void
-        if Exp:
-            self.append_asm(ASM_La(acc_reg,f"dispatch_void_string_{exp_line_number}"))
-            self.append_asm(ASM_Syscall("IO.out_string"))
-            self.append_asm(ASM_Syscall("exit"))
+                # Calling dispatch on void
+                self.gen_out_string_constant(f"dispatch_void_string_{exp_line_number}")
+                self.append_asm(ASM_Syscall("exit"))
 
-        if Exp:
-            self.append_asm(ASM_Label(non_void_label))
+                self.append_asm(ASM_Label(non_void_label))
         
-        self.comment("Push receiver on the stack.")
-        if Exp:
-            # push code generated receiver
-            self.append_asm(ASM_Push(acc_reg))
+        if self.regcall:
+            # receiver is passed in acc.
+            if not Exp:
+                self.append_asm(ASM_Mov(acc_reg,self_reg))
         else:
-            # push self receiver
-            self.append_asm(ASM_Push(self_reg))
+            self.comment("Push receiver on the stack.")
+            if Exp:
+                # push code generated receiver
+                self.append_asm(ASM_Push(acc_reg))
+            else:
+                # push self receiver
+                self.append_asm(ASM_Push(self_reg))
 
 
         """
@@ -1104,10 +1696,14 @@ class CoolAsmGen:
         # emit code to lookup in vtable.
         if Type:
             self.append_asm(ASM_La(temp_reg, f"{Type[1]}..vtable"))
+        elif Exp and self.tagged and Exp.StaticType in ("Int","Bool"):
+            self.append_asm(ASM_La(temp_reg, f"{Exp.StaticType}..vtable"))
+        elif Exp and self.tagged and Exp.StaticType == "Object":
+            self.gen_load_vtable(temp_reg,acc_reg)
         elif Exp:
-            self.append_asm(ASM_Ld(dest=temp_reg, src=acc_reg, offset=vtable_index))
+            self.append_asm(ASM_Ld(dest=temp_reg, src=acc_reg, offset=self.vtable_index))
         else:
-            self.append_asm(ASM_Ld(dest=temp_reg, src=self_reg, offset=vtable_index))
+            self.append_asm(ASM_Ld(dest=temp_reg, src=self_reg, offset=self.vtable_index))
 
         if Exp: 
             # Dynamic dispatch
@@ -1129,10 +1725,28 @@ class CoolAsmGen:
         # print(Exp)
 
         method_name = Method.str
-        method_vtable_index = self.method_index.lookup(class_name,method_name)
+        method_vtable_index = self.depend(("slot", class_name, method_name))
 
         self.comment(f"{class_name}.{method_name} lives at vindex {method_vtable_index}, loading the address.")
         self.append_asm(ASM_Ld(temp_reg, temp_reg, method_vtable_index))
+
+        if tail:
+            self.gen_tail_call(Exp, Type, method_name, len(Args))
+            return
+
+        if self.regcall:
+            # arguments stay where they were pushed, the first ones are also loaded in registers.
+            # sp[0] is the last argument, sp[n-1] is the first one.
+            num_args = len(Args)
+            for i, reg in enumerate(arg_regs[:num_args]):
+                self.append_asm(ASM_Ld(reg, "sp", num_args - 1 - i))
+            self.append_asm(ASM_Call_Reg(temp_reg))
+            if num_args:
+                self.append_asm(ASM_Li(temp_reg,ASM_Word(num_args)))
+                self.append_asm(ASM_Add(temp_reg,"sp"))
+            self.debug("sp")
+            return
+
         self.append_asm(ASM_Call_Reg(temp_reg))
 
 
@@ -1151,7 +1765,64 @@ class CoolAsmGen:
         # ensure stack integrity
         self.debug("sp")
 
+    """
+    method pointer is in temp, receiver and arguments are on top of the stack.
+
+    overwrites our own receiver and argument slots with the new ones, 
+    then jumps to the callee instead of calling it. the callee returns straight
+    to our caller, which cleans up the (possibly larger) argument area like usual.
+    """
+    def gen_tail_call(self, Exp, Type, method_name, num_args) -> None:
+        self.comment(f"TAIL CALL: reuse argument slots for {method_name}")
+        if self.regcall:
+            # receiver is in acc, sp[0..n-1] are the arguments (last one first)
+            # our stack arguments start right after saved self/fp and the return address.
+            saved = 2 if self.current_saves_self else 1
+            for i in range(num_args - len(arg_regs)):
+                self.append_asm(ASM_Ld(temp2_reg, "sp", i))
+                self.append_asm(ASM_St("fp", temp2_reg, saved + 1 + i))
+            for i, reg in enumerate(arg_regs[:num_args]):
+                self.append_asm(ASM_Ld(reg, "sp", num_args - 1 - i))
+        else:
+            # sp[0] is the receiver, sp[1..n] are the arguments (last one first)
+            # fp[2] is our receiver, fp[3..] are our arguments (last one first)
+            for i in range(num_args + 1):
+                self.append_asm(ASM_Ld(temp2_reg, "sp", i))
+                self.append_asm(ASM_St("fp", temp2_reg, 2 + i))
+
+        self.append_asm(ASM_Mov(dest="sp", src="fp"))
+
+        # self dispatch to the method we are in, and no subclass can override it.
+        # reuse the frame and skip the prologue entirely.
+        if (not Exp and not Type and method_name == self.current_method
+                and not self.depend(("overridden", self.current_class))):
+            self.gen_count("calls", f"{self.current_class}.{self.current_method}")
+            self.append_asm(ASM_Jmp(f"{self.current_class}.{self.current_method}..tail"))
+            return
+
+        if self.current_saves_self:
+            self.append_asm(ASM_Pop(self_reg))
+        self.append_asm(ASM_Pop("fp"))
+        self.append_asm(ASM_Jmp_Reg(temp_reg))
+
+    def instruction_count(self) -> int:
+        return self.instructions_streamed + len(self.asm_instructions)
+
+    # hand what was generated so far to the sink (when streaming) and forget it.
+    def stream_asm(self) -> None:
+        if self.sink is None:
+            return
+        asm_instructions = self.filter_asm(self.include_comments)
+        self.instructions_streamed += len(self.asm_instructions)
+        self.asm_instructions = []
+        with self.timer.phase("cool_asm_to_x86", "lowering"):
+            self.sink(asm_instructions)
+
     def get_asm(self,include_comments = False) -> list[namedtuple]:
+        with self.timer.phase("get_asm"):
+            return self.filter_asm(include_comments)
+
+    def filter_asm(self,include_comments = False) -> list[namedtuple]:
         asm_instructions = []
 
         for instr in self.asm_instructions:
@@ -1216,9 +1887,21 @@ class CoolAsmGen:
                 return f"mul {right} <- {right} {left}"
             case ASM_Div(left, right):
                 return f"div {right} <- {right} {left}"
+            case ASM_Wrap(reg):
+                return f"wrap {reg}"
+            case ASM_Tag(reg, tag):
+                return f"tag {reg} {tag}"
+            case ASM_Untag(reg):
+                return f"untag {reg}"
+            case ASM_Vtable(dest, src, offset):
+                return f"vtable {dest} <- {src}[{offset}]"
+            case ASM_Count(label, offset, amount):
+                return f"count {label}[{offset}] += {amount}"
 
             case ASM_Jmp(label):
                 return f"jmp {label}"
+            case ASM_Jmp_Reg(reg):
+                return f"jmp {reg}"
             case ASM_Bz(reg,label):
                 return f"bz {reg} {label}"
             case ASM_Bnz(reg,label):
@@ -1256,6 +1939,8 @@ class CoolAsmGen:
                 return f"alloc {dest} {src}"
             case ASM_Constant_raw_string(string):
                 return f"constant \"{string}\""
+            case ASM_Constant_integer(value):
+                return f"constant {value}"
             case ASM_Constant_label(label):
                 return f"constant {label}"
 
@@ -1267,69 +1952,119 @@ class CoolAsmGen:
                 sys.exit(1)
 
 
+    # a leaf method never calls anything and never needs a temporary,
+    # so it can run without a frame and keep its arguments in registers.
+    # anything that allocates (literals, arithmetic, comparisons) calls a constructor.
+    def is_leaf(self, exp) -> bool:
+        match exp:
+            case Identifier():
+                return True
+            case Assign(Var,Exp):
+                return self.is_leaf(Exp[1])
+            case Block(Body):
+                return all(self.is_leaf(e[1]) for e in Body)
+            case If(Predicate, Then, Else):
+                return self.is_leaf(Predicate[1]) and self.is_leaf(Then[1]) and self.is_leaf(Else[1])
+            case While(Predicate, Body):
+                return self.is_leaf(Predicate[1]) and self.is_leaf(Body[1])
+            case Integer() | true() | false():
+                # tagged constants do not allocate
+                return self.tagged
+            case _:
+                return False
+
+    # does the method body need self in self_reg?
+    # bound is the set of names that are not attributes (formals, let and case variables).
+    def uses_self(self, exp, bound) -> bool:
+        match exp:
+            case Identifier(Var):
+                name = Var.str if isinstance(Var,ID) else Var
+                return name == "self" or name not in bound
+            case Assign(Var,Exp):
+                return Var.str not in bound or self.uses_self(Exp[1], bound)
+            case Self_Dispatch(Method, Args):
+                return True
+            case Internal():
+                # internal methods are hand written and read self_reg.
+                return True
+            case Dynamic_Dispatch(Exp, Method, Args):
+                return any(self.uses_self(e[1], bound) for e in [Exp, *Args])
+            case Static_Dispatch(Exp, Type, Method, Args):
+                return any(self.uses_self(e[1], bound) for e in [Exp, *Args])
+            case Let(Bindings, Body):
+                for binding in Bindings:
+                    if isinstance(binding, Let_Init) and self.uses_self(binding.Exp[1], bound):
+                        return True
+                    bound = bound | {binding.Var.str}
+                return self.uses_self(Body[1], bound)
+            case Case(Exp, Elements):
+                if self.uses_self(Exp[1], bound):
+                    return True
+                return any(self.uses_self(e.Body[1], bound | {e.Var.str}) for e in Elements)
+            case If(Predicate, Then, Else):
+                return any(self.uses_self(e[1], bound) for e in [Predicate, Then, Else])
+            case While(Predicate, Body):
+                return any(self.uses_self(e[1], bound) for e in [Predicate, Body])
+            case Block(Body):
+                return any(self.uses_self(e[1], bound) for e in Body)
+            case Plus(Left,Right) | Minus(Left,Right) | Times(Left,Right) | Divide(Left,Right) | Lt(Left,Right) | Le(Left,Right) | Eq(Left,Right):
+                return self.uses_self(Left[1], bound) or self.uses_self(Right[1], bound)
+            case Not(Exp) | Negate(Exp) | IsVoid(Exp):
+                return self.uses_self(Exp[1], bound)
+            case _:
+                # constants and new
+                return False
+
     # recursively traverses expression and computes the temporaries
-    #   needed to cgen the exp.
-    # for example, each let binding needs room on the stack.
+    #   needed to cgen the exp: the most that are allocated at once (temporary_stack).
+    # each let binding needs room on the stack until the let ends, a case its value,
+    # + - and the tagged comparisons their left side while the right one is generated.
     # dont need to reserve room for function args, as they are pushed on the stack prior.
     def compute_max_stack_depth(self, exp) -> int:
-        return 4001
-        final_depth = 0
-        # pprint(exp)
+        depth = self.compute_max_stack_depth
         match exp:
             case Block(Body):
-                final_depth += max(self.compute_max_stack_depth(e[1]) for e in Body)
+                return max(depth(e[1]) for e in Body)
 
             case Let(Bindings, Body):
-                binding_depth = len(Bindings)
-                # recursively calculate depth of body while adding binding_depth
-                total_depth = binding_depth+ self.compute_max_stack_depth(Body[1])
-                final_depth += total_depth        
+                # binding i is initialized with the i before it stored
+                final_depth = len(Bindings) + depth(Body[1])
+                for i, binding in enumerate(Bindings):
+                    if isinstance(binding, Let_Init):
+                        final_depth = max(final_depth, i + depth(binding.Exp[1]))
+                return final_depth
 
             case Case(Exp,Elements):
-                # we dont actually need this
-                # depth = 1 # for exp
-                # total_depth = depth + len(Elements)
-                # final_depth += total_depth 
-                final_depth += 1
+                return max(depth(Exp[1]), 1 + max(depth(e.Body[1]) for e in Elements))
 
             case If(Predicate, Then, Else):
-                then_depth = self.compute_max_stack_depth(Then[1])
-                else_depth = self.compute_max_stack_depth(Else[1])
-                final_depth += max(then_depth, else_depth)
+                return max(depth(Predicate[1]), depth(Then[1]), depth(Else[1]))
 
             case While(Predicate,Body):
-                body_depth = self.compute_max_stack_depth(Body[1])
-                final_depth += body_depth
-
-            # case Dynamic_Dispatch(Body) | Static_Dispatch(Body) | Self_Dispatch(Body):
-            case Self_Dispatch(Args=Args) | Dynamic_Dispatch(Args=Args)| Static_Dispatch(Args=Args):
-                max_arg_depth = 0
-                # print(Args)
-                for arg in Args:
-                    # if the length is 1 then it is an identifier
-                    arg_depth = self.compute_max_stack_depth(arg[1])
-                    if arg_depth > max_arg_depth:
-                        max_arg_depth = arg_depth
-                final_depth += max_arg_depth
-            
-            case Plus(Left,Right) | Minus(Left,Right) | Times(Left,Right) | Divide(Left,Right):
-                final_depth += 1
-                final_depth += self.compute_max_stack_depth(Left[1]) 
-                final_depth += self.compute_max_stack_depth(Right[1]) 
+                return max(depth(Predicate[1]), depth(Body[1]))
 
-            case Negate(Exp): 
-                final_depth += self.compute_max_stack_depth(Exp[1]) 
+            case Self_Dispatch(Args=Args):
+                return max((depth(arg[1]) for arg in Args), default=0)
 
-            case _:
-                # print("Unhandled in stack analysis:", exp)
-                pass
+            case Dynamic_Dispatch(Exp=Exp, Args=Args) | Static_Dispatch(Exp=Exp, Args=Args):
+                return max(depth(e[1]) for e in [Exp, *Args])
+
+            case Plus(Left,Right) | Minus(Left,Right):
+                return max(depth(Left[1]), 1 + depth(Right[1]))
 
-        # we dont need this, we are already handling alignment in the built_in with andq
-        # 16 byte alignment
-        # if final_depth%2==0:
-        #     final_depth+=1 
+            case Lt(Left,Right) | Le(Left,Right) | Eq(Left,Right) if self.tagged and Left[1].StaticType in ("Int","Bool"):
+                return max(depth(Left[1]), 1 + depth(Right[1]))
 
-        return final_depth
+            # pushed instead
+            case Times(Left,Right) | Divide(Left,Right) | Lt(Left,Right) | Le(Left,Right) | Eq(Left,Right):
+                return max(depth(Left[1]), depth(Right[1]))
+
+            case Assign(Exp=Exp) | Not(Exp) | Negate(Exp) | IsVoid(Exp):
+                return depth(Exp[1])
+
+            case _:
+                # identifiers, constants, new, internal
+                return 0
                 
     def debug(self,reg):
         self.asm_instructions.append(ASM_Debug(reg))
@@ -1338,7 +2073,7 @@ class CoolAsmGen:
 
     def get_branch_label(self):
         self.branch_counter+=1
-        return f"branch_{self.branch_counter}"
+        return f"{self.label_namespace}branch_{self.branch_counter}"
         # return (str(uuid.uuid4()).replace("-",""))
 
     def get_parents(self,child):
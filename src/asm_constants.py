@@ -4,6 +4,26 @@ vtable_index = 2
 # attributes after this...
 attributes_start_index = 3
 
+# compact header (x86): the object is just its vtable pointer followed by the attributes,
+#   type tag and size are stored right before the vtable instead.
+compact_vtable_index = 0
+compact_attributes_start_index = 1
+vtable_type_tag_index = -2
+vtable_object_size_index = -1
+
+# tagged Int/Bool (x86): the value itself is the word, value << 2 | tag.
+#   objects are at least 8 byte aligned so their low bits are always 0.
+int_tag_bits = 1
+bool_tag_bits = 3
+
+# String internals (x86), after val
+string_len_offset = 1
+string_out_offset = 2
+
+# -profile counter table entries (x86): count, name, bytes
+profile_entry_size = 3
+profile_bytes_offset = 2
+
 # tags for builtins
 Bool_tag = 0
 Int_tag = 1
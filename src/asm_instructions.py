@@ -22,8 +22,15 @@ ASM_Add = namedtuple("ASM_Add", "left right")
 ASM_Sub = namedtuple("ASM_Sub", "left right")
 ASM_Mul = namedtuple("ASM_Mul", "left right")
 ASM_Div = namedtuple("ASM_Div", "left right")
+ASM_Wrap = namedtuple("ASM_Wrap", "reg") # reg <- low 32 bits of reg, sign extended (x86, boxed Ints)
+
+# tagged Int/Bool (x86)
+ASM_Tag = namedtuple("ASM_Tag", "reg tag") # reg <- (low 32 bits of reg) << 2 | tag
+ASM_Untag = namedtuple("ASM_Untag", "reg") # reg <- reg >> 2 (arithmetic)
+ASM_Vtable = namedtuple("ASM_Vtable", "dest src offset") # dest <- src[offset], or the Int/Bool vtable if src is tagged
 
 ASM_Jmp = namedtuple("ASM_Jmp", "label")
+ASM_Jmp_Reg = namedtuple("ASM_Jmp_Reg", "reg") # jump to address stored in register (tail calls)
 ASM_Bz = namedtuple("ASM_Bz", "reg label")
 ASM_Bnz = namedtuple("ASM_Bnz", "reg label")
 ASM_Beq = namedtuple("ASM_Beq", "left right label")
@@ -50,3 +57,13 @@ ASM_Constant_raw_string = namedtuple("ASM_Constant_raw_string", "string")
 ASM_Constant_label = namedtuple("ASM_Constant_label", "label")
 
 ASM_Syscall = namedtuple("ASM_Syscall", "name")
+
+# -profile (x86): label[offset] += amount
+ASM_Count = namedtuple("ASM_Count", "label offset amount")
+
+# x86: runtime error, line number in edi and jump to the runtime's shared stub for kind (coolerror_<kind>)
+ASM_Error = namedtuple("ASM_Error", "kind line")
+# x86: following code goes into section name (.text.unlikely for the error stubs)
+ASM_Section = namedtuple("ASM_Section", "name")
+# x86: pad to a 2^bits boundary, unless that takes more than max_skip bytes (None: always)
+ASM_Align = namedtuple("ASM_Align", "bits max_skip")
@@ -0,0 +1,196 @@
+import re
+import sys
+from collections import deque, namedtuple
+from ast_nodes import Internal
+
+# a constructor (method None) or a method, in the order they are emitted.
+Function = namedtuple("Function", "label cls method")
+
+# a call inside a loop counts this many times more, per loop (up to 3 loops deep).
+LOOP_WEIGHT = 10
+# static weights stop here (calls in loops in loops ... ).
+MAX_WEIGHT = 10 ** 12
+# the hottest functions that make up this much of the weight are aligned (and their loops).
+HOT_FRACTION = 0.9
+# the runtime calls these (main) or the code makes them without a new (literals, arithmetic).
+ROOTS = ["Main..new", "Main.main", "Int..new", "Bool..new", "String..new"]
+
+"""
+order of the constructors and methods in .text (x86).
+the parser records every dispatch and new in each function with how many loops it is in
+(AnnotatedAstReader.call_sites), that is the call graph: a dispatch on T can go to T.m or
+the m of any subclass, a static dispatch or a dispatch on self only to that class's own copy.
+a site weighs LOOP_WEIGHT^loops, functions and edges how often they run if every loop ran
+LOOP_WEIGHT times (weigh_static), functions that are not reachable from ROOTS never run.
+with a -profile run (profile, see Profile) functions weigh their counts instead and an
+edge the smaller count of its ends.
+functions are put in chains, heaviest edge first, caller before callee where it can (pettis
+and hansen), chains heaviest first. the hot ones get aligned to 16 bytes, functions that never
+run go last in .text.unlikely, with the error stubs.
+disabled (-source-order, cool-asm) it is just the constructors then the methods, as they come.
+"""
+class Layout:
+    def __init__(self, class_map, imp_map, parent_map, call_sites, profile=None, enabled=True):
+        self.profile = profile
+        self.enabled = enabled
+        self.functions = {}
+        for cls in class_map:
+            self.functions[f"{cls}..new"] = Function(f"{cls}..new", cls, None)
+        for cls, method in imp_map:
+            self.functions[f"{cls}.{method}"] = Function(f"{cls}.{method}", cls, method)
+        self.weights = {}
+        self.edges = {} # (caller, callee) -> weight
+        self.hot = set()
+        self.cold = set()
+        if not enabled:
+            self.order = list(self.functions.values())
+            return
+
+        children = {}
+        for child, parent in parent_map.items():
+            children.setdefault(parent, []).append(child)
+        subclasses = {}
+        def subclasses_of(cls):
+            if cls not in subclasses:
+                subclasses[cls] = [cls] + [sub for child in children.get(cls, []) for sub in subclasses_of(child)]
+            return subclasses[cls]
+
+        # internal methods are called by the label in their body (IO.out_string), see emit_vtables.
+        def method_label(cls, method):
+            imp = imp_map.get((cls, method))
+            if imp is None:
+                return None
+            if isinstance(imp[-1][1], Internal):
+                return imp[-1][1].Body
+            return f"{cls}.{method}"
+
+        for caller, sites in call_sites.items():
+            for kind, cls, method, loops in sites:
+                if kind == "new":
+                    callees = [f"{cls}..new"]
+                elif kind == "dispatch":
+                    callees = [method_label(sub, method) for sub in subclasses_of(cls)]
+                else:
+                    callees = [method_label(cls, method)]
+                for callee in callees:
+                    if callee in self.functions:
+                        edge = (caller, callee)
+                        self.edges[edge] = self.edges.get(edge, 0) + LOOP_WEIGHT ** min(loops, 3)
+
+        if profile is not None:
+            self.weigh_profile(profile)
+        else:
+            self.weigh_static()
+        self.order = self.chains()
+
+    # a root runs once, a function as often as the functions calling it times the weight of the calls,
+    # an edge weighs what it runs. calls back up the call stack (recursion) are left out so what is
+    # reachable from the roots is a dag, weighed in reverse postorder.
+    def weigh_static(self) -> None:
+        callees = {}
+        for (caller, callee), weight in self.edges.items():
+            callees.setdefault(caller, []).append((callee, weight))
+        postorder = []
+        seen = set()
+        for root in ROOTS:
+            if root not in self.functions or root in seen:
+                continue
+            seen.add(root)
+            stack = [(root, iter(callees.get(root, [])))]
+            while stack:
+                label, calls = stack[-1]
+                for callee, _ in calls:
+                    if callee not in seen:
+                        seen.add(callee)
+                        stack.append((callee, iter(callees.get(callee, []))))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(label)
+        order = postorder[::-1]
+        position = {label: i for i, label in enumerate(order)}
+        self.weights = {label: 1 if label in ROOTS else 0 for label in order}
+        for label in order:
+            for callee, weight in callees.get(label, []):
+                if position[callee] > position[label]:
+                    self.weights[callee] = min(self.weights[callee] + self.weights[label] * weight, MAX_WEIGHT)
+        self.edges = {(caller, callee): self.weights[caller] * weight
+                      for (caller, callee), weight in self.edges.items() if caller in self.weights}
+
+    def weigh_profile(self, counts) -> None:
+        self.weights = {label: count for label, count in counts.items() if label in self.functions and count > 0}
+        self.edges = {(caller, callee): min(self.weights[caller], self.weights[callee])
+                      for caller, callee in self.edges if caller in self.weights and callee in self.weights}
+
+    def chains(self) -> list:
+        index = {label: i for i, label in enumerate(self.functions)}
+        chain_of = {label: deque([label]) for label in self.weights}
+        for (caller, callee), _ in sorted(self.edges.items(), key=lambda e: (-e[1], index[e[0][0]], index[e[0][1]])):
+            first, second = chain_of[caller], chain_of[callee]
+            if first is second:
+                continue
+            # callee right after its caller if they are at the ends of their chains, or the other way around
+            if not (first[-1] == caller and second[0] == callee) and second[-1] == callee and first[0] == caller:
+                first, second = second, first
+            # the smaller chain is copied into the bigger one
+            if len(first) >= len(second):
+                first.extend(second)
+                merged, moved = first, second
+            else:
+                second.extendleft(reversed(first))
+                merged, moved = second, first
+            for label in moved:
+                chain_of[label] = merged
+        chains = {id(chain): chain for chain in chain_of.values()}.values()
+        chains = sorted(chains, key=lambda chain: (-sum(self.weights[label] for label in chain), min(index[label] for label in chain)))
+
+        by_weight = sorted(self.weights, key=lambda label: (-self.weights[label], index[label]))
+        total = sum(self.weights.values())
+        so_far = 0
+        for label in by_weight:
+            if so_far >= total * HOT_FRACTION:
+                break
+            self.hot.add(label)
+            so_far += self.weights[label]
+        self.cold = {label for label in self.functions if label not in self.weights}
+
+        order = [self.functions[label] for chain in chains for label in chain]
+        return order + [function for label, function in self.functions.items() if label in self.cold]
+
+    def is_hot(self, label) -> bool:
+        return label in self.hot
+
+    def is_cold(self, label) -> bool:
+        return label in self.cold
+
+    def report(self, outfile=sys.stderr) -> None:
+        source = "source order" if not self.enabled else \
+                 f"profile {self.profile.path}" if self.profile is not None else "static call graph"
+        outfile.write(f"===== function layout ({source}: {len(self.functions)} functions, {len(self.hot)} aligned, "
+                      f"{len(self.cold)} cold, {len(self.edges)} call edges) =====\n")
+        for function in self.order:
+            flags = "aligned" if function.label in self.hot else ".text.unlikely" if function.label in self.cold else ""
+            outfile.write(f"  {function.label:<40} {self.weights.get(function.label, 0):12} {flags}\n")
+
+class Profile(dict):
+    """
+    counts of a -profile run for -layout-profile=<file> (what the program printed on stderr):
+    calls per method by label, objects per class by constructor (C..new).
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        section = None
+        with open(path) as file:
+            for line in file:
+                if line.startswith("===="):
+                    section = line.strip("= \n")
+                    continue
+                match = re.match(r"\s*(\d+)\s+(\S+)", line)
+                if match is None:
+                    continue
+                count, name = int(match.group(1)), match.group(2)
+                if section == "calls per method":
+                    self[name] = count
+                elif section == "objects per class":
+                    self[f"{name}..new"] = count
@@ -9,4 +9,8 @@ ra is for cool return shenanigans
 self_reg = "r0"
 acc_reg = "r1"  # result of expressions are always in accumulator
 temp_reg = "r2"
-temp2_reg = "r3"
\ No newline at end of file
+temp2_reg = "r3"
+
+# register calling convention: first arguments of a dispatch.
+# receiver is passed in the accumulator.
+arg_regs = ["r4", "r5", "r6", "r7"]
@@ -1,7 +1,9 @@
+import hashlib
+
 class StringToLabel:
     def __init__(self,class_map):
         self.string_to_label = {}
-        self.string_to_label_counter = 0
+        self.label_to_string = {}
 
     def get_dict_sorted(self):
         return dict(sorted(self.string_to_label.items()))
@@ -9,10 +11,13 @@ class StringToLabel:
     def get(self,val):
         return self.string_to_label[val]
 
+    # the label comes from the string itself, so it is the same in every program
+    # and a cached method (-cache) can refer to it.
     def insert(self,string):
         if string in self.string_to_label:
             return
-        else:
-            self.string_to_label_counter += 1
-            self.string_to_label[string] = f"string{self.string_to_label_counter}"
-
+        label = f"string_{hashlib.sha1(string.encode()).hexdigest()[:16]}"
+        if label in self.label_to_string:
+            raise Exception(f"string label {label} for both {self.label_to_string[label]!r} and {string!r}")
+        self.string_to_label[string] = label
+        self.label_to_string[label] = string
@@ -3,37 +3,60 @@ from asm_registers import *
 from asm_constants import *
 
 
+# same decoding cooloutstr does at runtime, only \n and \t are escapes.
+def decode_escapes(string:str)->str:
+    decoded = []
+    i = 0
+    while i < len(string):
+        if string[i] == "\\" and string[i+1:i+2] == "n":
+            decoded.append("\n")
+            i += 2
+        elif string[i] == "\\" and string[i+1:i+2] == "t":
+            decoded.append("\t")
+            i += 2
+        else:
+            decoded.append(string[i])
+            i += 1
+    return "".join(decoded)
+
+# label points to the raw string (what length, substr, concat and comparisons see).
+# for x86, label..out is the decoded string with its byte length in front,
+#   so printing it is a single copy.
+#   the raw length is right before label (label[-1]), type_name reads it from there.
+def emit_string_constant(asm_instructions: list, label:str, string:str, x86:bool)->None:
+    if x86:
+        decoded = decode_escapes(string)
+        asm_instructions.append(ASM_Label(f"{label}..out"))
+        asm_instructions.append(ASM_Constant_integer(len(decoded)))
+        asm_instructions.append(ASM_Constant_raw_string(decoded))
+        asm_instructions.append(ASM_Constant_integer(len(string)))
+
+    asm_instructions.append(ASM_Label(label))
+    asm_instructions.append(ASM_Constant_raw_string(string))
 
-def emit_string_constants(asm_instructions: list, x86:bool, string_label:dict)->None:
-    asm_instructions.append(ASM_Label("the.empty.string"))
-    asm_instructions.append(ASM_Constant_raw_string(""))
-
-    asm_instructions.append(ASM_Label("cool_abort"))
-    asm_instructions.append(ASM_Constant_raw_string("abort\\n"))
 
-    asm_instructions.append(ASM_Label("substr_bad"))
-    asm_instructions.append(ASM_Constant_raw_string("ERROR: 0: Exception: String.substr out of range\\n"))
+def emit_string_constants(asm_instructions: list, x86:bool, string_label:dict)->None:
+    emit_string_constant(asm_instructions,"the.empty.string","",x86)
+    emit_string_constant(asm_instructions,"cool_abort","abort\\n",x86)
+    if not x86:
+        # x86 prints it from the runtime (coolerror_substr)
+        emit_string_constant(asm_instructions,"substr_bad","ERROR: 0: Exception: String.substr out of range\\n",x86)
 
     for string,label in string_label.items():
-        asm_instructions.append(ASM_Label(label))
-        asm_instructions.append(ASM_Constant_raw_string(string))
+        emit_string_constant(asm_instructions,label,string,x86)
 
 
 # could have been in string constants but whatever
-def emit_dispatch_on_void(asm_instructions: list,line_number:int)->None:
-    asm_instructions.append(ASM_Label(f"dispatch_void_string_{line_number}"))
-    asm_instructions.append(ASM_Constant_raw_string(f"ERROR: {line_number}: Exception: dispatch on void\\n"))
+# (cool-asm only, x86 prints these from one template in the runtime, see emit_error_stubs)
+def emit_dispatch_on_void(asm_instructions: list,line_number:int,x86:bool=False)->None:
+    emit_string_constant(asm_instructions,f"dispatch_void_string_{line_number}",f"ERROR: {line_number}: Exception: dispatch on void\\n",x86)
 
-def emit_case_on_void(asm_instructions: list,line_number:int)->None:
-    asm_instructions.append(ASM_Label(f"case_void_string_{line_number}"))
-    asm_instructions.append(ASM_Constant_raw_string(f"ERROR: {line_number}: Exception: case on void\\n"))
+def emit_case_on_void(asm_instructions: list,line_number:int,x86:bool=False)->None:
+    emit_string_constant(asm_instructions,f"case_void_string_{line_number}",f"ERROR: {line_number}: Exception: case on void\\n",x86)
 
-def emit_case_without_branch(asm_instructions: list,line_number:int,exp_type:str)->None:
+def emit_case_without_branch(asm_instructions: list,line_number:int,exp_type:str,x86:bool=False)->None:
     # print(exp)
-    asm_instructions.append(ASM_Label(f"case_without_branch_string_{line_number}_{exp_type}"))
-
-    asm_instructions.append(ASM_Constant_raw_string(f"ERROR: {line_number}: Exception: case without matching branch\\n"))
+    emit_string_constant(asm_instructions,f"case_without_branch_string_{line_number}_{exp_type}",f"ERROR: {line_number}: Exception: case without matching branch\\n",x86)
 
-def emit_divide_by_zero(asm_instructions: list,line_number:int)->None:
-    asm_instructions.append(ASM_Label(f"divide_by_zero_string_{line_number}"))
-    asm_instructions.append(ASM_Constant_raw_string(f"ERROR: {line_number}: Exception: division by zero\\n"))
+def emit_divide_by_zero(asm_instructions: list,line_number:int,x86:bool=False)->None:
+    emit_string_constant(asm_instructions,f"divide_by_zero_string_{line_number}",f"ERROR: {line_number}: Exception: division by zero\\n",x86)
@@ -2,20 +2,32 @@ class TemporaryStack:
     def __init__(self):
         # each element contains index for temporary.
         self.stack = [] 
+        # first index and the lowest one handed out, per scope.
+        self.starts = []
+        self.lowest = []
 
-    def push_scope(self):
-        self.stack.append(0)
+    # start is the first fp offset handed out, grows downwards.
+    def push_scope(self, start=0):
+        self.stack.append(start)
+        self.starts.append(start)
+        self.lowest.append(start + 1)
 
     def pop_scope(self):
         # print(self.stack)
         self.stack.pop()
+        self.starts.pop()
+        self.lowest.pop()
 
     # use up a slot in the temporaries
     def allocate_temp(self) -> int:
         retval = self.stack[-1]
         self.stack[-1] -= 1
+        self.lowest[-1] = min(self.lowest[-1], retval)
         return retval 
 
     def free_temp(self):
         self.stack[-1] += 1
 
+    # most temporaries that were in use at once in this scope, what its frame needs room for.
+    def max_used(self) -> int:
+        return self.starts[-1] - self.lowest[-1] + 1
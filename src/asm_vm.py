@@ -0,0 +1,339 @@
+import sys
+from collections import Counter
+from asm import CoolAsmGen
+from asm_instructions import *
+from asm_strings import decode_escapes
+
+"""
+runs the cool-asm that CoolAsmGen (x86=False) emits, without cool --profile or gcc.
+
+    python3 asm_vm.py file.cl-type [-stats] [-no-opt] < input
+
+memory is one list of words:
+    [0, stack_words)            stack, sp starts at the top and grows down
+    then the program            one word per instruction / constant (labels take no room)
+    then the heap               alloc appends to the end
+a word is an int (values, addresses) or a str (string constants and the strings
+the String syscalls make, a raw string value is the address of one of those).
+
+counts every instruction it runs, by opcode and by method (the last method/constructor
+label before it), and adds up cycles with the cost model in CYCLES.
+only the cool-asm output runs here, CoolAsmGen turns the x86 modes (regcall, tco, compact,
+tagged, layout) off without x86, so what can be compared in process is cool-asm codegen (opt):
+    vm = CoolAsmVM(CoolAsmGen(file, opt=False).get_asm())
+    vm.run(stdin, stdout)
+    vm.instructions, vm.cycles, vm.by_opcode, vm.by_method
+loads, stores, pops and jumps through registers are bounds checked, a bad one is a CoolAsmError.
+difftest.py --vm runs the tests with it.
+"""
+
+# opcodes of the decoded program
+(LI, MOV, ADD, SUB, MUL, DIV, JMP, JMP_REG, BZ, BNZ, BEQ, BLT, BLE, CALL, CALL_REG,
+ RETURN, PUSH, POP, LD, ST, LA, ALLOC, SYSCALL, CONSTANT) = range(24)
+
+OPCODE_NAMES = ["li", "mov", "add", "sub", "mul", "div", "jmp", "jmp", "bz", "bnz", "beq", "blt", "ble",
+                "call", "call", "return", "push", "pop", "ld", "st", "la", "alloc", "syscall", "constant"]
+
+# rough cost of each opcode, close enough to compare two versions of the same program.
+# memory is slower than registers, calls and allocation are slower than that.
+CYCLES = {
+    "li": 1, "mov": 1, "add": 1, "sub": 1, "mul": 3, "div": 20,
+    "jmp": 1, "bz": 1, "bnz": 1, "beq": 1, "blt": 1, "ble": 1,
+    "call": 2, "return": 2, "push": 2, "pop": 2, "ld": 2, "st": 2, "la": 1,
+    "alloc": 20, "syscall": 50,
+}
+
+REGISTERS = {"r0": 0, "r1": 1, "r2": 2, "r3": 3, "r4": 4, "r5": 5, "r6": 6, "r7": 7, "sp": 8, "fp": 9, "ra": 10}
+SP = REGISTERS["sp"]
+
+class CoolAsmError(Exception):
+    pass
+
+def int32(value):
+    return (value + 2**31) % 2**32 - 2**31
+
+class CoolAsmVM:
+    def __init__(self, asm_instructions, stack_words=1 << 20):
+        self.stack_words = stack_words
+        self.decode(asm_instructions)
+
+    # cool-asm namedtuples -> (opcode, a, b, c) tuples with registers as indices and labels as addresses.
+    def decode(self, asm_instructions) -> None:
+        self.labels = {}
+        body = []
+        for instr in asm_instructions:
+            match instr:
+                case ASM_Label(label):
+                    self.labels[label] = self.stack_words + len(body)
+                case ASM_Comment() | ASM_Debug():
+                    pass
+                case _:
+                    body.append(instr)
+
+        # constructors, methods and the comparison handlers, for the per method counts.
+        entry_labels = {label for label in self.labels if "." in label or label.endswith("_handler") or label == "start"}
+        address_to_entry = {address: label for label, address in self.labels.items() if label in entry_labels}
+
+        self.program = []
+        self.method_of = []
+        method = "start"
+        for index, instr in enumerate(body):
+            method = address_to_entry.get(self.stack_words + index, method)
+            self.method_of.append(method)
+            self.program.append(self.decode_instr(instr))
+
+    def decode_instr(self, instr) -> tuple:
+        reg = REGISTERS.__getitem__
+        match instr:
+            case ASM_Li(r, imm):
+                return (LI, reg(r), int(imm.value))
+            case ASM_Mov(dest, src):
+                return (MOV, reg(dest), reg(src))
+            case ASM_Add(left, right):
+                return (ADD, reg(left), reg(right))
+            case ASM_Sub(left, right):
+                return (SUB, reg(left), reg(right))
+            case ASM_Mul(left, right):
+                return (MUL, reg(left), reg(right))
+            case ASM_Div(left, right):
+                return (DIV, reg(left), reg(right))
+            case ASM_Jmp(label):
+                return (JMP, self.address(label))
+            case ASM_Jmp_Reg(r):
+                return (JMP_REG, reg(r))
+            case ASM_Bz(r, label):
+                return (BZ, reg(r), self.address(label))
+            case ASM_Bnz(r, label):
+                return (BNZ, reg(r), self.address(label))
+            case ASM_Beq(left, right, label):
+                return (BEQ, reg(left), reg(right), self.address(label))
+            case ASM_Blt(left, right, label):
+                return (BLT, reg(left), reg(right), self.address(label))
+            case ASM_Ble(left, right, label):
+                return (BLE, reg(left), reg(right), self.address(label))
+            case ASM_Call_Label(label):
+                return (CALL, self.address(label))
+            case ASM_Call_Reg(r):
+                return (CALL_REG, reg(r))
+            case ASM_Return():
+                return (RETURN,)
+            case ASM_Push(r):
+                return (PUSH, reg(r))
+            case ASM_Pop(r):
+                return (POP, reg(r))
+            case ASM_Ld(dest, src, offset):
+                return (LD, reg(dest), reg(src), offset)
+            case ASM_St(dest, src, offset):
+                return (ST, reg(dest), reg(src), offset)
+            case ASM_La(r, label):
+                return (LA, reg(r), self.address(label))
+            case ASM_Alloc(dest, src):
+                return (ALLOC, reg(dest), reg(src))
+            case ASM_Syscall(name):
+                return (SYSCALL, name)
+            case ASM_Constant_integer(value):
+                return (CONSTANT, int(value))
+            case ASM_Constant_raw_string(string):
+                return (CONSTANT, string)
+            case ASM_Constant_label(label):
+                return (CONSTANT, self.address(label))
+            case _:
+                raise CoolAsmError(f"cool-asm vm: cannot run {instr}")
+
+    def address(self, label) -> int:
+        if label not in self.labels:
+            raise CoolAsmError(f"cool-asm vm: undefined label {label}")
+        return self.labels[label]
+
+    def run(self, stdin=None, stdout=None) -> int:
+        stdin = stdin or sys.stdin.buffer
+        stdout = stdout or sys.stdout.buffer
+        self.stdin = stdin
+        self.stdout = stdout
+        self.output = []
+
+        base = self.stack_words
+        program = self.program
+        # constants are readable (vtables, strings), instructions read as 0.
+        mem = [0] * base + [instr[1] if instr[0] == CONSTANT else 0 for instr in program]
+        self.mem = mem
+        regs = [0] * len(REGISTERS)
+        regs[SP] = base - 1
+        executed = [0] * len(program)
+
+        pc = self.address("start") - base
+        try:
+            while True:
+                instr = program[pc]
+                executed[pc] += 1
+                op = instr[0]
+                pc += 1
+                if op == LD:
+                    address = regs[instr[2]] + instr[3]
+                    if not 0 <= address < len(mem):
+                        raise CoolAsmError(f"cool-asm vm: ld from {address} at {pc - 1 + base}")
+                    regs[instr[1]] = mem[address]
+                elif op == ST:
+                    address = regs[instr[1]] + instr[3]
+                    if not 0 <= address < len(mem):
+                        raise CoolAsmError(f"cool-asm vm: st to {address} at {pc - 1 + base}")
+                    mem[address] = regs[instr[2]]
+                elif op == MOV:
+                    regs[instr[1]] = regs[instr[2]]
+                elif op == LI:
+                    regs[instr[1]] = instr[2]
+                elif op == PUSH:
+                    if regs[SP] < 0:
+                        raise CoolAsmError("cool-asm vm: stack overflow")
+                    mem[regs[SP]] = regs[instr[1]]
+                    regs[SP] -= 1
+                elif op == POP:
+                    regs[SP] += 1
+                    if regs[SP] >= base:
+                        raise CoolAsmError(f"cool-asm vm: pop from an empty stack at {pc - 1 + base}")
+                    regs[instr[1]] = mem[regs[SP]]
+                elif op == BEQ:
+                    if regs[instr[1]] == regs[instr[2]]:
+                        pc = instr[3] - base
+                elif op == BZ:
+                    if regs[instr[1]] == 0:
+                        pc = instr[2] - base
+                elif op == BNZ:
+                    if regs[instr[1]] != 0:
+                        pc = instr[2] - base
+                elif op == JMP:
+                    pc = instr[1] - base
+                elif op == CALL:
+                    regs[10] = pc + base
+                    pc = instr[1] - base
+                elif op == CALL_REG:
+                    regs[10] = pc + base
+                    pc = regs[instr[1]] - base
+                    if not 0 <= pc < len(program):
+                        raise CoolAsmError(f"cool-asm vm: jump to {pc + base}, outside the program")
+                elif op == RETURN:
+                    pc = regs[10] - base
+                    if not 0 <= pc < len(program):
+                        raise CoolAsmError(f"cool-asm vm: jump to {pc + base}, outside the program")
+                elif op == JMP_REG:
+                    pc = regs[instr[1]] - base
+                    if not 0 <= pc < len(program):
+                        raise CoolAsmError(f"cool-asm vm: jump to {pc + base}, outside the program")
+                elif op == LA:
+                    regs[instr[1]] = instr[2]
+                elif op == ADD:
+                    regs[instr[2]] = int32(regs[instr[2]] + regs[instr[1]])
+                elif op == SUB:
+                    regs[instr[2]] = int32(regs[instr[2]] - regs[instr[1]])
+                elif op == MUL:
+                    regs[instr[2]] = int32(regs[instr[2]] * regs[instr[1]])
+                elif op == DIV:
+                    left, right = regs[instr[2]], regs[instr[1]]
+                    # rounds towards 0 like idivl
+                    quotient = abs(left) // abs(right)
+                    regs[instr[2]] = int32(quotient if (left < 0) == (right < 0) else -quotient)
+                elif op == BLT:
+                    if regs[instr[1]] < regs[instr[2]]:
+                        pc = instr[3] - base
+                elif op == BLE:
+                    if regs[instr[1]] <= regs[instr[2]]:
+                        pc = instr[3] - base
+                elif op == ALLOC:
+                    size = regs[instr[2]]
+                    regs[instr[1]] = len(mem)
+                    mem.extend([0] * size)
+                elif op == SYSCALL:
+                    if instr[1] == "exit":
+                        break
+                    self.syscall(instr[1], regs)
+                else:
+                    raise CoolAsmError(f"cool-asm vm: ran into constant data at {pc - 1 + base}")
+        except IndexError:
+            # a syscall reading a string or object that is not there
+            raise CoolAsmError(f"cool-asm vm: bad address at {pc - 1 + base}") from None
+        finally:
+            stdout.write("".join(self.output).encode("latin-1"))
+            stdout.flush()
+            self.count(executed)
+
+        return 0
+
+    def syscall(self, name, regs) -> None:
+        mem = self.mem
+        match name:
+            case "IO.out_string":
+                self.output.append(decode_escapes(mem[regs[1]]))
+            case "IO.out_int":
+                self.output.append(str(regs[1]))
+            case "IO.in_int":
+                regs[1] = self.read_int()
+            case "IO.in_string":
+                line = self.read_line()
+                regs[1] = self.new_string("" if "\0" in line else line)
+            case "String.length":
+                regs[1] = len(mem[regs[1]])
+            case "String.concat":
+                regs[1] = self.new_string(mem[regs[1]] + mem[regs[2]])
+            case "String.substr":
+                string, i, l = mem[regs[0]], regs[1], regs[2]
+                if i < 0 or l < 0 or i + l > len(string):
+                    regs[1] = 0
+                else:
+                    regs[1] = self.new_string(string[i:i + l])
+            case _:
+                raise CoolAsmError(f"cool-asm vm: unknown syscall {name}")
+
+    def new_string(self, string) -> int:
+        self.mem.append(string)
+        return len(self.mem) - 1
+
+    def read_line(self) -> str:
+        # in_int/in_string block for input, so anything printed before (prompts) goes out first.
+        self.stdout.write("".join(self.output).encode("latin-1"))
+        self.output = []
+        line = self.stdin.readline().decode("latin-1")
+        return line[:-1] if line.endswith("\n") else line
+
+    # same as coolinint: leading whitespace, a sign, digits. anything out of range is 0.
+    def read_int(self) -> int:
+        line = self.read_line().lstrip(" \t\v\f\r")
+        negative = line[:1] == "-"
+        if line[:1] in ("-", "+"):
+            line = line[1:]
+        digits = ""
+        for char in line:
+            if not char.isdigit():
+                break
+            digits += char
+        value = -int(digits or "0") if negative else int(digits or "0")
+        return value if -2**31 <= value < 2**31 else 0
+
+    def count(self, executed) -> None:
+        self.by_opcode = Counter()
+        self.by_method = Counter()
+        for index, times in enumerate(executed):
+            if times:
+                self.by_opcode[OPCODE_NAMES[self.program[index][0]]] += times
+                self.by_method[self.method_of[index]] += times
+        self.instructions = sum(self.by_opcode.values())
+        self.cycles = sum(CYCLES.get(op, 1) * times for op, times in self.by_opcode.items())
+
+    def report(self, outfile=sys.stderr, top_methods=15) -> None:
+        outfile.write(f"===== {self.instructions} instructions, {self.cycles} cycles =====\n")
+        for op, times in self.by_opcode.most_common():
+            outfile.write(f"  {op:<10} {times:12}\n")
+        outfile.write(f"===== by method =====\n")
+        for method, times in self.by_method.most_common(top_methods):
+            outfile.write(f"  {method:<30} {times:12}\n")
+
+if __name__ == "__main__":
+    args = sys.argv[2:]
+    asm = CoolAsmGen(file=sys.argv[1], opt="-no-opt" not in args).get_asm()
+    vm = CoolAsmVM(asm)
+    try:
+        vm.run()
+    except CoolAsmError as error:
+        sys.exit(str(error))
+    finally:
+        if "-stats" in args:
+            vm.report()
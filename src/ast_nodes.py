@@ -48,4 +48,7 @@ Let_Init = namedtuple("Let_Init", "Var Type Exp")
 Case = namedtuple("Case", "Exp Elements StaticType")
 Case_element = namedtuple("Case_element", "Var Type Body StaticType")
 
-Internal = namedtuple("Internal", "Body StaticType")
\ No newline at end of file
+Internal = namedtuple("Internal", "Body StaticType")
+
+# method body not parsed yet, AnnotatedAstReader.read_body reads it from Offset in the file.
+Deferred_Body = namedtuple("Deferred_Body", "Offset StaticType")
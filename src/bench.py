@@ -0,0 +1,397 @@
+# benchmark runner for tests/benchmarks.
+#
+#   python3 src/bench.py run [-n 5] [-o results.json] [--perf] [benchmark ...]
+#   python3 src/bench.py compare baseline.json results.json [--threshold 0.05]
+#   python3 src/bench.py scale [--knob classes] [--sizes 25,50,100,200] [--max-exponent 1.3] [--max-line-exponent 1.7]
+#
+# run: .cl -> .cl-type (cool --type, unless the .cl-type is already there) -> X86Gen -> gcc
+# (linked with the prebuilt runtime archive, --inline-runtime puts it in the .s like main.py),
+# then runs every benchmark n times with its .input (nothing on stdin if it has none).
+# records wall time, user/sys cpu, max rss (of just the benchmark, see SPAWN_C), a hash of
+# the output and perf stat counters if perf is installed.
+# compare: flags benchmarks whose median wall/cpu time or max rss got worse than threshold,
+# or whose output changed. exits 1 if there is a regression.
+# scale: compiles cl_type_gen.py programs of growing size (one knob at a time), measures X86Gen's
+# time and peak rss on each and fits time = a * instrs^k (same for memory), instrs being the
+# cool-asm instructions emitted, and time = a * lines^k against the .cl-type. a k above
+# --max-exponent means something in the compiler is worse than linear in the code it emits,
+# above --max-line-exponent that it emits too much code for its input (quadratic), exits 1 then.
+
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from x86 import X86Gen
+from cl_type_gen import ClTypeGen
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(SRC_DIR, "..", "tests", "benchmarks")
+
+PERF_EVENTS = "cycles,instructions,branch-misses,cache-misses,page-faults"
+
+# measured per run, compared by median.
+METRICS = ["wall", "user", "sys", "max_rss_kb"]
+
+
+def find_benchmarks(names):
+    benchmarks = sorted(os.path.splitext(os.path.basename(cl))[0] for cl in glob.glob(os.path.join(BENCH_DIR, "*.cl")))
+    if names:
+        missing = [name for name in names if name not in benchmarks]
+        if missing:
+            sys.exit(f"no such benchmark: {', '.join(missing)}")
+        return names
+    return benchmarks
+
+
+def build(name, workdir, frontend, args):
+    cl = os.path.join(BENCH_DIR, f"{name}.cl")
+    cl_type = os.path.join(workdir, f"{name}.cl-type")
+
+    if os.path.exists(cl + "-type"):
+        shutil.copy(cl + "-type", cl_type)
+    else:
+        shutil.copy(cl, workdir)
+        subprocess.run(shlex.split(frontend) + [os.path.join(workdir, f"{name}.cl")], check=True)
+
+    start = time.perf_counter()
+    gen = X86Gen(cl_type, opt=False, **args)
+    compile_time = time.perf_counter() - start
+
+    exe = os.path.join(workdir, name)
+    runtime = [gen.runtime] if gen.runtime else []
+    subprocess.run(["gcc", "-no-pie", "-static", cl_type.replace(".cl-type", ".s"), *runtime, "-o", exe], check=True)
+    return exe, compile_time
+
+
+# a child forked (or vforked) from python starts out with python's max rss, and exec keeps it,
+# so the benchmark is forked from this small program instead.
+# usage: spawn <stats file> <exe>, writes "wall user sys maxrss exit" for the exe.
+SPAWN_C = r"""
+#include <stdio.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+
+int main(int argc, char **argv) {
+    struct timespec start, end;
+    struct rusage usage;
+    int status;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    pid_t pid = fork();
+    if (pid == 0) {
+        execv(argv[2], argv + 2);
+        _exit(127);
+    }
+    wait4(pid, &status, 0, &usage);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    FILE *stats = fopen(argv[1], "w");
+    fprintf(stats, "%f %f %f %ld %d\n",
+            (end.tv_sec - start.tv_sec) + (end.tv_nsec - start.tv_nsec) / 1e9,
+            usage.ru_utime.tv_sec + usage.ru_utime.tv_usec / 1e6,
+            usage.ru_stime.tv_sec + usage.ru_stime.tv_usec / 1e6,
+            usage.ru_maxrss,
+            WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status));
+    fclose(stats);
+    return 0;
+}
+"""
+
+
+def build_spawn(workdir):
+    source = os.path.join(workdir, "spawn.c")
+    with open(source, "w") as file:
+        file.write(SPAWN_C)
+    spawn = os.path.join(workdir, "spawn")
+    subprocess.run(["gcc", "-O2", "-static", source, "-o", spawn], check=True)
+    return spawn
+
+
+def run_once(spawn, exe, input_file, out_path):
+    stats_path = out_path + ".stats"
+    stdin = open(input_file) if input_file else subprocess.DEVNULL
+    try:
+        with open(out_path, "wb") as out:
+            subprocess.run([spawn, stats_path, exe], stdin=stdin, stdout=out, stderr=subprocess.STDOUT, check=True)
+    finally:
+        if input_file:
+            stdin.close()
+
+    with open(stats_path) as file:
+        wall, user, sys_time, max_rss, exit_code = file.read().split()
+    with open(out_path, "rb") as out:
+        digest = hashlib.sha1(out.read()).hexdigest()
+
+    return {
+        "wall": float(wall),
+        "user": float(user),
+        "sys": float(sys_time),
+        # linux reports ru_maxrss in kilobytes
+        "max_rss_kb": int(max_rss),
+        "exit": int(exit_code),
+        "output_sha1": digest,
+    }
+
+
+def perf_stat(exe, input_file, workdir):
+    perf_out = os.path.join(workdir, "perf.txt")
+    stdin = open(input_file) if input_file else subprocess.DEVNULL
+    try:
+        subprocess.run(["perf", "stat", "-x", ",", "-e", PERF_EVENTS, "-o", perf_out, exe],
+                       stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    finally:
+        if input_file:
+            stdin.close()
+
+    counters = {}
+    if not os.path.exists(perf_out):
+        return counters
+    with open(perf_out) as file:
+        for line in file:
+            fields = line.strip().split(",")
+            # value,unit,event,...  (value is "<not supported>" if the event is not there)
+            if len(fields) >= 3 and fields[0].replace(".", "").isdigit():
+                counters[fields[2]] = float(fields[0])
+    return counters
+
+
+def bench(name, runs, use_perf, frontend, args, spawn):
+    input_file = os.path.join(BENCH_DIR, f"{name}.input")
+    if not os.path.exists(input_file):
+        input_file = None
+
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        exe, compile_time = build(name, workdir, frontend, args)
+        out_path = os.path.join(workdir, "out.txt")
+
+        # first run is a warmup (page cache, etc), not recorded.
+        run_once(spawn, exe, input_file, out_path)
+        samples = [run_once(spawn, exe, input_file, out_path) for _ in range(runs)]
+
+        result = {
+            "input": os.path.basename(input_file) if input_file else None,
+            "compile_time": compile_time,
+            "runs": samples,
+            "exit": samples[0]["exit"],
+            "output_sha1": samples[0]["output_sha1"],
+        }
+        for metric in METRICS:
+            values = [sample[metric] for sample in samples]
+            result[metric] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+        if use_perf:
+            result["perf"] = perf_stat(exe, input_file, workdir)
+
+    return result
+
+
+def cmd_run(opts):
+    use_perf = opts.perf and shutil.which("perf") is not None
+    if opts.perf and not use_perf:
+        print("perf not found, skipping counters", file=sys.stderr)
+
+    args = {"regcall": not opts.stack_calls, "compact": not opts.full_header, "tagged": not opts.boxed,
+            "extern_runtime": not opts.inline_runtime, "layout": not opts.source_order}
+
+    results = {
+        "runs": opts.n,
+        "flags": args,
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        spawn = build_spawn(workdir)
+        for name in find_benchmarks(opts.benchmarks):
+            result = bench(name, opts.n, use_perf, opts.frontend, args, spawn)
+            results["benchmarks"][name] = result
+            print(f"{name:24} wall {result['wall']['median']:8.4f}s  user {result['user']['median']:8.4f}s  "
+                  f"sys {result['sys']['median']:8.4f}s  rss {result['max_rss_kb']['median']:8}kb  exit {result['exit']}")
+
+    with open(opts.o, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"wrote {opts.o}")
+
+
+def cmd_compare(opts):
+    with open(opts.baseline) as file:
+        baseline = json.load(file)["benchmarks"]
+    with open(opts.results) as file:
+        results = json.load(file)["benchmarks"]
+
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:24} (not in baseline)")
+            continue
+        base = baseline[name]
+
+        notes = []
+        for metric in METRICS:
+            old = base[metric]["median"]
+            new = result[metric]["median"]
+            # tiny times are all noise.
+            if metric != "max_rss_kb" and max(old, new) < opts.min_time:
+                continue
+            change = (new - old) / old if old else 0.0
+            if change > opts.threshold:
+                notes.append(f"{metric} +{change * 100:.1f}%")
+        if result["output_sha1"] != base["output_sha1"] or result["exit"] != base["exit"]:
+            notes.append("output changed")
+
+        if notes:
+            regressions += 1
+            print(f"{name:24} REGRESSION: {', '.join(notes)}")
+        else:
+            change = (result["wall"]["median"] - base["wall"]["median"]) / base["wall"]["median"] if base["wall"]["median"] else 0.0
+            print(f"{name:24} ok (wall {change * 100:+.1f}%)")
+
+    sys.exit(1 if regressions else 0)
+
+
+# each size is compiled in a fresh interpreter so its peak rss is just that compile.
+# prints json: compile time and peak rss, or with "traced" the peak of python allocations
+# during the compile (tracemalloc, slow so it is a separate run). the fit uses the traced peak,
+# peak rss includes python itself and doesn't go below what the imports took.
+# also the number of cool-asm instructions emitted, the work the fit is against.
+SCALE_CHILD = r"""
+import json, resource, sys, time, tracemalloc
+from x86 import X86Gen
+traced = sys.argv[3] == "traced"
+if traced:
+    tracemalloc.start()
+start = time.perf_counter()
+gen = X86Gen(sys.argv[1], opt=False, **json.loads(sys.argv[2]))
+elapsed = time.perf_counter() - start
+if traced:
+    print(json.dumps({"traced_kb": tracemalloc.get_traced_memory()[1] // 1024}))
+else:
+    print(json.dumps({"time": elapsed, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      "instructions": gen.instructions}))
+"""
+
+
+def scale_child(cl_type, args, mode):
+    child = subprocess.run([sys.executable, "-c", SCALE_CHILD, cl_type, json.dumps(args), mode],
+                           cwd=SRC_DIR, stdout=subprocess.PIPE, check=True)
+    return json.loads(child.stdout)
+
+
+# least squares fit of log y = log a + k log x, returns (a, k).
+def fit_power(xs, ys):
+    points = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    k = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else 0.0
+    return math.exp(mean_y - k * mean_x), k
+
+
+def cmd_scale(opts):
+    args = {"regcall": not opts.stack_calls, "compact": not opts.full_header, "tagged": not opts.boxed}
+    sizes = [int(size) for size in opts.sizes.split(",")]
+    knob = opts.knob.replace("-", "_")
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bench-scale-") as workdir:
+        for size in sizes:
+            cl_type = os.path.join(workdir, f"{knob}-{size}.cl-type")
+            lines = ClTypeGen(**{knob: size}, seed=opts.seed).write(cl_type)
+            samples = [scale_child(cl_type, args, "timed") for _ in range(opts.n)]
+            row = {
+                opts.knob: size,
+                "lines": lines,
+                "instructions": samples[0]["instructions"],
+                "time": min(sample["time"] for sample in samples),
+                "rss_kb": max(sample["rss_kb"] for sample in samples),
+                "traced_kb": scale_child(cl_type, args, "traced")["traced_kb"],
+            }
+            rows.append(row)
+            print(f"{opts.knob} {size:6}  {lines:9} lines  {row['instructions']:9} instrs  {row['time']:8.3f}s  "
+                  f"{row['time'] / row['instructions'] * 1e6:7.2f} us/instr  peak rss {row['rss_kb']:8}kb  "
+                  f"python peak {row['traced_kb']:8}kb  {row['traced_kb'] * 1024 / lines:6.0f} bytes/line")
+
+    # against the code emitted and against the lines read. the programs themselves grow faster
+    # than their .cl-type (every case tests every class, vtables are classes * methods), so a
+    # linear compiler is superlinear in lines, that is what --max-line-exponent allows for. the
+    # per instruction fit catches the compiler getting worse, the per line one the code it
+    # emits blowing up (which the per instruction fit can not see).
+    lines = [row["lines"] for row in rows]
+    instructions = [row["instructions"] for row in rows]
+    fits = {}
+    for x_name, xs in (("lines", lines), ("instrs", instructions)):
+        time_a, time_k = fit_power(xs, [row["time"] for row in rows])
+        rss_a, rss_k = fit_power(xs, [row["traced_kb"] for row in rows])
+        fits[x_name] = {"time": time_k, "memory": rss_k}
+        print(f"time   ~ {time_a:.3g} * {x_name}^{time_k:.2f}")
+        print(f"memory ~ {rss_a:.3g} * {x_name}^{rss_k:.2f} kb")
+    code_a, code_k = fit_power(lines, instructions)
+    print(f"instrs ~ {code_a:.3g} * lines^{code_k:.2f}")
+
+    if opts.o:
+        with open(opts.o, "w") as file:
+            json.dump({"knob": opts.knob, "flags": args, "sizes": rows, "code_exponent": code_k,
+                       "time_exponent": fits["instrs"]["time"], "memory_exponent": fits["instrs"]["memory"],
+                       "line_time_exponent": fits["lines"]["time"], "line_memory_exponent": fits["lines"]["memory"]},
+                      file, indent=2)
+        print(f"wrote {opts.o}")
+
+    failed = False
+    for x_name, limit in (("instrs", opts.max_exponent), ("lines", opts.max_line_exponent)):
+        worse = [name for name, k in fits[x_name].items() if k > limit]
+        if worse:
+            print(f"{' and '.join(worse)} grow faster than {x_name}^{limit}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run and compare the tests/benchmarks programs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="compile and time benchmarks, write json results")
+    run.add_argument("benchmarks", nargs="*", help="benchmark names (default: all)")
+    run.add_argument("-n", type=int, default=5, help="timed runs per benchmark")
+    run.add_argument("-o", default="bench.json", help="results file")
+    run.add_argument("--perf", action="store_true", help="also collect perf stat counters")
+    run.add_argument("--frontend", default="cool --type", help="command that makes the .cl-type")
+    run.add_argument("--stack-calls", action="store_true")
+    run.add_argument("--full-header", action="store_true")
+    run.add_argument("--boxed", action="store_true")
+    run.add_argument("--inline-runtime", action="store_true", help="runtime in every .s instead of the archive")
+    run.add_argument("--source-order", action="store_true", help="functions in .cl-type order instead of the layout")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="flag regressions against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("results")
+    compare.add_argument("--threshold", type=float, default=0.05, help="allowed slowdown (0.05 = 5%%)")
+    compare.add_argument("--min-time", type=float, default=0.01, help="ignore times below this (seconds)")
+    compare.set_defaults(func=cmd_compare)
+
+    scale = sub.add_parser("scale", help="fit compile time and memory against the input and the code generated")
+    scale.add_argument("--knob", default="classes",
+                       choices=["classes", "depth", "methods", "attributes", "formals", "expr-depth", "case-width", "strings"],
+                       help="cl_type_gen.py option that grows, the rest keep their defaults")
+    scale.add_argument("--sizes", default="25,50,100,200", help="comma separated values of the knob")
+    scale.add_argument("-n", type=int, default=1, help="compiles per size (fastest one counts)")
+    scale.add_argument("-o", help="also write the results here")
+    scale.add_argument("--seed", type=int, default=0)
+    scale.add_argument("--max-exponent", type=float, default=1.3, help="fail if time or memory grow faster than instrs^this")
+    scale.add_argument("--max-line-exponent", type=float, default=1.7, help="or faster than lines^this")
+    scale.add_argument("--stack-calls", action="store_true")
+    scale.add_argument("--full-header", action="store_true")
+    scale.add_argument("--boxed", action="store_true")
+    scale.set_defaults(func=cmd_scale)
+
+    opts = parser.parse_args()
+    opts.func(opts)
@@ -0,0 +1,317 @@
+# synthetic .cl-type generator, for seeing how the compiler scales on programs much bigger than tests/.
+#
+#   python3 src/cl_type_gen.py big.cl-type [--classes 200] [--depth 4] [--methods 8] [--expr-depth 5] ...
+#
+# writes the class_map, implementation_map and parent_map that AnnotatedAstReader reads, for a
+# random (seeded) program that type checks: classes C1..Cn under IO, chained up to --depth deep,
+# with Int/String/Bool attributes, Int methods (some overriding their parent's) whose bodies
+# mix arithmetic, if/while/let/block, new, dynamic/static/self dispatch, case and string literals.
+# methods only call methods generated before them (and self dispatch only ones never overridden),
+# so there is no recursion, but nothing bounds how many calls a run ends up making.
+
+import argparse
+import random
+
+OBJECT_METHODS = [
+    ("abort", [], "Object"),
+    ("copy", [], "SELF_TYPE"),
+    ("type_name", [], "String"),
+]
+IO_METHODS = [
+    ("in_int", [], "Int"),
+    ("in_string", [], "String"),
+    ("out_int", ["x"], "SELF_TYPE"),
+    ("out_string", ["x"], "SELF_TYPE"),
+]
+STRING_METHODS = [
+    ("concat", ["s"], "String"),
+    ("length", [], "Int"),
+    ("substr", ["i", "l"], "String"),
+]
+
+ATTRIBUTE_TYPES = ["Int", "String", "Bool"]
+
+
+class ClTypeGen:
+    def __init__(self, classes=50, depth=4, methods=6, attributes=3, formals=2, expr_depth=4,
+                 case_width=4, strings=100, seed=0):
+        self.random = random.Random(seed)
+        self.expr_depth = expr_depth
+        self.case_width = case_width
+        self.line = 1
+        self.let_counter = 0
+
+        self.strings = [f"string {i} of {strings}" for i in range(strings)]
+        self.unused_strings = list(reversed(self.strings))
+
+        # the built in classes, then C1..Cn.
+        self.parent = {"IO": "Object", "Int": "Object", "String": "Object", "Bool": "Object", "Main": "IO"}
+        self.depth = {"Object": 0, "IO": 1}
+        self.attributes = {"Object": [], "IO": [], "Main": []} # class -> [(name, type)], inherited first
+        # class -> [(method, formals, return type, defining class)], inherited first
+        self.methods = {
+            "Object": [(name, formals, ret, "Object") for name, formals, ret in OBJECT_METHODS],
+        }
+        self.methods["IO"] = self.methods["Object"] + [(name, formals, ret, "IO") for name, formals, ret in IO_METHODS]
+        self.methods["Int"] = list(self.methods["Object"])
+        self.methods["Bool"] = list(self.methods["Object"])
+        self.methods["String"] = self.methods["Object"] + [(name, formals, ret, "String") for name, formals, ret in STRING_METHODS]
+        self.methods["Main"] = self.methods["IO"] + [("main", [], "Object", "Main")]
+
+        # (class, method) -> order it was generated in, calls only go to lower ones.
+        self.order = {}
+        self.overridden = set()
+        self.user_classes = []
+
+        for i in range(1, classes + 1):
+            self.add_class(f"C{i}", depth, methods, attributes, formals)
+
+    def add_class(self, cname, depth, methods, attributes, formals):
+        parents = ["IO"] + [c for c in self.user_classes if self.depth[c] < depth]
+        parent = self.random.choice(parents)
+        self.parent[cname] = parent
+        self.depth[cname] = self.depth[parent] + 1
+        self.user_classes.append(cname)
+
+        number = cname[1:]
+        self.attributes[cname] = self.attributes[parent] + [
+            (f"a{number}_{k}", self.random.choice(ATTRIBUTE_TYPES)) for k in range(attributes)]
+
+        inherited = list(self.methods[parent])
+        for slot, (mname, mformals, ret, defined_in) in enumerate(inherited):
+            if defined_in in self.user_classes and self.random.random() < 0.25:
+                inherited[slot] = (mname, mformals, ret, cname)
+                self.order[(cname, mname)] = len(self.order)
+                self.overridden.add(mname)
+        own = []
+        for k in range(methods):
+            mname = f"m{number}_{k}"
+            own.append((mname, [f"p{j}" for j in range(self.random.randint(0, formals))], "Int", cname))
+            self.order[(cname, mname)] = len(self.order)
+        self.methods[cname] = inherited + own
+
+    ###### expressions, each is a list of lines. ######
+
+    def next_line(self):
+        self.line += 1
+        return self.line
+
+    def exp(self, static_type, kind, *parts, line=None):
+        lines = [str(line or self.line), static_type, kind]
+        for part in parts:
+            if isinstance(part, list):
+                lines.extend(part)
+            else:
+                lines.append(str(part))
+        return lines
+
+    def id(self, name):
+        return [str(self.line), name]
+
+    def string_literal(self):
+        if self.unused_strings:
+            return self.unused_strings.pop()
+        return self.random.choice(self.strings)
+
+    # dispatch targets implemented before the method being generated.
+    def callable_methods(self, cname, current):
+        return [(mname, mformals, defined_in) for mname, mformals, ret, defined_in in self.methods[cname]
+                if defined_in in self.user_classes and self.order[(defined_in, mname)] < current]
+
+    def args(self, formals, env, depth, current):
+        return [str(len(formals))] + [line for _ in formals for line in self.int_exp(env, depth - 1, current)]
+
+    def int_exp(self, env, depth, current):
+        ints = [name for name, type in env if type == "Int"]
+        if depth <= 0:
+            if ints and self.random.random() < 0.6:
+                return self.exp("Int", "identifier", self.id(self.random.choice(ints)))
+            return self.exp("Int", "integer", self.random.randint(0, 100))
+
+        choice = self.random.choice(["arith", "arith", "if", "let", "block", "while", "dispatch", "case", "length"])
+        if choice == "arith":
+            op = self.random.choice(["plus", "minus", "times", "divide"])
+            left = self.int_exp(env, depth - 1, current)
+            # no division by zero
+            right = self.exp("Int", "integer", self.random.randint(1, 9)) if op == "divide" else self.int_exp(env, depth - 1, current)
+            return self.exp("Int", op, left, right)
+        if choice == "if":
+            return self.exp("Int", "if", self.bool_exp(env, depth - 1, current),
+                            self.int_exp(env, depth - 1, current), self.int_exp(env, depth - 1, current))
+        if choice == "let":
+            self.let_counter += 1
+            var = f"v{self.let_counter}"
+            binding = ["let_binding_init"] + self.id(var) + self.id("Int") + self.int_exp(env, depth - 1, current)
+            return self.exp("Int", "let", 1, binding, self.int_exp(env + [(var, "Int")], depth - 1, current))
+        if choice == "block":
+            self.next_line()
+            out = self.exp("SELF_TYPE", "self_dispatch", self.id("out_string"), 1,
+                           self.exp("String", "string", self.string_literal()))
+            self.next_line()
+            return self.exp("Int", "block", 2, out, self.int_exp(env, depth - 1, current))
+        if choice == "while":
+            # let i : Int <- 0 in { while i < k loop i <- i + 1 pool; i + <exp>; }
+            self.let_counter += 1
+            var = f"v{self.let_counter}"
+            i = self.exp("Int", "identifier", self.id(var))
+            loop = self.exp("Object", "while",
+                            self.exp("Bool", "lt", i, self.exp("Int", "integer", self.random.randint(1, 5))),
+                            self.exp("Int", "assign", self.id(var), self.exp("Int", "plus", i, self.exp("Int", "integer", 1))))
+            body = self.exp("Int", "block", 2, loop, self.exp("Int", "plus", i, self.int_exp(env, depth - 1, current)))
+            binding = ["let_binding_init"] + self.id(var) + self.id("Int") + self.exp("Int", "integer", 0)
+            return self.exp("Int", "let", 1, binding, body)
+        if choice == "dispatch":
+            return self.dispatch(env, depth, current)
+        if choice == "case":
+            return self.case(env, depth, current)
+        # "literal".length()
+        return self.exp("Int", "dynamic_dispatch", self.exp("String", "string", self.string_literal()),
+                        self.id("length"), 0)
+
+    def bool_exp(self, env, depth, current):
+        choice = self.random.choice(["lt", "le", "eq", "not", "isvoid", "attr"])
+        bools = [name for name, type in env if type == "Bool"]
+        if choice == "not":
+            return self.exp("Bool", "not", self.bool_exp(env, depth - 1, current))
+        if choice == "isvoid":
+            return self.exp("Bool", "isvoid", self.exp(self.random.choice(self.user_classes), "new", self.id(self.random.choice(self.user_classes))))
+        if choice == "attr" and bools:
+            return self.exp("Bool", "identifier", self.id(self.random.choice(bools)))
+        if choice == "attr":
+            return self.exp("Bool", self.random.choice(["true", "false"]))
+        return self.exp("Bool", choice, self.int_exp(env, depth - 1, current), self.int_exp(env, depth - 1, current))
+
+    def dispatch(self, env, depth, current):
+        kind = self.random.choice(["dynamic", "static", "self"])
+        if kind == "self":
+            cname = env.cname
+            targets = [target for target in self.callable_methods(cname, current) if target[0] not in self.overridden]
+            if targets:
+                mname, mformals, _ = self.random.choice(targets)
+                return self.exp("Int", "self_dispatch", self.id(mname), self.args(mformals, env, depth, current))
+        cname = self.random.choice(self.user_classes)
+        targets = self.callable_methods(cname, current)
+        if not targets:
+            return self.int_exp(env, 0, current)
+        mname, mformals, defined_in = self.random.choice(targets)
+        receiver = self.exp(cname, "new", self.id(cname))
+        if kind == "static":
+            # dispatch to the version in the class that defined it, that one is older than current too
+            return self.exp("Int", "static_dispatch", receiver, self.id(defined_in), self.id(mname),
+                            self.args(mformals, env, depth, current))
+        return self.exp("Int", "dynamic_dispatch", receiver, self.id(mname), self.args(mformals, env, depth, current))
+
+    # case labels and error strings are named after the line of the case expression,
+    # so every case gets its own.
+    def case(self, env, depth, current):
+        line = self.next_line()
+        cname = self.random.choice(self.user_classes)
+        scrutinee = self.exp(cname, "new", self.id(cname))
+        types = ["Object"] + self.random.sample(self.user_classes + ["Int", "String", "Bool", "IO"],
+                                                min(self.case_width - 1, len(self.user_classes) + 4))
+        elements = []
+        for type in types:
+            self.let_counter += 1
+            var = f"v{self.let_counter}"
+            elements += self.id(var) + self.id(type) + self.int_exp(env, depth - 1, current)
+        return self.exp("Int", "case", scrutinee, len(types), elements, line=line)
+
+    ###### the three maps ######
+
+    def attribute_init(self, type):
+        if type == "Int":
+            return self.exp("Int", "integer", self.random.randint(0, 1000))
+        if type == "String":
+            return self.exp("String", "string", self.string_literal())
+        return self.exp("Bool", self.random.choice(["true", "false"]))
+
+    def classes(self):
+        return sorted(["Object", "IO", "Int", "String", "Bool", "Main"] + self.user_classes)
+
+    def class_map(self):
+        lines = ["class_map", str(len(self.classes()))]
+        for cname in self.classes():
+            attributes = self.attributes.get(cname, [])
+            lines += [cname, str(len(attributes))]
+            for name, type in attributes:
+                self.next_line()
+                if self.random.random() < 0.5:
+                    lines += ["initializer", name, type] + self.attribute_init(type)
+                else:
+                    lines += ["no_initializer", name, type]
+        return lines
+
+    def method_body(self, cname, mname, mformals):
+        env = Env([(name, type) for name, type in self.attributes[cname]] + [(formal, "Int") for formal in mformals], cname)
+        self.next_line()
+        if cname == "Main":
+            calls = [self.exp("SELF_TYPE", "self_dispatch", self.id("out_string"), 1,
+                              self.exp("String", "string", "generated\\n"))]
+            for target in self.user_classes[:5]:
+                methods = self.callable_methods(target, len(self.order))
+                if methods:
+                    m, formals, _ = methods[0]
+                    calls.append(self.exp("SELF_TYPE", "self_dispatch", self.id("out_int"), 1,
+                                          self.exp("Int", "dynamic_dispatch", self.exp(target, "new", self.id(target)),
+                                                   self.id(m), self.args(formals, env, 1, len(self.order)))))
+            return self.exp("SELF_TYPE", "block", len(calls), *calls)
+        return self.int_exp(env, self.expr_depth, self.order[(cname, mname)])
+
+    def implementation_map(self):
+        lines = ["implementation_map", str(len(self.classes()))]
+        # bodies are shared by every class that inherits them, generate each once.
+        bodies = {}
+        for cname in self.classes():
+            lines += [cname, str(len(self.methods[cname]))]
+            for mname, mformals, ret, defined_in in self.methods[cname]:
+                lines += [mname, str(len(mformals))] + mformals + [defined_in]
+                if defined_in in ("Object", "IO", "String"):
+                    lines += ["0", ret, "internal", f"{defined_in}.{mname}"]
+                    continue
+                if (defined_in, mname) not in bodies:
+                    bodies[(defined_in, mname)] = self.method_body(defined_in, mname, mformals)
+                lines += bodies[(defined_in, mname)]
+        return lines
+
+    def parent_map(self):
+        classes = [cname for cname in self.classes() if cname != "Object"]
+        lines = ["parent_map", str(len(classes))]
+        for cname in classes:
+            lines += [cname, self.parent[cname]]
+        return lines
+
+    def write(self, path):
+        lines = self.class_map() + self.implementation_map() + self.parent_map()
+        with open(path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        return len(lines)
+
+
+# variables in scope (name, type) plus the class being generated.
+class Env(list):
+    def __init__(self, variables, cname):
+        super().__init__(variables)
+        self.cname = cname
+
+    def __add__(self, other):
+        return Env(list(self) + other, self.cname)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write a random valid .cl-type")
+    parser.add_argument("output")
+    parser.add_argument("--classes", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=4, help="max inheritance depth under IO")
+    parser.add_argument("--methods", type=int, default=6, help="new methods per class")
+    parser.add_argument("--attributes", type=int, default=3, help="new attributes per class")
+    parser.add_argument("--formals", type=int, default=2, help="max formals per method")
+    parser.add_argument("--expr-depth", type=int, default=4)
+    parser.add_argument("--case-width", type=int, default=4, help="branches per case")
+    parser.add_argument("--strings", type=int, default=100, help="distinct string literals")
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+
+    gen = ClTypeGen(classes=opts.classes, depth=opts.depth, methods=opts.methods, attributes=opts.attributes,
+                    formals=opts.formals, expr_depth=opts.expr_depth, case_width=opts.case_width,
+                    strings=opts.strings, seed=opts.seed)
+    print(f"wrote {gen.write(opts.output)} lines to {opts.output}")
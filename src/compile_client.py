@@ -0,0 +1,94 @@
+# main.py, but the compiling is done by a running compile_server.py.
+#
+#   python3 src/compile_client.py file.cl-type ... [-list=files.txt] [main.py options] [-socket=path]
+#   python3 src/compile_client.py -stdin [options] < x.cl-type > x.s   (> x.o with -obj)
+#   python3 src/compile_client.py -server-stats | -stop
+#
+# only needs the standard library, so it starts in about the time python does.
+# exits 2 if there is no server.
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from inputs import find_inputs
+
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()), f"x86-cgen-{os.getuid()}.sock")
+LINE_LIMIT = 1 << 30
+
+async def send(socket_path, request):
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=LINE_LIMIT)
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+# options passed on to the server, -trace gets an absolute path too.
+def compile_args(args):
+    passed = []
+    for arg in args:
+        if arg.startswith("-trace="):
+            passed.append("-trace=" + os.path.abspath(arg[len("-trace="):]))
+        elif arg.startswith("-") and not arg.startswith(("-list=", "-socket=", "-stdin")):
+            passed.append(arg)
+    return passed
+
+async def compile_files(socket_path, files, args):
+    start = time.perf_counter()
+    answers = await asyncio.gather(*(send(socket_path, {"path": file, "args": args}) for file in files))
+    wall = time.perf_counter() - start
+
+    failed = 0
+    for file, answer in zip(files, answers):
+        # the server could not even start on it (bad request, a worker died), no times then.
+        if "seconds" not in answer:
+            failed += 1
+            sys.stderr.write(f"{os.path.relpath(file)}: {answer.get('error', 'no answer')}")
+            continue
+        if len(files) > 1:
+            sys.stderr.write(f"{os.path.relpath(file):<48} {answer['seconds'] * 1000:9.1f} ms {answer['lines']:8} lines\n")
+        if answer.get("error"):
+            failed += 1
+            sys.stderr.write(f"{os.path.relpath(file)}: {answer['error']}")
+        sys.stderr.write(answer.get("report", ""))
+    if len(files) > 1:
+        sys.stderr.write(f"{len(files)} files ({failed} failed) in {wall:.2f}s, {len(files) / wall:.1f} files/s\n")
+    return failed
+
+async def main(args):
+    socket_path = next((arg[len("-socket="):] for arg in args if arg.startswith("-socket=")), SOCKET_PATH)
+    if not os.path.exists(socket_path):
+        sys.stderr.write(f"no compile server at {socket_path}, start one with python3 src/compile_server.py\n")
+        return 2
+
+    if "-server-stats" in args or "-stop" in args:
+        answer = await send(socket_path, {"op": "stop" if "-stop" in args else "stats"})
+        print(json.dumps(answer["stats"], indent=2))
+        return 0
+
+    if "-stdin" in args:
+        answer = await send(socket_path, {"source": sys.stdin.read(), "args": compile_args(args)})
+        if answer.get("error"):
+            sys.stderr.write(answer["error"])
+            return 1
+        sys.stderr.write(answer["report"])
+        if "o" in answer:
+            sys.stdout.buffer.write(base64.b64decode(answer["o"]))
+        else:
+            sys.stdout.write(answer["s"])
+        return 0
+
+    # paths are made absolute since the server runs somewhere else.
+    files = find_inputs(args, absolute=True)
+    if not files:
+        sys.stderr.write("usage: compile_client.py file.cl-type ... [-list=files.txt] [options]\n")
+        return 2
+    return 1 if await compile_files(socket_path, files, compile_args(args)) else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,143 @@
+# long running compiler for editors and ci, so python, the imports, x86_built_in.txt and the
+# method cache are loaded once instead of once per compile.
+#
+#   python3 src/compile_server.py [-socket=path] [-jobs=4] [-cache[=dir]] [-cache-max=mb] [-memory=mb]
+#   python3 src/compile_client.py file.cl-type ... [main.py options]
+#
+# listens on a unix socket, one request per connection: a line of json, answered with a line of json.
+#   {"path": "/abs/x.cl-type", "args": ["-boxed", ...]}      writes /abs/x.s like main.py does
+#   {"source": "<.cl-type text>", "args": [...]}            answers with the .s text ("s"),
+#                                                            or with -obj the .o in base64 ("o")
+#   {"op": "stats"}, {"op": "stop"}
+# requests are read by asyncio and compiled by a pool of -jobs worker processes forked from the
+# server (so they start warm), a slow compile only holds up its own connection.
+
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from main import compile_file, parse_cache, parse_options
+from x86_built_in import built_in_text
+
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()), f"x86-cgen-{os.getuid()}.sock")
+
+# requests and answers can hold a whole .cl-type / .s.
+LINE_LIMIT = 1 << 30
+
+# the cache of a worker, forked from the server's (its memory part stays in that worker).
+server_cache = None
+
+def compile_request(request):
+    options = parse_options(request.get("args", []), batch=True)
+    if "source" not in request:
+        return compile_file(request["path"], options, server_cache), None
+
+    workdir = tempfile.mkdtemp(prefix="x86-cgen-")
+    try:
+        cl_type = os.path.join(workdir, os.path.basename(request.get("name", "input.cl-type")))
+        with open(cl_type, "w") as file:
+            file.write(request["source"])
+        result = compile_file(cl_type, options, server_cache)
+        if result[3] is not None:
+            return result, None
+        if options["obj"]:
+            with open(cl_type.replace(".cl-type", ".o"), "rb") as file:
+                return result, base64.b64encode(file.read()).decode()
+        with open(cl_type.replace(".cl-type", ".s")) as file:
+            return result, file.read()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+class CompileServer:
+    def __init__(self, socket_path, jobs, cache):
+        self.socket_path = socket_path
+        self.jobs = jobs
+        self.cache = cache
+        self.started = time.perf_counter()
+        self.compiled = 0
+        self.failed = 0
+        self.busy = 0
+        self.stopped = None
+        global server_cache
+        server_cache = cache
+        built_in_text()
+        self.pool = ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("fork"))
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path, limit=LINE_LIMIT)
+        sys.stderr.write(f"compile server on {self.socket_path} ({self.jobs} jobs)\n")
+        async with server:
+            await self.stopped.wait()
+        os.remove(self.socket_path)
+        self.pool.shutdown()
+        if self.cache is not None:
+            self.cache.evict()
+
+    async def handle(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            answer = await self.answer(request)
+        except Exception as exception:
+            answer = {"error": f"{type(exception).__name__}: {exception}\n"}
+        writer.write(json.dumps(answer).encode() + b"\n")
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def answer(self, request):
+        match request.get("op", "compile"):
+            case "stats":
+                return {"stats": self.stats()}
+            case "stop":
+                self.stopped.set()
+                return {"stats": self.stats()}
+            case "compile":
+                self.busy += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    result, text = await loop.run_in_executor(self.pool, compile_request, request)
+                finally:
+                    self.busy -= 1
+                cl_type, seconds, lines, error, report, stats = result
+                self.compiled += 1
+                self.failed += error is not None
+                if stats is not None:
+                    self.cache.add_stats(stats)
+                key = "o" if "-obj" in request.get("args", []) else "s"
+                return {"path": request.get("path"), "seconds": seconds, "lines": lines, "error": error,
+                        "report": report, key: text}
+        raise Exception(f"unknown op {request['op']}")
+
+    def stats(self):
+        stats = {"uptime": time.perf_counter() - self.started, "compiled": self.compiled, "failed": self.failed,
+                 "busy": self.busy, "jobs": self.jobs}
+        if self.cache is not None:
+            hits, misses, stale = self.cache.stats()
+            stats["cache"] = {"hits": hits, "misses": misses, "stale": stale, "directory": self.cache.directory}
+        return stats
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    socket_path = next((arg[len("-socket="):] for arg in args if arg.startswith("-socket=")), SOCKET_PATH)
+    jobs = int(next((arg[len("-jobs="):] for arg in args if arg.startswith("-jobs=")), os.cpu_count()))
+    # -memory=<mb>: method cache text kept in memory by each worker (default 32).
+    memory = int(next((arg[len("-memory="):] for arg in args if arg.startswith("-memory=")), 32))
+    cache = parse_cache(args, memory_bytes=memory << 20)
+
+    server = CompileServer(socket_path, jobs, cache)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,259 @@
+# differential test runner, compare.sh for the whole tests/ directory at once.
+#
+#   python3 src/difftest.py [-j 8] [--json results.json] [--boxed ...] [test ...]
+#
+# every tests/**/*.cl (or just the named ones) goes .cl -> .cl-type (cool --type) -> X86Gen -> gcc
+# (linked with the prebuilt runtime archive, --inline-runtime puts it in the .s like main.py,
+# --obj skips the .s and has X86Gen write the .o itself, --vm runs the cool-asm in asm_vm.py instead)
+# and runs with its .input (nothing on stdin if it has none). the output is diffed against what
+# the reference compiler's program (cool --x86) prints for the same .cl and input.
+# tests run in a process pool, each one in its own temp dir.
+# reference outputs are cached by a hash of the reference command, the .cl and the input,
+# so the reference compiler only runs again when one of those changes (--no-cache to skip it).
+# exits 1 if any test fails.
+
+import argparse
+import difflib
+import glob
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from x86 import X86Gen
+
+ASM_VM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asm_vm.py")
+
+TESTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "x86-cgen", "reference")
+
+
+def find_tests(names):
+    tests = sorted(glob.glob(os.path.join(TESTS_DIR, "**", "*.cl"), recursive=True))
+    if names:
+        by_name = {test_name(test): test for test in tests}
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            sys.exit(f"no such test: {', '.join(missing)}")
+        return [by_name[name] for name in names]
+    return tests
+
+
+# path under tests/ without .cl, e.g. cool/hello-world
+def test_name(cl):
+    return os.path.splitext(os.path.relpath(cl, TESTS_DIR))[0]
+
+
+def read_input(cl):
+    input_file = os.path.splitext(cl)[0] + ".input"
+    if not os.path.exists(input_file):
+        return None
+    with open(input_file, "rb") as file:
+        return file.read()
+
+
+class TestError(Exception):
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+
+
+def run_step(stage, command, cwd):
+    result = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        raise TestError(stage, result.stdout.decode(errors="replace").strip())
+
+
+# returns (stdout, exit code), stdout is None if it timed out.
+# the output goes to a file, a program looping at the end of its input can print a lot in a few seconds.
+def run_program(command, stdin, timeout):
+    out_path = command[-1] + ".out"
+    try:
+        with open(out_path, "wb") as out:
+            result = subprocess.run(command, input=stdin or b"", stdout=out, stderr=subprocess.DEVNULL, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, None
+    with open(out_path, "rb") as out:
+        return out.read(), result.returncode
+
+
+def reference_key(reference, cl_source, stdin):
+    digest = hashlib.sha1()
+    for part in (reference.encode(), cl_source, stdin if stdin is not None else b"<no input>"):
+        digest.update(hashlib.sha1(part).digest())
+    return digest.hexdigest()
+
+
+def reference_output(cl, stdin, workdir, opts):
+    with open(cl, "rb") as file:
+        key = reference_key(opts.reference, file.read(), stdin)
+    cached = os.path.join(opts.cache, key + ".json")
+
+    if not opts.no_cache and os.path.exists(cached):
+        with open(cached) as file:
+            entry = json.load(file)
+        output = entry["output"].encode("latin-1") if entry["output"] is not None else None
+        return output, entry["exit"], True
+
+    refdir = os.path.join(workdir, "ref")
+    os.mkdir(refdir)
+    shutil.copy(cl, refdir)
+    run_step("reference", shlex.split(opts.reference) + [os.path.basename(cl), "--out", "ref"], refdir)
+    run_step("reference gcc", ["gcc", "-no-pie", "-static", "ref.s", "-o", "ref"], refdir)
+    output, exit_code = run_program([os.path.join(refdir, "ref")], stdin, opts.timeout)
+
+    if not opts.no_cache:
+        # written to a temp file first, other workers may be reading the same key
+        os.makedirs(opts.cache, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=opts.cache, delete=False) as file:
+            json.dump({"test": test_name(cl), "output": output.decode("latin-1") if output is not None else None,
+                       "exit": exit_code}, file)
+        os.replace(file.name, cached)
+    return output, exit_code, False
+
+
+# returns the command that runs the program.
+def compile_test(cl, workdir, opts):
+    name = os.path.splitext(os.path.basename(cl))[0]
+    shutil.copy(cl, workdir)
+    cl_type = os.path.join(workdir, f"{name}.cl-type")
+    run_step("frontend", shlex.split(opts.frontend) + [f"{name}.cl"], workdir)
+    if opts.vm:
+        # asm_vm.py compiles it too, its time counts as run time.
+        return [sys.executable, ASM_VM, cl_type]
+
+    try:
+        gen = X86Gen(cl_type, opt=False, **opts.args)
+    except Exception:
+        raise TestError("codegen", traceback.format_exc().strip())
+
+    runtime = [gen.runtime] if gen.runtime else []
+    program = f"{name}.o" if opts.obj else f"{name}.s"
+    run_step("gcc", ["gcc", "-no-pie", "-static", program, *runtime, "-o", name], workdir)
+    return [os.path.join(workdir, name)]
+
+
+def run_test(cl, opts):
+    result = {"test": test_name(cl), "status": "pass", "compile_time": None, "run_time": None}
+    stdin = read_input(cl)
+
+    with tempfile.TemporaryDirectory(prefix="difftest-") as workdir:
+        try:
+            start = time.perf_counter()
+            command = compile_test(cl, workdir, opts)
+            result["compile_time"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            output, exit_code = run_program(command, stdin, opts.timeout)
+            result["run_time"] = time.perf_counter() - start
+            result["exit"] = exit_code
+
+            expected, expected_exit, cached = reference_output(cl, stdin, workdir, opts)
+            result["reference_cached"] = cached
+            result["reference_exit"] = expected_exit
+        except TestError as error:
+            result["status"] = "error"
+            result["stage"] = error.stage
+            result["message"] = str(error)
+            return result
+
+    if output is None:
+        result["status"] = "timeout"
+        result["message"] = f"ran longer than {opts.timeout}s" + (" (so did the reference)" if expected is None else "")
+        return result
+    if expected is None:
+        result["status"] = "error"
+        result["stage"] = "reference"
+        result["message"] = f"reference program ran longer than {opts.timeout}s"
+        return result
+
+    if output != expected:
+        result["status"] = "fail"
+        diff = difflib.unified_diff(expected.decode("latin-1").splitlines(), output.decode("latin-1").splitlines(),
+                                    "reference", "ours", lineterm="", n=1)
+        result["diff"] = list(diff)
+    return result
+
+
+def seconds(value):
+    return f"{value:7.3f}s" if value is not None else " " * 8
+
+
+def report(result, max_diff):
+    status = result["status"].upper()
+    line = f"{status:7} {result['test']:32} compile {seconds(result['compile_time'])}  run {seconds(result['run_time'])}"
+    if result.get("reference_cached") is False:
+        line += "  (reference ran)"
+    print(line)
+
+    if result["status"] == "timeout":
+        print(f"        {result['message']}")
+    elif result["status"] == "error":
+        print(f"        {result['stage']} failed:")
+        for message_line in result["message"].splitlines()[-max_diff:]:
+            print(f"        {message_line}")
+    elif result["status"] == "fail":
+        for diff_line in result["diff"][:max_diff]:
+            print(f"        {diff_line}")
+        if len(result["diff"]) > max_diff:
+            print(f"        ... {len(result['diff']) - max_diff} more diff lines")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="diff every test program against the reference compiler")
+    parser.add_argument("tests", nargs="*", help="test names under tests/, e.g. arith cool/hello-world (default: all)")
+    parser.add_argument("-j", type=int, default=os.cpu_count(), help="parallel jobs")
+    parser.add_argument("--frontend", default="cool --type", help="command that makes the .cl-type")
+    parser.add_argument("--reference", default="cool --x86", help="reference compiler, called as <reference> x.cl --out ref")
+    parser.add_argument("--cache", default=CACHE_DIR, help="reference output cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="always run the reference compiler")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds each program may run")
+    parser.add_argument("--json", help="also write the results here")
+    parser.add_argument("--max-diff", type=int, default=20, help="diff lines printed per failing test")
+    parser.add_argument("--stack-calls", action="store_true")
+    parser.add_argument("--full-header", action="store_true")
+    parser.add_argument("--boxed", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--inline-runtime", action="store_true", help="runtime in every .s instead of the archive")
+    parser.add_argument("--obj", action="store_true", help="write the .o directly instead of the .s")
+    parser.add_argument("--source-order", action="store_true", help="functions in .cl-type order instead of the layout")
+    parser.add_argument("--vm", action="store_true", help="run the cool-asm output in asm_vm.py (the x86 flags do not apply)")
+    opts = parser.parse_args()
+
+    opts.args = {"regcall": not opts.stack_calls, "compact": not opts.full_header,
+                 "tagged": not opts.boxed, "profile": opts.profile, "extern_runtime": not opts.inline_runtime,
+                 "obj": opts.obj, "layout": not opts.source_order}
+
+    tests = find_tests(opts.tests)
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=opts.j) as pool:
+        futures = [pool.submit(run_test, cl, opts) for cl in tests]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            report(result, opts.max_diff)
+    wall = time.perf_counter() - start
+
+    results.sort(key=lambda result: result["test"])
+    counts = {status: sum(result["status"] == status for result in results) for status in ("pass", "fail", "timeout", "error")}
+    print(f"{counts['pass']} passed, {counts['fail']} failed, {counts['timeout']} timed out, {counts['error']} errors "
+          f"in {wall:.1f}s ({opts.j} jobs)")
+
+    if opts.json:
+        with open(opts.json, "w") as file:
+            json.dump({"flags": opts.args, "wall": wall, "results": results}, file, indent=2)
+
+    sys.exit(0 if counts["pass"] == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import glob
+import os
+
+# inputs of main.py and compile_client.py: .cl-type files, globs (quoted, "tests/**/*.cl-type")
+# and -list=<file> with one per line. standard library only, the client imports it too.
+# absolute: the client's paths go to a server running in another directory.
+def find_inputs(args, absolute=False):
+    inputs = []
+    for arg in args:
+        if arg.startswith("-list="):
+            with open(arg[len("-list="):]) as file:
+                inputs += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+        elif not arg.startswith("-"):
+            inputs.append(arg)
+    files = []
+    for pattern in inputs:
+        if glob.has_magic(pattern):
+            files += sorted(glob.glob(pattern, recursive=True))
+        else:
+            files.append(pattern)
+    if absolute:
+        return [os.path.abspath(file) for file in files]
+    return files
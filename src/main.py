@@ -1,10 +1,158 @@
-import sys 
+import io
+import multiprocessing
+import sys
+import time
+import traceback
 from x86 import X86Gen
+from x86_built_in import built_in_text, runtime_archive
+from pass_timer import PassTimer
+from method_cache import MethodCache, CACHE_DIR
+from asm_layout import Profile
+from inputs import find_inputs
+
+# codegen options from the command line (the compile server gets them per request too).
+def parse_options(args, batch=False):
+    # -stack-calls: old calling convention (everything pushed on the stack),
+    #   keep it around to diff against the register one.
+    # -full-header: type tag and size in every object again (3 word header instead of 1).
+    # -boxed: Int and Bool as heap objects instead of tagged words.
+    # -profile: the program prints calls per method, objects per class and allocation sites at exit.
+    # -time-passes: time of each phase and method on stderr.
+    # -trace=<file>: also write them as a chrome trace (chrome://tracing, perfetto), one input only.
+    # -jobs=<n>: one input, generate its methods in n processes.
+    #   more inputs, compile n files at a time. same output as without either way.
+    # -extern-runtime: leave x86_built_in.txt out of the .s, link with the archive -print-runtime names.
+    # -obj: write a .o (ELF, see x86_elf.py) instead of the .s, needs no assembler. implies -extern-runtime.
+    # -source-order: constructors then methods as they are in the .cl-type, instead of by the call graph (asm_layout.py).
+    # -layout-profile=<file>: lay them out by the counts a -profile build printed (its stderr) instead.
+    # -layout-report: the order, weights and which functions are aligned or cold on stderr.
+    trace = next((arg[len("-trace="):] for arg in args if arg.startswith("-trace=")), None)
+    jobs = int(next((arg[len("-jobs="):] for arg in args if arg.startswith("-jobs=")), 1))
+    layout_profile = next((arg[len("-layout-profile="):] for arg in args if arg.startswith("-layout-profile=")), None)
+    return {
+        "regcall": "-stack-calls" not in args,
+        "compact": "-full-header" not in args,
+        "tagged": "-boxed" not in args,
+        "profile": "-profile" in args,
+        "time_passes": "-time-passes" in args or trace is not None,
+        "trace": trace,
+        "jobs": 1 if batch else jobs,
+        # files compiled at a time, -jobs goes to one or the other.
+        "batch_jobs": jobs if batch else 1,
+        "extern_runtime": "-extern-runtime" in args,
+        "obj": "-obj" in args,
+        "layout": "-source-order" not in args,
+        "layout_profile": layout_profile,
+        "layout_report": "-layout-report" in args,
+    }
+
+# -cache[=<dir>]: reuse the code of methods that did not change since the last build
+#   (default dir ~/.cache/x86-cgen/methods), -cache-max=<mb> bounds its size (default 64).
+# -cache-stats: hits, misses and size of the cache on stderr (also with -time-passes).
+def parse_cache(args, **kwargs):
+    cache_dir = next((arg[len("-cache="):] if arg.startswith("-cache=") else CACHE_DIR
+                      for arg in args if arg == "-cache" or arg.startswith("-cache=")), None)
+    if cache_dir is None:
+        return None
+    cache_max = int(next((arg[len("-cache-max="):] for arg in args if arg.startswith("-cache-max=")), 64))
+    return MethodCache(cache_dir, max_bytes=cache_max << 20, **kwargs)
+
+# returns (file, seconds, lines of .cl-type, error, -time-passes report, cache stats of this file).
+def compile_file(cl_type, options, cache=None):
+    timer = PassTimer(enabled=options["time_passes"])
+    before = cache.stats() if cache is not None else None
+    start = time.perf_counter()
+    error = None
+    lines = 0
+    gen = None
+    try:
+        with open(cl_type, "rb") as file:
+            lines = sum(1 for _ in file)
+        layout_profile = Profile(options["layout_profile"]) if options["layout_profile"] else None
+        with timer.phase("total"):
+            gen = X86Gen(cl_type, opt=False, regcall=options["regcall"], compact=options["compact"], tagged=options["tagged"],
+                         profile=options["profile"], timer=timer, jobs=options["jobs"], cache=cache,
+                         extern_runtime=options["extern_runtime"], obj=options["obj"],
+                         layout=options["layout"], layout_profile=layout_profile)
+    except Exception:
+        error = traceback.format_exc()
+    seconds = time.perf_counter() - start
+
+    report = io.StringIO()
+    if options["layout_report"] and gen is not None:
+        gen.layout.report(report)
+    timer.report(report)
+    if options["trace"]:
+        timer.write_trace(options["trace"])
+    stats = None
+    if cache is not None:
+        stats = tuple(now - then for now, then in zip(cache.stats(), before))
+    return cl_type, seconds, lines, error, report.getvalue(), stats
+
+# the options and cache of this run, set before the batch workers fork.
+batch_options = None
+batch_cache = None
+
+def compile_batch_file(cl_type):
+    return compile_file(cl_type, batch_options, batch_cache)
 
 if __name__ == "__main__":
-    
-    
-    X86Gen(sys.argv[1], opt=False) 
+
+    args = sys.argv[1:]
+    files = find_inputs(args)
+    # -print-runtime: path of the runtime archive for these options (built if needed), for gcc.
+    if "-print-runtime" in args:
+        options = parse_options(args)
+        print(runtime_archive(options["compact"], options["tagged"], options["profile"]))
+        if not files:
+            sys.exit(0)
+    if not files:
+        sys.exit("usage: main.py file.cl-type ... [-list=files.txt] [options]")
+
+    batch = len(files) > 1
+    batch_options = parse_options(args, batch)
+    if batch_options["trace"] and batch:
+        sys.exit("-trace takes one input")
+    jobs = batch_options["batch_jobs"]
+    batch_cache = parse_cache(args)
+
+    # many inputs: one process (or a pool forked from it) for all of them, so the interpreter,
+    # the imports and the runtime text are only loaded once. time per file on stderr.
+    built_in_text()
+    start = time.perf_counter()
+    if batch and jobs > 1:
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+        results = pool.imap(compile_batch_file, files)
+    else:
+        pool = None
+        results = map(compile_batch_file, files)
+
+    failed = 0
+    total_lines = 0
+    for cl_type, seconds, lines, error, report, stats in results:
+        total_lines += lines
+        if batch:
+            sys.stderr.write(f"{cl_type:<48} {seconds * 1000:9.1f} ms {lines:8} lines\n")
+        if error:
+            failed += 1
+            sys.stderr.write(f"{cl_type}: {error}")
+        sys.stderr.write(report)
+        if pool is not None and stats is not None:
+            batch_cache.add_stats(stats)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    wall = time.perf_counter() - start
+
+    if batch:
+        sys.stderr.write(f"{len(files)} files ({failed} failed), {total_lines} lines in {wall:.2f}s, "
+                         f"{len(files) / wall:.1f} files/s ({jobs} jobs)\n")
+    if batch_cache is not None:
+        batch_cache.evict()
+        if "-cache-stats" in args or batch_options["time_passes"]:
+            batch_cache.report()
+    if failed:
+        sys.exit(1)
 
     # if len(sys.argv) > 2:
     #     args = []
@@ -19,7 +167,6 @@ if __name__ == "__main__":
     #     if comments:
     #         print("Comments enabled.")
 
-    #     X86Gen(sys.argv[1], opt=opt,comments=comments) 
+    #     X86Gen(sys.argv[1], opt=opt,comments=comments)
     # else:
-    #     X86Gen(sys.argv[1]) 
-
+    #     X86Gen(sys.argv[1])
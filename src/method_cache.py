@@ -0,0 +1,117 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "x86-cgen", "methods")
+
+# bump when the generated code changes for the same input, so old entries are never reused.
+CACHE_VERSION = 4
+
+class MethodCache:
+    """
+    on disk cache of generated methods for -cache, one file per method.
+    the file name is a hash of everything that goes into the method that is known before
+    generating it: its ast (with line numbers), formals, the attributes of its class (offsets)
+    and the compiler options. what it looked up while being generated (vtable slots, type tags,
+    whether its class has subclasses) is stored in the entry and checked again on a hit,
+    an entry whose lookups changed is stale and gets generated again.
+    entries are touched when used and the least recently used ones are deleted when the
+    directory is over max_bytes.
+    a long running process (compile_server.py) also keeps up to memory_bytes of text of the
+    most recently used entries in memory, in front of the files.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=64 << 20, memory_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.memory = OrderedDict() # key -> entry, least recently used first
+        self.memory_size = 0
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evicted = 0
+
+    def key(self, *parts) -> str:
+        return hashlib.sha1(repr((CACHE_VERSION,) + parts).encode()).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key)
+
+    # entry for key, None if there is none (or it is unreadable).
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self.remember(key, entry)
+        return entry
+
+    # written to a temp file first, -jobs workers may be reading or writing the same key.
+    def put(self, key, entry) -> None:
+        with tempfile.NamedTemporaryFile("wb", dir=self.directory, delete=False) as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, self.path(key))
+        self.remember(key, entry)
+
+    def remember(self, key, entry) -> None:
+        if not self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key)["text"])
+        self.memory[key] = entry
+        self.memory_size += len(entry["text"])
+        while self.memory_size > self.memory_bytes:
+            _, old = self.memory.popitem(last=False)
+            self.memory_size -= len(old["text"])
+
+    # hits/misses/stale counted in a -jobs worker are added here.
+    def add_stats(self, stats) -> None:
+        self.hits += stats[0]
+        self.misses += stats[1]
+        self.stale += stats[2]
+
+    def stats(self) -> tuple:
+        return self.hits, self.misses, self.stale
+
+    def entries(self) -> list:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    # delete least recently used entries until the directory fits in max_bytes.
+    def evict(self) -> None:
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
+
+    def report(self, outfile=sys.stderr) -> None:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        entries = self.entries()
+        size = sum(size for _, size, _ in entries)
+        outfile.write(f"method cache: {self.hits} hits, {self.misses} misses ({self.stale} stale), {rate:.1f}% hit rate, "
+                      f"{len(entries)} entries {size / (1 << 20):.1f} MB, {self.evicted} evicted ({self.directory})\n")
@@ -0,0 +1,82 @@
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+class PassTimer:
+    """
+    times compiler phases (and each method's codegen) for -time-passes.
+    phases nest, each one records wall time, how many instructions it emitted
+    and the peak rss of the compiler when it ended.
+    disabled timers do nothing, so the passes can always be wrapped.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.events = [] # (name, category, start, duration, depth, args)
+        self.depth = 0
+
+    def phase(self, name, category="pass", count=None):
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name, category, count)
+
+    # count is a function returning the number of instructions emitted so far.
+    @contextmanager
+    def _phase(self, name, category, count):
+        args = {}
+        before = count() if count else 0
+        start = time.perf_counter()
+        self.depth += 1
+        try:
+            yield args
+        finally:
+            self.depth -= 1
+            duration = time.perf_counter() - start
+            if count:
+                args["instructions"] = count() - before
+            # linux reports ru_maxrss in kilobytes
+            args["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.events.append((name, category, start - self.start, duration, self.depth, args))
+
+    def report(self, outfile=sys.stderr, slowest_methods=10):
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.start
+        passes = sorted((e for e in self.events if e[1] == "pass"), key=lambda e: e[2])
+        methods = sorted((e for e in self.events if e[1] == "method"), key=lambda e: -e[3])
+        # streamed lowering runs once per method inside the passes above, summed up here.
+        lowering = [e for e in self.events if e[1] == "lowering"]
+
+        outfile.write(f"===== pass times (total {total * 1000:.1f} ms) =====\n")
+        for name, _, _, duration, depth, args in passes:
+            instructions = args.get("instructions")
+            instructions = f"{instructions:8} instrs" if instructions is not None else " " * 15
+            outfile.write(f"{'  ' * depth}{name:<{32 - 2 * depth}} {duration * 1000:9.2f} ms {duration / total * 100:5.1f}%"
+                          f"  {instructions}  peak rss {args['peak_rss_kb']} kb\n")
+        if lowering:
+            duration = sum(e[3] for e in lowering)
+            outfile.write(f"{'(streamed lowering)':<32} {duration * 1000:9.2f} ms {duration / total * 100:5.1f}%"
+                          f"  in {len(lowering)} pieces\n")
+        if methods:
+            outfile.write(f"===== slowest methods ({len(methods)} total) =====\n")
+            for name, _, _, duration, _, args in methods[:slowest_methods]:
+                outfile.write(f"  {name:<30} {duration * 1000:9.2f} ms  {args['instructions']:8} instrs\n")
+
+    # chrome trace event format (chrome://tracing, perfetto), complete events in microseconds.
+    def write_trace(self, path):
+        if not self.enabled:
+            return
+        events = [{
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": 1,
+            "tid": 1,
+            "args": args,
+        } for name, category, start, duration, _, args in self.events]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
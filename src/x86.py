@@ -1,9 +1,13 @@
+import io
+import json
 import sys
 from asm import CoolAsmGen
+from pass_timer import PassTimer
 from asm_instructions import *
 from x86_strings import *
 from x86_ints import *
 from x86_built_in import *
+from x86_elf import ElfObject
 
 
 # given cl-type, parses cl-type, converts to cool-asm, then to x86.
@@ -12,32 +16,105 @@ REGISTERS:
 r12 - self
 r13 - accumulator
 r14 - temp
+r15 - temp2
+r8-r11 - first arguments of a dispatch (receiver is in r13)
 rbp - base pointer 
 rsp - stack pointer
 """
 class X86Gen:
-    def __init__(self, cl_type, comments=False,opt=False):
-        outfile_name = cl_type.replace(".cl-type",".s") 
-        cool_asm_gen = CoolAsmGen(file=cl_type,x86=True,opt=opt)
+    def __init__(self, cl_type, comments=False,opt=False,regcall=True,compact=True,tagged=True,profile=False,timer=None,jobs=1,cache=None,extern_runtime=False,obj=False,layout=True,layout_profile=None):
+        # obj: encode straight to an ELF .o (x86_elf) instead of writing the .s, the runtime is linked from its archive then.
+        outfile_name = cl_type.replace(".cl-type",".o" if obj else ".s")
+        extern_runtime = extern_runtime or obj
+        timer = timer or PassTimer()
+        self.lines_written = 0
+        # extern_runtime: only the program is emitted, link it with self.runtime (runtime_archive).
+        self.runtime = None
+        self.outfile = ElfObject(outfile_name) if obj else open(outfile_name,"w")
 
         try:
-            self.outfile = open(outfile_name,"w")
-            self.cool_asm_to_x86(cool_asm_gen.get_asm(include_comments=comments))
-        finally:
-            c_placeholders(self.outfile)
-
-            # emit directly from reference compiler :)
-            emit_built_in(self.outfile)
+            # every vtable, constructor and method is lowered and written out as soon as it is
+            # generated (sink), instead of generating the whole program first.
+            # with jobs > 1 methods are generated and lowered in worker processes (render).
+            # with a cache methods that did not change are written from it (write_rendered).
+            with timer.phase("cool_asm"):
+                cool_asm_gen = CoolAsmGen(file=cl_type,x86=True,opt=opt,regcall=regcall,compact=compact,tagged=tagged,profile=profile,timer=timer,
+                                          sink=self.cool_asm_to_x86,include_comments=comments,jobs=jobs,renderer=self,cache=cache,
+                                          layout=layout,layout_profile=layout_profile)
+                # the order the functions were written in, for -layout-report.
+                self.layout = cool_asm_gen.layout
+                # cool-asm instructions emitted, what bench.py scale fits against.
+                self.instructions = cool_asm_gen.instruction_count()
+
+            if extern_runtime:
+                with timer.phase("runtime_archive"):
+                    self.emit_runtime_imports(cool_asm_gen)
+                    self.emit_profile_tables(cool_asm_gen)
+                    self.runtime = runtime_archive(cool_asm_gen.compact, cool_asm_gen.tagged, cool_asm_gen.profile)
+            else:
+                with timer.phase("built_ins"):
+                    c_placeholders(self.outfile)
+                    self.emit_layout(cool_asm_gen)
+                    self.emit_profile_tables(cool_asm_gen)
+
+                    # emit directly from reference compiler :)
+                    emit_built_in(self.outfile)
 
             # mark stack as non executabale
             self.outfile.write(".section .note.GNU-stack,\"\",@progbits\n")
+        finally:
             self.outfile.close()
 
+    # x86 for cool_asm as a string instead of writing it out.
+    def render(self, cool_asm):
+        outfile = self.outfile
+        self.outfile = io.StringIO()
+        try:
+            self.cool_asm_to_x86(cool_asm)
+            return self.outfile.getvalue()
+        finally:
+            self.outfile = outfile
+
+    def write_rendered(self, text):
+        self.outfile.write(text)
+
     def write(self,string, not_tabbed = False):
+        self.lines_written += 1
         if not not_tabbed: 
             self.outfile.write("\t\t")
         self.outfile.write(string)
 
+    # object offsets the runtime (x86_built_in.txt) uses, see runtime_layout.
+    def emit_layout(self, cool_asm_gen):
+        for line in runtime_layout(cool_asm_gen.compact, cool_asm_gen.tagged, cool_asm_gen.profile).splitlines(True):
+            self.write(line, True)
+
+    # the runtime is its own object, what it uses from the program has to be global.
+    def emit_runtime_imports(self, cool_asm_gen):
+        imports = RUNTIME_IMPORTS + (RUNTIME_PROFILE_IMPORTS if cool_asm_gen.profile else [])
+        for symbol in imports:
+            self.write(f".globl\t {symbol}\n", True)
+
+    # -profile counters, coolprofdump (x86_built_in.txt) sorts and prints them at exit.
+    # each table is entries of [count, name, bytes] with the number of entries right before it.
+    def emit_profile_tables(self, cool_asm_gen):
+        if not cool_asm_gen.profile:
+            return
+        self.write(".data\n")
+        for kind, counters in cool_asm_gen.profile_counters.items():
+            self.write(f".quad\t {len(counters)}\n")
+            self.write(f"cool_prof_{kind}:\n", True)
+            for name, label in counters.items():
+                self.write(f"{label}:\n", True)
+                self.write(".quad\t 0\n")
+                self.write(f".quad\t {label}..name\n")
+                self.write(".quad\t 0\n")
+        for counters in cool_asm_gen.profile_counters.values():
+            for name, label in counters.items():
+                self.write(f"{label}..name:\n", True)
+                self.write(f".string\t {json.dumps(name)}\n")
+        self.write(".text\n")
+
     # makes last 4 bits of rsp 0, so 16 byte aligns rsp
 
     def align_rsp(self):
@@ -97,8 +174,43 @@ class X86Gen:
                     # self.write(f"movq\t %rax, %r13\n")
                     
 
+                case ASM_Wrap(reg):
+                    self.write(f"movslq\t {self.get_reg(reg)}d, {self.get_reg(reg)}\n")
+                case ASM_Tag(reg,tag):
+                    # sign extend the low 32 bits, then shift in the tag
+                    self.write(f"movslq\t {self.get_reg(reg)}d, {self.get_reg(reg)}\n")
+                    self.write(f"leaq\t {tag}(,{self.get_reg(reg)},4), {self.get_reg(reg)}\n")
+                case ASM_Untag(reg):
+                    self.write(f"sarq\t $2, {self.get_reg(reg)}\n")
+                case ASM_Vtable(dest,src,offset):
+                    # low bit 1 -> Int or Bool word, bit 2 tells them apart.
+                    self.write(f"testq\t $1, {self.get_reg(src)}\n")
+                    self.write(f"jz\t 1f\n")
+                    self.write(f"testq\t $2, {self.get_reg(src)}\n")
+                    self.write(f"movq\t $Int..vtable, {self.get_reg(dest)}\n")
+                    self.write(f"jz\t 2f\n")
+                    self.write(f"movq\t $Bool..vtable, {self.get_reg(dest)}\n")
+                    self.write(f"jmp\t 2f\n")
+                    self.write(f"1:\n", True)
+                    self.write(f"movq\t {offset*8}({self.get_reg(src)}), {self.get_reg(dest)}\n")
+                    self.write(f"2:\n", True)
+
+                case ASM_Count(label,offset,amount):
+                    self.write(f"addq\t ${amount}, {label}+{offset*8}(%rip)\n")
+                case ASM_Error(kind,line):
+                    self.write(f"movl\t ${line}, %edi\n")
+                    self.write(f"jmp\t coolerror_{kind}\n")
+                case ASM_Section(name):
+                    self.write(f".section\t {name},\"ax\",@progbits\n")
+                case ASM_Align(bits,None):
+                    self.write(f".p2align\t {bits}\n")
+                case ASM_Align(bits,max_skip):
+                    self.write(f".p2align\t {bits},,{max_skip}\n")
+
                 case ASM_Jmp(label):
                     self.write(f"jmp\t {label}\n")
+                case ASM_Jmp_Reg(reg):
+                    self.write(f"jmp\t *{self.get_reg(reg)}\n")
                 case ASM_Bz(reg, label):
                     self.write(f"cmpq\t $0, {self.get_reg(reg)}\n")
                     self.write(f"je\t {label}\n")
@@ -152,11 +264,13 @@ class X86Gen:
 
                     self.write(f"## --- CALLOC ---\n")
                     self.write("## first argument - amount of entries\n")
-                    self.write(f"movq\t %r12, %rdi\n")
+                    self.write(f"movq\t {self.get_reg(src)}, %rdi\n")
 
                     self.write("## second argument - size of each entry\n")
                     self.write(f"movq\t ${8}, %rsi\n")
 
+                    # frames are not always 16 byte aligned (regcall saves self only when needed).
+                    self.align_rsp()
                     self.write(f"call calloc\n")
                     
                     self.write(f"movq\t %rax, {self.get_reg(dest)}\n")
@@ -166,45 +280,49 @@ class X86Gen:
                     #depending on name, call the respective function.
                     match name:
                         case "exit":
+                            # output is buffered, write it out before leaving.
+                            self.align_rsp()
+                            self.write("call\t coolflush\n")
                             self.write("movl\t $0, %edi\n")
                             self.write("call\t exit\n")
+                        case "Object.copy":
+                            self.write("## Object.copy\n")
+                            self.write("movq\t %r12, %rdi\n")
+                            self.align_rsp()
+                            self.write("call\t coolcopy\n")
+                            self.write("movq\t %rax, %r13\n")
                         case "IO.out_int":
                             self.write("## out_int\n")
-                            self.write("movq\t $percent.d, %rdi\n")
-                           
                             # for some reaosn the reference compiler prints 32 bit.
-                            self.write("movl\t %r13d, %eax\n")
-                            self.write("cdqe\t## sign extend the 32 bit integer\n")
-                            self.write("movq\t %rax, %rsi\n")
-                            self.write("movl\t $0, %eax\t## required by printf.\n")
-
+                            self.write("movl\t %r13d, %edi\n")
                             self.align_rsp()
-                            self.write("call\t printf\n")
+                            self.write("call\t cooloutint\n")
                         case "IO.in_int":
                             self.write("## in_int\n")
                             self.align_rsp()
+                            # show everything printed so far (prompts) before blocking on stdin.
+                            self.write("call\t coolflush\n")
                             self.write("call\t coolinint\n")
                             self.write("movq\t %rax, %r13\n")
 
                         case "IO.out_string":
                             self.write("## out_string\n")
                             self.write("movq\t %r13, %rdi ## move string pointer (just raw value in a String object) to rdi.\n")
+                            self.write("movq\t %r14, %rsi ## decoded string constant (length, bytes), or 0 to decode at runtime.\n")
+                            self.write("movq\t %r15, %rdx ## length\n")
                             self.align_rsp()
                             self.write("call\t cooloutstr\n")
 
                         case "IO.in_string":
                             self.write("## in_string\n")
                             self.align_rsp()
+                            self.write("call\t coolflush\n")
                             self.write("call\t coolgetstr\n")
                             self.write("movq\t %rax, %r13\n")
+                            self.write("movq\t %rdx, %r15 ## length\n")
 
-                        case "String.length":
-                            self.write("## String.length\n")
-                            self.write("movq\t %r13, %rdi\n")
-                            self.write("movl\t $0, %eax\n")
-                            self.write("call\t coolstrlen\n")
-                            self.write("movq\t %rax, %r13\n")
                         case "String.concat":
+                            # both String objects
                             self.write("movq\t %r13, %rdi\n")
                             self.write("movq\t %r14, %rsi\n")
                             self.write("## String.concat\n")
@@ -213,8 +331,9 @@ class X86Gen:
 
                             # modify the combined stinrg we made earlier.
                             self.write("movq\t %rax, %r13\n")
+                            self.write("movq\t %rdx, %r14 ## length\n")
                         case "String.substr":
-                            # self
+                            # self (String object)
                             self.write("movq\t %r12, %rdi\n")
                             # starting index
                             self.write("movq\t %r13, %rsi\n")
@@ -261,6 +380,8 @@ class X86Gen:
                     self.write(f".byte\t 0 \t ## null char\n")
                 case ASM_Constant_label(label):
                     self.write(f".quad\t {label}\n")
+                case ASM_Constant_integer(value):
+                    self.write(f".quad\t {value}\n")
                 case ASM_Comment(comment,not_tabbed):
                     self.write("## " + comment.strip()+"\n",not_tabbed)
                     
@@ -276,6 +397,10 @@ class X86Gen:
             "r1":"%r13",
             "r2":"%r14",
             "r3":"%r15",
+            "r4":"%r8",
+            "r5":"%r9",
+            "r6":"%r10",
+            "r7":"%r11",
             "fp":"%rbp",
             "sp":"%rsp",
             "%eax":"%eax",
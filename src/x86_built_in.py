@@ -1,11 +1,72 @@
+import hashlib
+import io
 import os
-def emit_built_in(outfile):
+import subprocess
+import tempfile
+from functools import cache
+from asm_constants import *
+from x86_strings import c_placeholders
+
+# -extern-runtime links against this instead of having the runtime in every .s
+RUNTIME_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "x86-cgen", "runtime")
+
+# program symbols the runtime uses, the program makes them global when the runtime is separate.
+RUNTIME_IMPORTS = ["Main..new", "Main.main", "Bool..new", "the.empty.string"]
+RUNTIME_PROFILE_IMPORTS = ["cool_prof_calls", "cool_prof_classes", "cool_prof_sites"]
+
+# read once per process, main.py compiles many files in one (and forks its workers after reading it).
+@cache
+def built_in_text():
     builtin_path = os.path.join(os.path.dirname(__file__), "x86_built_in.txt")
+    with open(builtin_path,"r") as src:
+        return src.read()
+
+def emit_built_in(outfile):
     outfile.write("\n")
     outfile.write("\n")
     outfile.write("## REFERENCE COMPILER BUILT-INS\n")
-    with open(builtin_path,"r") as src:
-        outfile.write(src.read())
+    outfile.write(built_in_text())
 
     outfile.write("\n")
-    
\ No newline at end of file
+
+# object offsets the runtime uses, they depend on the header layout.
+# type tag and size are always read from in front of the vtable.
+def runtime_layout(compact, tagged, profile):
+    if compact:
+        vtable, attributes_start = compact_vtable_index, compact_attributes_start_index
+    else:
+        vtable, attributes_start = vtable_index, attributes_start_index
+    return (f".set\t cool_vtable, {vtable * 8}\n"
+            f".set\t cool_val, {attributes_start * 8}\n"
+            f".set\t cool_len, {(attributes_start + string_len_offset) * 8}\n"
+            f".set\t cool_tagged, {int(tagged)}\n"
+            f".set\t cool_profile, {int(profile)}\n")
+
+def runtime_source(layout):
+    source = io.StringIO()
+    c_placeholders(source)
+    source.write(layout)
+    emit_built_in(source)
+    source.write(".section .note.GNU-stack,\"\",@progbits\n")
+    return source.getvalue()
+
+"""
+the runtime assembled once per layout (compact/tagged/profile, see runtime_layout) into a static
+archive, named by a hash of its source so editing x86_built_in.txt builds a new one.
+returns its path, link it after the program: gcc -no-pie -static x.s <archive>.
+"""
+def runtime_archive(compact=True, tagged=True, profile=False, directory=RUNTIME_DIR):
+    source = runtime_source(runtime_layout(compact, tagged, profile))
+    archive = os.path.join(directory, f"libcoolrt-{hashlib.sha1(source.encode()).hexdigest()[:16]}.a")
+    if os.path.exists(archive):
+        return archive
+
+    os.makedirs(directory, exist_ok=True)
+    # built in a temp dir and moved in place, other compiles may be building the same one.
+    with tempfile.TemporaryDirectory(dir=directory) as workdir:
+        with open(os.path.join(workdir, "coolrt.s"), "w") as file:
+            file.write(source)
+        subprocess.run(["gcc", "-c", "coolrt.s", "-o", "coolrt.o"], cwd=workdir, check=True)
+        subprocess.run(["ar", "rcs", "coolrt.a", "coolrt.o"], cwd=workdir, check=True)
+        os.replace(os.path.join(workdir, "coolrt.a"), archive)
+    return archive
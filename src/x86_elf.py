@@ -0,0 +1,506 @@
+import json
+import re
+import struct
+from collections import namedtuple
+
+"""
+-obj: X86Gen writes its AT&T text into an ElfObject instead of a .s file, and each line is
+encoded to machine code as it comes in, the .o is written on close.
+only what X86Gen emits for the program is understood (the runtime is linked from the
+archive, see runtime_archive): the instructions below, labels (1: / 1f / 1b too),
+.quad .byte .string .globl .text .data .p2align, .section .text.unlikely (cold functions and
+error stubs) and the GNU-stack note.
+jumps and calls are always rel32, jumps to labels in the same section are patched at the end,
+everything else (other sections, libc and runtime symbols, absolute addresses) gets a relocation.
+a line encodes to the same bytes wherever it is (fixups are relative to its start), so each
+distinct line is only encoded once (most of them are movq/pushq/popq/cmpq on the same registers).
+"""
+
+Reg = namedtuple("Reg", "num bits")
+Imm = namedtuple("Imm", "value sym")           # $5 or $label
+Mem = namedtuple("Mem", "disp sym base index scale") # base None + index: no base, base "rip": sym(%rip)
+Target = namedtuple("Target", "sym offset")    # jump/call target, .quad label
+Indirect = namedtuple("Indirect", "operand")   # *%reg
+Fixup = namedtuple("Fixup", "section offset kind sym addend")
+
+REGS = {}
+for num, name in enumerate(["rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi"]):
+    REGS[name] = Reg(num, 64)
+    REGS["e" + name[1:]] = Reg(num, 32)
+for num in range(8, 16):
+    REGS[f"r{num}"] = Reg(num, 64)
+    REGS[f"r{num}d"] = Reg(num, 32)
+
+# opcode (reg into r/m) and /digit for immediates
+ALU = {"add": (0x01, 0), "or": (0x09, 1), "and": (0x21, 4), "sub": (0x29, 5), "xor": (0x31, 6), "cmp": (0x39, 7)}
+SHIFT = {"shl": 4, "sal": 4, "shr": 5, "sar": 7}
+CONDITIONS = {"o": 0, "no": 1, "b": 2, "c": 2, "nae": 2, "ae": 3, "nb": 3, "nc": 3, "e": 4, "z": 4, "ne": 5, "nz": 5,
+              "be": 6, "na": 6, "a": 7, "nbe": 7, "s": 8, "ns": 9, "p": 10, "np": 11, "l": 12, "nge": 12,
+              "ge": 13, "nl": 13, "le": 14, "ng": 14, "g": 15, "nle": 15}
+
+# relocation types
+R_X86_64_64 = 1
+R_X86_64_PC32 = 2
+R_X86_64_PLT32 = 4
+R_X86_64_32S = 11
+
+# sections with code or data: name, flags (alloc 2, write 1, exec 4), alignment
+PROGBITS = [(".text", 6, 16), (".text.unlikely", 6, 16), (".data", 3, 8)]
+
+LABEL = re.compile(r"([\w.$]+):\s*")
+SYMBOL = re.compile(r"([A-Za-z_.$][\w.$]*)([+-]\d+)?$")
+MEMORY = re.compile(r"([^(]*)\((%\w+)?(?:,(%\w+)(?:,(\d+))?)?\)$")
+
+def fits8(value):
+    return -128 <= value <= 127
+
+def fits32(value):
+    return -(1 << 31) <= value < (1 << 31)
+
+class ElfObject:
+    def __init__(self, path):
+        self.path = path
+        self.sections = {name: bytearray() for name, _, _ in PROGBITS}
+        self.section = ".text"
+        self.labels = {} # name -> (section, offset)
+        self.globals = set()
+        self.fixups = []
+        self.numeric_labels = {} # 1: -> how many were defined so far
+        self.line_number = 0
+        self.pending = [] # written text not assembled yet
+        self.encoded = {} # line -> (code, fixups as (position, kind, sym, addend))
+        self.code = bytearray() # line being encoded
+        self.code_fixups = []
+
+    # file-like, so X86Gen and emit_* can write to it like they write to the .s
+    # x86.py writes a line in a few pieces, they are joined and split into lines in batches.
+    def write(self, text):
+        self.pending.append(text)
+        if len(self.pending) >= 4096:
+            self.flush()
+
+    def flush(self):
+        lines = "".join(self.pending).split("\n")
+        self.pending = [lines.pop()]
+        for line in lines:
+            self.assemble(line)
+
+    def close(self):
+        self.flush()
+        if self.pending[0]:
+            self.assemble(self.pending[0])
+        self.pending = []
+        with open(self.path, "wb") as file:
+            file.write(self.elf())
+
+    def error(self, line, message="cannot encode"):
+        return Exception(f"{self.path}: line {self.line_number}: {message}: {line.strip()}")
+
+    def assemble(self, line):
+        self.line_number += 1
+        encoded = self.encoded.get(line)
+        if encoded is None:
+            text = strip_comment(line).strip()
+            # labels, possibly followed by something else on the same line
+            labeled = False
+            while (match := LABEL.match(text)):
+                self.define(match.group(1))
+                text = text[match.end():]
+                labeled = True
+            if not text:
+                return
+            mnemonic, _, rest = re.sub(r"\s", " ", text, count=1).partition(" ")
+            if mnemonic in (".text", ".data", ".section", ".globl", ".global", ".p2align"):
+                self.section_directive(mnemonic, split_operands(rest))
+                return
+            encoded = self.encode_line(text, mnemonic, rest)
+            if not labeled:
+                self.encoded[line] = encoded
+        code, fixups = encoded
+        section = self.sections[self.section]
+        start = len(section)
+        for position, kind, sym, addend in fixups:
+            self.fixups.append(Fixup(self.section, start + position, kind, self.label_name(sym), addend))
+        section += code
+
+    # instructions and data, the same wherever they are.
+    def encode_line(self, line, mnemonic, rest):
+        self.code = bytearray()
+        self.code_fixups = []
+        operands = split_operands(rest) if rest.strip() else []
+        try:
+            if mnemonic.startswith("."):
+                self.directive(mnemonic, operands, rest.strip())
+            else:
+                self.instruction(mnemonic, [self.operand(operand) for operand in operands])
+        except (KeyError, ValueError, IndexError) as exception:
+            raise self.error(line, str(exception) or "cannot encode")
+        return bytes(self.code), tuple(self.code_fixups)
+
+    def define(self, name):
+        if name.isdigit():
+            count = self.numeric_labels.get(name, 0) + 1
+            self.numeric_labels[name] = count
+            name = f".L{name}.{count}"
+        if name in self.labels:
+            raise self.error(name, "label defined twice")
+        self.labels[name] = (self.section, len(self.sections[self.section]))
+
+    # 1f is the next 1:, 1b the last one
+    def label_name(self, name):
+        if name[:-1].isdigit() and name[-1] in "fb":
+            count = self.numeric_labels.get(name[:-1], 0)
+            return f".L{name[:-1]}.{count + 1 if name[-1] == 'f' else count}"
+        return name
+
+    def section_directive(self, name, operands):
+        match name:
+            case ".text" | ".data":
+                self.section = name
+            case ".section":
+                # the GNU-stack note is always there
+                if operands[0] in self.sections:
+                    self.section = operands[0]
+                elif operands[0] != ".note.GNU-stack":
+                    raise self.error(name, f"unknown section {operands[0]}")
+            case ".globl" | ".global":
+                self.globals.update(operands)
+            case ".p2align":
+                # nops, none if it would take more than the third operand
+                section = self.sections[self.section]
+                padding = -len(section) % (1 << int(operands[0]))
+                if len(operands) < 3 or padding <= int(operands[2]):
+                    section += nops(padding)
+
+    def directive(self, name, operands, rest):
+        data = self.code
+        match name:
+            case ".byte":
+                data += bytes(parse_int(operand) & 0xff for operand in operands)
+            case ".quad":
+                for operand in operands:
+                    target = self.operand(operand)
+                    if isinstance(target, Target):
+                        self.code_fixups.append((len(data), "abs64", target.sym, target.offset))
+                        data += bytes(8)
+                    else:
+                        data += struct.pack("<q", to_signed(target.value, 64))
+            case ".string" | ".asciz":
+                data += json.loads(rest).encode() + b"\0"
+            case _:
+                raise ValueError(f"unknown directive {name}")
+
+    def operand(self, text):
+        if text.startswith("%"):
+            return REGS[text[1:]]
+        if text.startswith("*"):
+            return Indirect(self.operand(text[1:]))
+        if text.startswith("$"):
+            try:
+                return Imm(parse_int(text[1:]), None)
+            except ValueError:
+                target = self.target(text[1:])
+                return Imm(target.offset, target.sym)
+        if (match := MEMORY.match(text)):
+            disp, base, index, scale = match.groups()
+            sym = None
+            if disp and not re.fullmatch(r"-?(0x[0-9a-fA-F]+|\d+)", disp):
+                target = self.target(disp)
+                sym, disp = target.sym, target.offset
+            else:
+                disp = parse_int(disp) if disp else 0
+            return Mem(disp, sym, base[1:] if base else None, REGS[index[1:]] if index else None, int(scale or 1))
+        try:
+            return Imm(parse_int(text), None)
+        except ValueError:
+            return self.target(text)
+
+    # 1f / 1b are left as they are, they are looked up when the line is placed (label_name).
+    def target(self, text):
+        if re.fullmatch(r"\d+[fb]", text):
+            return Target(text, 0)
+        match = SYMBOL.match(text)
+        if not match:
+            raise ValueError(f"bad operand {text}")
+        return Target(match.group(1), int(match.group(2) or 0))
+
+    def emit(self, code):
+        self.code += code
+
+    """
+    one instruction: [rex] opcode modrm [sib] [disp] [imm].
+    reg is the modrm reg field (register number or /digit), rm a Reg or Mem.
+    imm_fixup (kind, sym, addend) relocates the immediate (movq $label, %reg).
+    """
+    def encode(self, opcode, reg, rm, wide, imm=b"", imm_fixup=None):
+        rex = 0x40 | wide << 3 | (reg >> 3 & 1) << 2
+        fixup = None
+        if isinstance(rm, Reg):
+            rex |= rm.num >> 3
+            modrm = bytes([0xC0 | (reg & 7) << 3 | rm.num & 7])
+        else:
+            bits, modrm, fixup = self.memory(reg & 7, rm)
+            rex |= bits
+        prefix = bytes([rex]) if rex != 0x40 else b""
+        start = len(self.code)
+        code = prefix + bytes(opcode) + modrm + imm
+        if fixup is not None:
+            position, kind, sym, addend = fixup
+            if kind == "pc32":
+                # relative to the end of the instruction, the immediate comes after the disp
+                addend -= len(imm)
+            self.code_fixups.append((start + len(prefix) + len(opcode) + position, kind, sym, addend))
+        if imm_fixup is not None:
+            kind, sym, addend = imm_fixup
+            self.code_fixups.append((start + len(code) - len(imm), kind, sym, addend))
+        self.emit(code)
+
+    # returns (rex x/b bits, modrm + sib + disp, fixup of the disp or None)
+    def memory(self, reg, mem):
+        if mem.base == "rip":
+            return 0, bytes([reg << 3 | 5]) + bytes(4), (1, "pc32", mem.sym, mem.disp - 4)
+        index = mem.index.num if mem.index else 4
+        scale = {1: 0, 2: 1, 4: 2, 8: 3}[mem.scale]
+        x = (index >> 3) << 1
+        disp_fixup = None
+        if mem.base is None:
+            sib = bytes([scale << 6 | (index & 7) << 3 | 5])
+            if mem.sym:
+                disp_fixup = (2, "abs32s", mem.sym, mem.disp)
+            return x, bytes([reg << 3 | 4]) + sib + struct.pack("<i", 0 if mem.sym else mem.disp), disp_fixup
+        base = REGS[mem.base].num
+        b = base >> 3
+        need_sib = mem.index is not None or base & 7 == 4
+        if mem.sym:
+            mod, disp = 2, bytes(4)
+        elif mem.disp == 0 and base & 7 != 5:
+            mod, disp = 0, b""
+        elif fits8(mem.disp):
+            mod, disp = 1, struct.pack("<b", mem.disp)
+        else:
+            mod, disp = 2, struct.pack("<i", mem.disp)
+        modrm = bytes([mod << 6 | reg << 3 | (4 if need_sib else base & 7)])
+        if need_sib:
+            modrm += bytes([scale << 6 | (index & 7) << 3 | base & 7])
+        if mem.sym:
+            disp_fixup = (len(modrm), "abs32s", mem.sym, mem.disp)
+        return x | b, modrm + disp, disp_fixup
+
+    def branch(self, opcode, target):
+        self.emit(bytes(opcode))
+        self.code_fixups.append((len(self.code), "rel32", target.sym, target.offset - 4))
+        self.emit(bytes(4))
+
+    def instruction(self, mnemonic, operands):
+        match mnemonic, operands:
+            case "ret", []:
+                self.emit(b"\xc3")
+            case "leave", []:
+                self.emit(b"\xc9")
+            case "cdq" | "cltd", []:
+                self.emit(b"\x99")
+            case "cqto" | "cqo", []:
+                self.emit(b"\x48\x99")
+            case "pushq" | "push", [Reg(num, 64)]:
+                self.emit((b"\x41" if num >= 8 else b"") + bytes([0x50 + (num & 7)]))
+            case "popq" | "pop", [Reg(num, 64)]:
+                self.emit((b"\x41" if num >= 8 else b"") + bytes([0x58 + (num & 7)]))
+            case "call", [Target() as target]:
+                self.branch(b"\xe8", target)
+            case "jmp", [Target() as target]:
+                self.branch(b"\xe9", target)
+            case "call" | "jmp", [Indirect(rm)]:
+                self.encode(b"\xff", 2 if mnemonic == "call" else 4, rm, False)
+            case _ if mnemonic[0] == "j" and mnemonic[1:] in CONDITIONS:
+                [target] = operands
+                self.branch(bytes([0x0f, 0x80 + CONDITIONS[mnemonic[1:]]]), target)
+            case _:
+                self.sized_instruction(mnemonic, operands)
+
+    # instructions with a size suffix (q or l)
+    def sized_instruction(self, mnemonic, operands):
+        if mnemonic == "movslq":
+            [src, dst] = operands
+            self.encode(b"\x63", dst.num, src, True)
+            return
+        name, size = mnemonic[:-1], mnemonic[-1]
+        if size not in "ql":
+            raise ValueError(f"unknown instruction {mnemonic}")
+        wide = size == "q"
+        bits = 64 if wide else 32
+        match name, operands:
+            case "mov", [Imm(value, None), Reg() as dst] if not wide:
+                self.emit((b"\x41" if dst.num >= 8 else b"") + bytes([0xb8 + (dst.num & 7)]) + struct.pack("<I", value & 0xffffffff))
+            case "mov", [Imm(value, None), Reg() as dst] if not fits32(to_signed(value, 64)):
+                self.emit(bytes([0x48 | dst.num >> 3, 0xb8 + (dst.num & 7)]) + struct.pack("<q", to_signed(value, 64)))
+            case "mov", [Imm(value, sym), dst]:
+                imm = struct.pack("<i", 0 if sym else to_signed(value, bits))
+                self.encode(b"\xc7", 0, dst, wide, imm, ("abs32s", sym, value) if sym else None)
+            case "mov", [Reg() as src, dst]:
+                self.encode(b"\x89", src.num, dst, wide)
+            case "mov", [Mem() as src, Reg() as dst]:
+                self.encode(b"\x8b", dst.num, src, wide)
+            case "lea", [Mem() as src, Reg() as dst]:
+                self.encode(b"\x8d", dst.num, src, wide)
+            case "test", [Imm(value, None), dst]:
+                self.encode(b"\xf7", 0, dst, wide, struct.pack("<i", to_signed(value, bits)))
+            case "test", [Reg() as src, dst]:
+                self.encode(b"\x85", src.num, dst, wide)
+            case _, [Imm(value, None), dst] if name in ALU:
+                value = to_signed(value, bits)
+                if fits8(value):
+                    self.encode(b"\x83", ALU[name][1], dst, wide, struct.pack("<b", value))
+                else:
+                    self.encode(b"\x81", ALU[name][1], dst, wide, struct.pack("<i", value))
+            case _, [Reg() as src, dst] if name in ALU:
+                self.encode(bytes([ALU[name][0]]), src.num, dst, wide)
+            case _, [Mem() as src, Reg() as dst] if name in ALU:
+                self.encode(bytes([ALU[name][0] + 2]), dst.num, src, wide)
+            case _, [Imm(value, None), dst] if name in SHIFT:
+                self.encode(b"\xc1", SHIFT[name], dst, wide, bytes([value & 0xff]))
+            case "imul", [src, Reg() as dst]:
+                self.encode(b"\x0f\xaf", dst.num, src, wide)
+            case "idiv" | "div" | "neg" | "not", [rm]:
+                self.encode(b"\xf7", {"idiv": 7, "div": 6, "neg": 3, "not": 2}[name], rm, wide)
+            case _:
+                raise ValueError(f"cannot encode {mnemonic} with these operands")
+
+    # jumps within a section are patched, everything else becomes a relocation.
+    def resolve(self):
+        relocations = {name: [] for name in self.sections}
+        for fixup in self.fixups:
+            section, offset, kind, sym, addend = fixup
+            defined = self.labels.get(sym)
+            if kind == "rel32" and defined and defined[0] == section:
+                value = defined[1] + addend - offset
+                self.sections[section][offset:offset + 4] = struct.pack("<i", value)
+                continue
+            if kind == "rel32":
+                rtype = R_X86_64_PLT32 if defined is None else R_X86_64_PC32
+            else:
+                rtype = {"abs64": R_X86_64_64, "abs32s": R_X86_64_32S, "pc32": R_X86_64_PC32}[kind]
+            relocations[section].append((offset, sym, rtype, addend))
+        return relocations
+
+    def elf(self):
+        relocations = self.resolve()
+
+        # symbols: null, sections, local labels, then globals (defined or not)
+        referenced = {sym for relocs in relocations.values() for _, sym, _, _ in relocs}
+        locals_ = [name for name in self.labels if name not in self.globals]
+        globals_ = sorted(self.globals | {sym for sym in referenced if sym not in self.labels})
+        section_index = {name: index for index, (name, _, _) in enumerate(PROGBITS, 1)}
+        strtab = bytearray(b"\0")
+        symtab = bytearray(bytes(24))
+        symbol_index = {}
+
+        def add_symbol(name, info, shndx, value):
+            symbol_index[name] = len(symtab) // 24
+            name_offset = 0
+            if name:
+                name_offset = len(strtab)
+                strtab.extend(name.encode() + b"\0")
+            symtab.extend(struct.pack("<IBBHQQ", name_offset, info, 0, shndx, value, 0))
+
+        for section in self.sections:
+            add_symbol(None, 3, section_index[section], 0) # STB_LOCAL STT_SECTION
+        for name in locals_:
+            section, offset = self.labels[name]
+            add_symbol(name, 0, section_index[section], offset)
+        first_global = len(symtab) // 24
+        for name in globals_:
+            section, offset = self.labels.get(name, (None, 0))
+            add_symbol(name, 1 << 4, section_index.get(section, 0), offset) # STB_GLOBAL, undefined if shndx 0
+
+        rela = {}
+        for section, relocs in relocations.items():
+            rela[section] = b"".join(struct.pack("<QQq", offset, symbol_index[sym] << 32 | rtype, addend)
+                                     for offset, sym, rtype, addend in relocs)
+
+        progbits = len(PROGBITS)
+        names = [name for name, _, _ in PROGBITS] + [".note.GNU-stack", ".symtab", ".strtab"] + \
+                [".rela" + name for name, _, _ in PROGBITS] + [".shstrtab"]
+        shstrtab = bytearray(b"\0")
+        name_offsets = {}
+        for name in names:
+            name_offsets[name] = len(shstrtab)
+            shstrtab.extend(name.encode() + b"\0")
+
+        contents = [bytes(self.sections[name]) for name, _, _ in PROGBITS] + [b"", bytes(symtab), bytes(strtab)] + \
+                   [rela[name] for name, _, _ in PROGBITS] + [bytes(shstrtab)]
+        symtab_index = progbits + 2
+        #          type flags link info align entsize
+        headers = [(1, flags, 0, 0, align, 0) for _, flags, align in PROGBITS] + [ # PROGBITS
+                   (1, 0, 0, 0, 1, 0),                              # .note.GNU-stack, stack is not executable
+                   (2, 0, symtab_index + 1, first_global, 8, 24),   # .symtab
+                   (3, 0, 0, 0, 1, 0)] + [                          # .strtab
+                   (4, 0x40, symtab_index, index, 8, 24) for index in range(1, progbits + 1)] + [ # .rela.*, info flag
+                   (3, 0, 0, 0, 1, 0)]                              # .shstrtab
+
+        out = bytearray(64)
+        section_headers = bytearray(bytes(64))
+        for name, content, (stype, flags, link, info, align, entsize) in zip(names, contents, headers):
+            out.extend(bytes(-len(out) % align))
+            offset = len(out)
+            out.extend(content)
+            section_headers.extend(struct.pack("<IIQQQQIIQQ", name_offsets[name], stype, flags, 0, offset, len(content),
+                                               link, info, align, entsize))
+        out.extend(bytes(-len(out) % 8))
+        shoff = len(out)
+        out.extend(section_headers)
+
+        ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8) # 64 bit, little endian, version 1, sysv
+        out[0:64] = ident + struct.pack("<HHIQQQIHHHHHH", 1, 62, 1, 0, 0, shoff, 0, 64, 0, 0, 64, len(names) + 1, len(names))
+        return bytes(out)
+
+# the multi byte nops, up to 9 bytes
+NOPS = [b"", b"\x90", b"\x66\x90", b"\x0f\x1f\x00", b"\x0f\x1f\x40\x00", b"\x0f\x1f\x44\x00\x00",
+        b"\x66\x0f\x1f\x44\x00\x00", b"\x0f\x1f\x80\x00\x00\x00\x00", b"\x0f\x1f\x84\x00\x00\x00\x00\x00",
+        b"\x66\x0f\x1f\x84\x00\x00\x00\x00\x00"]
+
+def nops(size):
+    code = b""
+    while size > 0:
+        code += NOPS[min(size, 9)]
+        size -= 9
+    return code
+
+def strip_comment(line):
+    if "#" not in line:
+        return line
+    if '"' not in line:
+        return line[:line.index("#")]
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"' and (i == 0 or line[i - 1] != "\\"):
+            quoted = not quoted
+        elif char == "#" and not quoted:
+            return line[:i]
+    return line
+
+def split_operands(text):
+    if "(" not in text and '"' not in text:
+        return [operand.strip() for operand in text.split(",")]
+    operands, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            operands.append(current)
+            current = ""
+            continue
+        current += char
+    operands.append(current)
+    return [operand.strip() for operand in operands]
+
+def parse_int(text):
+    return int(text, 0) if not re.fullmatch(r"-?0\d+", text) else int(text, 10)
+
+# 0xFFFFFFFFFFFFFFF0 means -16 for a 64 bit operand
+def to_signed(value, bits):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
@@ -0,0 +1,32 @@
+-- attribute initializers that need temporaries and make calls while they hold them.
+-- constructors used to keep their temporaries where calls pushed (and where ra was saved).
+class A {
+    f() : Int { 100 };
+    x : Int <- 1 + (2 + (3 + f()));
+    s : String <- "a".concat("b".concat("c".concat(type_name())));
+    y : Int <- let a : Int <- 5, b : Int <- a * f() in a + (b - f());
+    get() : Int { x };
+    gets() : String { s };
+    gety() : Int { y };
+};
+
+class B inherits A {
+    z : Int <- gety() + (get() + (new A).get());
+    getz() : Int { z };
+};
+
+class Main inherits IO {
+    a : A <- new A;
+    b : B <- new B;
+    y : Int <- 10 + (20 + a.get());
+    main() : Object {
+        {
+            out_int(a.get()); out_string(" ");
+            out_string(a.gets()); out_string(" ");
+            out_int(a.gety()); out_string(" ");
+            out_string(b.gets()); out_string(" ");
+            out_int(b.getz()); out_string(" ");
+            out_int(y); out_string("\n");
+        }
+    };
+};
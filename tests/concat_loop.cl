@@ -0,0 +1,66 @@
+-- s <- s.concat(x) in a long loop appends in place, older strings that share the
+-- buffer must keep their own length and bytes whatever is appended after them.
+class Main inherits IO {
+    s : String;
+    i : Int;
+
+    show(x : String) : Object { { out_string(x); out_string("|"); out_int(x.length()); out_string("\n"); } };
+
+    main() : Object {
+        {
+            -- 100k appends
+            i <- 0;
+            while i < 100000 loop
+                {
+                    s <- s.concat("ab");
+                    i <- i + 1;
+                }
+            pool;
+            out_int(s.length()); out_string("\n");
+            show(s.substr(0, 6));
+            show(s.substr(199994, 6));
+
+            -- a and b both extend the same prefix
+            let p : String <- "x".concat("y"),
+                a : String <- p.concat("A"),
+                b : String <- p.concat("BB"),
+                c : String <- a.concat("C")
+            in {
+                show(p); show(a); show(b); show(c);
+                -- appending to the older one again
+                show(p.concat("Z"));
+                show(a);
+                show(b.concat(b));
+                show(b);
+            };
+
+            -- substrings of a string that keeps growing
+            let t : String <- "0123",
+                u : String <- t.substr(1, 2),
+                v : String
+            in {
+                t <- t.concat("4567");
+                v <- t.substr(2, 5);
+                t <- t.concat("89");
+                show(t); show(u); show(v);
+                show(u.concat(v));
+                show(v.concat(u));
+                show(t);
+            };
+
+            -- empty sides
+            let e : String, f : String <- "".concat("") in {
+                show(e.concat("q"));
+                show("q".concat(e));
+                show(f);
+                show(e.concat(f));
+                if e = f then out_string("empty =\n") else out_string("empty <>\n") fi;
+            };
+
+            -- equal contents built different ways
+            if "xy".concat("A") = "x".concat("yA") then out_string("=\n") else out_string("<>\n") fi;
+            if s.substr(0, 4) = "abab" then out_string("=\n") else out_string("<>\n") fi;
+            if s.substr(1, 4) < s.substr(0, 4) then out_string("<\n") else out_string(">=\n") fi;
+        }
+    };
+};
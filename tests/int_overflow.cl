@@ -0,0 +1,30 @@
+-- Ints are 32 bit: +, -, *, / and ~ wrap the same way, with or without -boxed.
+class Main inherits IO {
+    big : Int <- 2147483647;
+    min : Int <- 0 - big - 1;
+
+    show(x : Int) : Object { { out_int(x); out_string("\n"); } };
+
+    main() : Object {
+        {
+            show(big + 1);
+            show(min - 1);
+            show(big + big);
+            show(big * 2);
+            show(min * ~1);
+            show(~min);
+            show((big + 1) / 2);
+            -- folded at compile time
+            show(2147483647 + 1);
+            show(0 - 2147483647 - 2);
+
+            if big + 1 < 0 then out_string("wrapped\n") else out_string("not wrapped\n") fi;
+            if big + 1 = min then out_string("eq\n") else out_string("neq\n") fi;
+            if big + 1 = 0 - big - 1 then out_string("eq\n") else out_string("neq\n") fi;
+            if min - 1 = big then out_string("eq\n") else out_string("neq\n") fi;
+            -- 2^32 + 2 is 2
+            out_string("abc".substr(0, big + big + 4));
+            out_string("\n");
+        }
+    };
+};
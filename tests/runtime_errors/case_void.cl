@@ -0,0 +1,19 @@
+-- case on void inside a loop, after the first iterations printed.
+class A { };
+
+class Main inherits IO {
+    pick(i : Int) : A { if i < 3 then new A else let a : A in a fi };
+
+    main() : Object {
+        let i : Int <- 0 in
+            while i < 5 loop
+                {
+                    case pick(i) of
+                        a : A => out_string("A\n");
+                        o : Object => out_string("Object\n");
+                    esac;
+                    i <- i + 1;
+                }
+            pool
+    };
+};
@@ -0,0 +1,25 @@
+-- case without a matching branch: the value is a class none of the branches cover.
+class A { };
+class B inherits A { };
+class C { };
+
+class Main inherits IO {
+    name(o : Object) : String {
+        case o of
+            b : B => "B";
+            a : A => "A";
+            s : String => "String";
+            i : Int => "Int";
+        esac
+    };
+
+    main() : Object {
+        {
+            out_string(name(new A)); out_string("\n");
+            out_string(name(new B)); out_string("\n");
+            out_string(name(5)); out_string("\n");
+            out_string(name(new C)); out_string("\n");
+            out_string("not reached\n");
+        }
+    };
+};
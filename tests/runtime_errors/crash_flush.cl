@@ -0,0 +1,11 @@
+-- INT_MIN / ~1 traps (SIGFPE), what was printed before it still has to come out.
+class Main inherits IO {
+    main() : Object {
+        let min : Int <- 0 - 2147483647 - 1, i : Int <- 0 in
+        {
+            while i < 100 loop { out_int(i); out_string(" printed before the crash\n"); i <- i + 1; } pool;
+            out_int(min / ~1);
+            out_string("not reached\n");
+        }
+    };
+};
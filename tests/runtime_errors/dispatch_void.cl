@@ -0,0 +1,26 @@
+-- dispatch on void from a method a few calls deep, after some output.
+class Node {
+    next : Node;
+    value : Int;
+    init(v : Int, n : Node) : Node { { value <- v; next <- n; self; } };
+    next() : Node { next };
+    value() : Int { value };
+};
+
+class Main inherits IO {
+    walk(n : Node, steps : Int) : Int {
+        if steps = 0 then n.value()
+        else walk(n.next(), steps - 1)
+        fi
+    };
+
+    main() : Object {
+        let list : Node <- (new Node).init(1, (new Node).init(2, (new Node).init(3, new Node))) in
+        {
+            out_int(walk(list, 2)); out_string("\n");
+            out_int(walk(list, 3)); out_string("\n");
+            out_int(walk(list, 4)); out_string("\n");
+            out_string("not reached\n");
+        }
+    };
+};
@@ -0,0 +1,18 @@
+-- division by zero on a later line than the divisions that worked.
+class Main inherits IO {
+    d : Int <- 3;
+
+    main() : Object {
+        {
+            out_int(100 / d); out_string("\n");
+            d <- d - 3;
+            out_int(100 / (d + 1)); out_string("\n");
+            out_int(
+                100
+                /
+                d
+            );
+            out_string("not reached\n");
+        }
+    };
+};
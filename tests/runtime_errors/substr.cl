@@ -0,0 +1,14 @@
+-- substr out of range, after substrings right at the edges worked.
+class Main inherits IO {
+    s : String <- "hello world";
+
+    main() : Object {
+        {
+            out_string(s.substr(0, 11)); out_string("\n");
+            out_string(s.substr(11, 0)); out_string("|\n");
+            out_string(s.substr(6, 5)); out_string("\n");
+            out_string(s.substr(6, 6)); out_string("\n");
+            out_string("not reached\n");
+        }
+    };
+};
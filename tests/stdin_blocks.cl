@@ -0,0 +1,52 @@
+-- stdin is read 64k at a time: lines and numbers that cross a block boundary,
+-- a long line, and a last line without a newline before EOF.
+class Main inherits IO {
+    n : Int;
+    i : Int;
+    total : Int;
+
+    ends(s : String) : String {
+        if s.length() < 6 then s else s.substr(0, 3).concat("..").concat(s.substr(s.length() - 3, 3)) fi
+    };
+
+    main() : Object {
+        {
+            n <- in_int();
+            i <- 0;
+            while i < n loop
+                {
+                    let s : String <- in_string() in
+                        {
+                            total <- total + s.length();
+                            if i - i / 500 * 500 = 0 then
+                                { out_int(i); out_string(" "); out_int(s.length()); out_string(" "); out_string(ends(s)); out_string("\n"); }
+                            else 0 fi;
+                        };
+                    i <- i + 1;
+                }
+            pool;
+            out_string("total "); out_int(total); out_string("\n");
+
+            -- numbers: padding, signs, out of range, junk after the digits
+            n <- in_int();
+            i <- 0;
+            total <- 0;
+            while i < n loop
+                {
+                    total <- total + in_int();
+                    i <- i + 1;
+                }
+            pool;
+            out_string("sum "); out_int(total); out_string("\n");
+
+            let long : String <- in_string() in
+                { out_int(long.length()); out_string(" "); out_string(ends(long)); out_string("\n"); };
+            out_int(in_int()); out_string("\n");
+            -- the last line has no newline
+            out_string("[".concat(in_string()).concat("]\n"));
+            -- nothing left
+            out_string("[".concat(in_string()).concat("]\n"));
+            out_int(in_int()); out_string("\n");
+        }
+    };
+};
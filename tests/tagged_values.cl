@@ -0,0 +1,65 @@
+-- Int and Bool seen as Object: case, copy, type_name, isvoid, = and dispatch
+-- all have to work on the tagged words too.
+class Box {
+    v : Object;
+    set(x : Object) : SELF_TYPE { { v <- x; self; } };
+    get() : Object { v };
+};
+
+class Main inherits IO {
+    describe(o : Object) : String {
+        case o of
+            i : Int => "Int ".concat(if i < 0 then "negative" else if i = 0 then "zero" else "positive" fi fi);
+            b : Bool => if b then "Bool true" else "Bool false" fi;
+            s : String => "String ".concat(s);
+            x : Object => "Object ".concat(x.type_name());
+        esac
+    };
+
+    same(a : Object, b : Object) : Object {
+        out_string(if a = b then "=" else "<>" fi)
+    };
+
+    main() : Object {
+        let objects : Box <- new Box,
+            i : Object <- 7,
+            j : Object <- 3 + 4,
+            k : Object <- ~7,
+            t : Object <- true,
+            f : Object <- not true,
+            z : Object <- new Int,
+            nb : Object <- new Bool,
+            b : Box <- new Box
+        in {
+            out_string(describe(i)); out_string("\n");
+            out_string(describe(k)); out_string("\n");
+            out_string(describe(z)); out_string("\n");
+            out_string(describe(t)); out_string("\n");
+            out_string(describe(f)); out_string("\n");
+            out_string(describe(nb)); out_string("\n");
+            out_string(describe("s")); out_string("\n");
+            out_string(describe(b)); out_string("\n");
+            out_string(describe(b.set(5).get())); out_string("\n");
+            out_string(describe(b.set(false).get())); out_string("\n");
+
+            out_string(i.type_name()); out_string(" ");
+            out_string(t.type_name()); out_string(" ");
+            out_string((i.copy()).type_name()); out_string(" ");
+            out_string((5).type_name().concat((true).type_name())); out_string("\n");
+
+            -- copy of an Int or Bool is the same value
+            same(i, i.copy()); same(t, t.copy()); same(i.copy(), j); same(b, b.copy()); out_string("\n");
+            -- Int = Int by value, never equal across types
+            same(i, j); same(i, k); same(z, 0); same(nb, false); same(f, nb); same(t, f); out_string("\n");
+            same(i, t); same(z, nb); same(1, true); same(0, false); same(b, b); same(b, new Box); out_string("\n");
+
+            if isvoid i then out_string("void") else out_string("not void") fi;
+            if isvoid z then out_string(" void") else out_string(" not void") fi;
+            if isvoid nb then out_string(" void\n") else out_string(" not void\n") fi;
+
+            case b.set(i).get() of o : Object => out_string(describe(o.copy())); esac;
+            out_string("\n");
+            out_int(case j of n : Int => n * 6; o : Object => 0; esac); out_string("\n");
+        }
+    };
+};
@@ -0,0 +1,57 @@
+-- tail calls reuse the caller's argument slots (and registers): deep self and mutual
+-- recursion, arguments that swap or read each other, more arguments than registers,
+-- calls into other classes and overridden methods, tail calls under if, let and case.
+class Counter {
+    count(n : Int, acc : Int) : Int {
+        if n = 0 then acc else count(n - 1, acc + 1) fi
+    };
+};
+
+class SlowCounter inherits Counter {
+    count(n : Int, acc : Int) : Int {
+        if n = 0 then acc else self@Counter.count(n - 1, acc + 2) fi
+    };
+};
+
+class Main inherits IO {
+    even(n : Int) : Bool { if n = 0 then true else odd(n - 1) fi };
+    odd(n : Int) : Bool { if n = 0 then false else even(n - 1) fi };
+
+    -- a and b trade places every call
+    swap(n : Int, a : Int, b : Int) : Int {
+        if n = 0 then a * 1000 + b else swap(n - 1, b, a) fi
+    };
+
+    -- every argument is computed from the others
+    mix(n : Int, a : Int, b : Int, c : Int, d : Int, e : Int, f : Int, g : Int) : Int {
+        if n = 0 then a + b + c + d + e + f + g
+        else mix(n - 1, g, a + 1, b, c + a, d, e - 1, f)
+        fi
+    };
+
+    -- fewer arguments than the caller, then more
+    down(n : Int, x : Int, y : Int, z : Int) : Int { if n = 0 then x + y + z else up(n - 1, x + y + z) fi };
+    up(n : Int, s : Int) : Int { if n = 0 then s else down(n - 1, s, 1, 2) - 0 + tail(n, s) fi };
+    tail(n : Int, s : Int) : Int { let t : Int <- s + n in case t of i : Int => i; o : Object => 0; esac };
+
+    sum(n : Int, acc : Int) : Int {
+        let m : Int <- n - 1 in
+            if n = 0 then acc else sum(m, acc + n) fi
+    };
+
+    show(x : Int) : Object { { out_int(x); out_string("\n"); } };
+
+    main() : Object {
+        {
+            show((new Counter).count(20000, 0));
+            show((new SlowCounter).count(20000, 0));
+            if even(20000) then out_string("even\n") else out_string("odd\n") fi;
+            if odd(19999) then out_string("odd\n") else out_string("even\n") fi;
+            show(swap(7, 1, 2));
+            show(swap(8, 1, 2));
+            show(mix(1001, 1, 2, 3, 4, 5, 6, 7));
+            show(up(10, 1));
+            show(sum(20000, 0));
+        }
+    };
+};
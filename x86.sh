@@ -1,8 +1,8 @@
 # compile .cl file into .s, and run it 
 
 cool --type "$1"
-python3 ./src/main.py "$1-type" $2 $3
+python3 ./src/main.py "$1-type" -extern-runtime $2 $3
 
 newname="${1%.cl}.s"
-gcc -no-pie -static $newname 
+gcc -no-pie -static $newname $(python3 ./src/main.py -print-runtime $2 $3)
 ./a.out
\ No newline at end of file